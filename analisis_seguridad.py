@@ -2,85 +2,3143 @@
 Script de Análisis de Seguridad - Escenario 4
 Utiliza Bandit para análisis estático de vulnerabilidades en código Python
 """
-import subprocess
+import argparse
+import array
+import ast
+import collections
+import contextlib
+import fnmatch
+import functools
+import glob
+import hashlib
+import html
+import io
 import json
+import mmap
 import os
-from datetime import datetime
+import struct
+import time
+import zlib
+from datetime import datetime, timezone
 import sys
 
 
-class AnalizadorSeguridad:
+MOTORES = ('subproceso', 'inproceso')
+
+# Líneas de código de cada hallazgo (opción -n de Bandit); ambos motores
+# usan el mismo valor para que los reportes no dependan del motor
+LINEAS_CODIGO = 3
+
+# Opciones de Bandit que cambian los hallazgos: archivo de configuración
+# (-c), perfil (-p) y severidad y confianza mínimas de lo que se reporta
+OPCIONES_BANDIT = {'config': None, 'perfil': None,
+                   'severidad': 'LOW', 'confianza': 'LOW'}
+
+# Configuraciones de Bandit del motor en proceso, por archivo de configuración;
+# cada una se carga una sola vez por intérprete (o por worker del pool)
+_configs_bandit = {}
+
+
+def ruta_reporte_json(archivo):
+    """
+    Ruta del reporte JSON intermedio de un archivo
+    """
+    return f'{archivo}_bandit_report.json'
+
+
+def ruta_reporte_binario(archivo):
+    """
+    Ruta del reporte binario comprimido (ver escribir_reporte_binario)
+    """
+    return f'{archivo}_bandit_report.rsb'
+
+
+@contextlib.contextmanager
+def _medir(eventos, nombre):
+    """
+    Agrega a `eventos` (nombre, inicio, duración, cpu) del bloque; no hace
+    nada si `eventos` es None
+    """
+    if eventos is None:
+        yield
+        return
+    inicio = time.perf_counter()
+    inicio_cpu = time.process_time()
+    try:
+        yield
+    finally:
+        eventos.append((nombre, inicio, time.perf_counter() - inicio,
+                        time.process_time() - inicio_cpu))
+
+
+# Los reportes JSON más grandes que esto se leen como flujo en lugar de con json.load
+UMBRAL_JSON_FLUJO = 8 * 1024 * 1024
+
+_decodificador_json = json.JSONDecoder()
+
+# Caracteres con los que puede seguir un número JSON
+_CONTINUACION_NUMERO = frozenset('0123456789.eE+-')
+
+
+class _LectorJSON:
+    """
+    Buffer sobre un archivo de texto para decodificar valores JSON de uno en
+    uno con raw_decode, leyendo del disco solo lo necesario
+    """
+
+    def __init__(self, f, bloque=1 << 16):
+        self.f = f
+        self.bloque = bloque
+        self.buffer = ''
+        self.pos = 0
+        self.fin = False
+
+    def _rellenar(self, tamano):
+        datos = self.f.read(tamano)
+        if not datos:
+            self.fin = True
+            return False
+        self.buffer = self.buffer[self.pos:] + datos
+        self.pos = 0
+        return True
+
+    def caracter(self):
+        """
+        Siguiente carácter que no es espacio, sin consumirlo ('' al final)
+        """
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in ' \t\n\r':
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._rellenar(self.bloque):
+                return ''
+
+    def consumir(self, esperado):
+        encontrado = self.caracter()
+        if encontrado != esperado:
+            raise ValueError(f"JSON inválido: se esperaba {esperado!r} "
+                             f"y se encontró {encontrado!r}")
+        self.pos += 1
+
+    def valor(self):
+        self.caracter()
+        tamano = self.bloque
+        while True:
+            try:
+                valor, fin = _decodificador_json.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                valor, fin = None, None
+            # Un número al final del buffer puede estar cortado, también en
+            # medio de la fracción o el exponente ("1" de "1.5e10")
+            if fin is not None and (self.fin or (
+                    fin < len(self.buffer) and not (
+                        isinstance(valor, (int, float)) and not isinstance(valor, bool)
+                        and self.buffer[fin] in _CONTINUACION_NUMERO))):
+                self.pos = fin
+                return valor
+            if not self._rellenar(tamano):
+                if fin is not None:
+                    self.pos = fin
+                    return valor
+                raise ValueError("JSON inválido o truncado")
+            # Un valor que no cabe se reintenta con lecturas cada vez mayores
+            tamano *= 2
+
+
+def _campos_reporte_json(lector):
+    """
+    Recorre con `lector` un objeto JSON de reporte y genera (clave, valor)
+    de cada campo; los hallazgos de 'results' salen de a uno, como
+    ('results', hallazgo), sin armar la lista completa
+    """
+    lector.consumir('{')
+    if lector.caracter() == '}':
+        lector.pos += 1
+        return
+    while True:
+        clave = lector.valor()
+        lector.consumir(':')
+        if clave == 'results' and lector.caracter() == '[':
+            lector.consumir('[')
+            if lector.caracter() == ']':
+                lector.pos += 1
+            else:
+                while True:
+                    yield clave, lector.valor()
+                    if lector.caracter() != ',':
+                        lector.consumir(']')
+                        break
+                    lector.pos += 1
+        else:
+            yield clave, lector.valor()
+        if lector.caracter() != ',':
+            lector.consumir('}')
+            return
+        lector.pos += 1
+
+
+def cargar_reporte_json(ruta):
+    """
+    Lee un reporte JSON de Bandit. Los archivos grandes se decodifican como
+    flujo, hallazgo por hallazgo, sin cargar antes todo el texto en memoria.
+    """
+    if os.path.getsize(ruta) < UMBRAL_JSON_FLUJO:
+        with open(ruta, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    reporte = {'results': []}
+    with open(ruta, 'r', encoding='utf-8') as f:
+        for clave, valor in _campos_reporte_json(_LectorJSON(f)):
+            if clave == 'results':
+                reporte['results'].append(valor)
+            else:
+                reporte[clave] = valor
+    return reporte
+
+
+def rss_actual():
+    """
+    Memoria residente del proceso en bytes (0 si no se puede medir)
+    """
+    try:
+        with open('/proc/self/statm', 'rb') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError, AttributeError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        return 0
+    # Sin /proc solo está disponible el máximo; en macOS viene en bytes
+    maximo = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maximo if sys.platform == 'darwin' else maximo * 1024
+
+
+def ejecutar_bandit(archivo, motor='subproceso', guardar_json=True, medir=False,
+                    reglas=False, opciones=None, derivar=None):
+    """
+    Ejecuta Bandit sobre un archivo y devuelve un diccionario con el
+    reporte o con el motivo del error.
+
+    Está a nivel de módulo para que el pool de procesos pueda enviarla
+    a los workers; no imprime nada, eso lo hace el proceso principal.
+    Con `medir` la salida incluye los tiempos de cada fase ('eventos') y,
+    con el motor en proceso, los de cada test de Bandit ('reglas').
+    Con `reglas` también se ejecutan las reglas propias de MotorReglas, que
+    parsean el archivo por su cuenta: Bandit no ofrece cómo pasarle un árbol.
+    `opciones` sigue la forma de OPCIONES_BANDIT y vale para ambos motores.
+    Con `derivar` (un directorio) el reporte completo se escribe ahí y la
+    salida solo lleva el reporte sin hallazgos y su ubicación ('derivado'),
+    para no pasar todos los hallazgos por el pipe del pool.
+    """
+    opciones = dict(OPCIONES_BANDIT, **(opciones or {}))
+    salida = {'archivo': archivo, 'reporte': None,
+              'error': None, 'stdout': '', 'stderr': '',
+              'pid': os.getpid(), 'eventos': [] if medir else None, 'reglas': {}}
+
+    # Verificar que el archivo existe
+    if not os.path.exists(archivo):
+        salida['error'] = 'no_existe'
+        return salida
+
+    fuente = arbol = None
+    hallazgos_propios = []
+    if reglas:
+        with _medir(salida['eventos'], 'reglas_propias'):
+            with open(archivo, 'rb') as f:
+                fuente = f.read()
+            try:
+                arbol = ast.parse(fuente, filename=archivo)
+            except (SyntaxError, ValueError):
+                arbol = None
+            if arbol is not None:
+                hallazgos_propios = MOTOR_REGLAS.analizar(
+                    arbol, archivo, fuente,
+                    salida['reglas'] if medir else None)
+
+    if motor == 'inproceso':
+        _ejecutar_bandit_inproceso(archivo, salida, opciones)
+    else:
+        _ejecutar_bandit_subproceso(archivo, salida, guardar_json, opciones)
+
+    if salida['reporte'] is not None and hallazgos_propios:
+        _agregar_hallazgos(salida['reporte'], archivo, hallazgos_propios)
+
+    if salida['reporte'] is not None:
+        with _medir(salida['eventos'], 'funciones'):
+            _anotar_funciones(salida['reporte'], archivo, fuente, arbol)
+
+    # El JSON que escribe la CLI de Bandit no trae las funciones anotadas
+    if salida['reporte'] is not None and guardar_json and (
+            motor == 'inproceso' or salida['reporte'].get('results')):
+        with _medir(salida['eventos'], 'escritura_json'):
+            with open(ruta_reporte_json(archivo), 'w', encoding='utf-8') as f:
+                json.dump(salida['reporte'], f, indent=2)
+
+    if salida['reporte'] is not None and derivar is not None:
+        with _medir(salida['eventos'], 'derivacion'):
+            _derivar_reporte(salida, derivar)
+
+    return salida
+
+
+def _derivar_reporte(salida, directorio):
+    """
+    Agrega el reporte completo como una línea JSON al archivo de este
+    worker en `directorio` y lo reemplaza en la salida por su versión sin
+    hallazgos, con (ruta, posición, cantidad de hallazgos) en 'derivado'
+    """
+    reporte = salida['reporte']
+    ruta = os.path.join(directorio, f'{os.getpid()}.jsonl')
+    with open(ruta, 'ab') as f:
+        posicion = f.tell()
+        f.write(json.dumps(reporte).encode('utf-8') + b'\n')
+    salida['derivado'] = (ruta, posicion, len(reporte.get('results', [])))
+    salida['reporte'] = {clave: valor for clave, valor in reporte.items()
+                         if clave != 'results'}
+
+
+def _ejecutar_bandit_subproceso(archivo, salida, guardar_json, opciones):
+    """
+    Ejecuta Bandit con `python -m bandit` en un intérprete nuevo
+    """
+    import subprocess
+    # Ejecutar Bandit con formato JSON como módulo de Python. Sin -o el
+    # reporte sale por stdout y no se escribe ningún archivo intermedio
+    cmd = [sys.executable, '-m', 'bandit', '-f', 'json', '-n', str(LINEAS_CODIGO)]
+    if opciones['config']:
+        cmd += ['-c', opciones['config']]
+    if opciones['perfil']:
+        cmd += ['-p', opciones['perfil']]
+    # LOW es lo que la CLI reporta por defecto
+    if opciones['severidad'] != 'LOW':
+        cmd += ['--severity-level', opciones['severidad'].lower()]
+    if opciones['confianza'] != 'LOW':
+        cmd += ['--confidence-level', opciones['confianza'].lower()]
+    if guardar_json:
+        cmd += ['-o', ruta_reporte_json(archivo)]
+    cmd.append(archivo)
+
+    # Incluye el arranque del intérprete, la importación de Bandit y el
+    # análisis: desde fuera del proceso no se pueden separar
+    with _medir(salida['eventos'], 'subproceso'):
+        resultado = subprocess.run(
+            cmd,
+            capture_output=True,
+            text=True
+        )
+    salida['stdout'] = resultado.stdout
+    salida['stderr'] = resultado.stderr
+
+    # Verificar si hubo un error al ejecutar
+    if resultado.returncode == 1:
+        # Código 1 de Bandit significa que encontró problemas (es normal)
+        pass
+    elif "No module named" in resultado.stderr or "No module named" in resultado.stdout:
+        salida['error'] = 'sin_bandit'
+        return
+
+    with _medir(salida['eventos'], 'carga_json'):
+        if not guardar_json:
+            try:
+                salida['reporte'] = json.loads(resultado.stdout)
+            except ValueError:
+                salida['error'] = 'sin_reporte'
+            return
+
+        # Leer el reporte JSON
+        if not os.path.exists(ruta_reporte_json(archivo)):
+            salida['error'] = 'sin_reporte'
+            return
+
+        salida['reporte'] = cargar_reporte_json(ruta_reporte_json(archivo))
+
+
+def _cronometrar_test(test, reglas):
+    """
+    Envuelve un test de Bandit para acumular en `reglas[test_id]` su
+    tiempo de pared, de CPU y el número de llamadas
+    """
+    test_id = getattr(test, '_test_id', test.__name__)
+
+    # functools.wraps copia __name__ y los atributos (_test_id, _config...)
+    # que el tester de Bandit consulta en cada test
+    @functools.wraps(test)
+    def envoltura(*args, **kwargs):
+        inicio = time.perf_counter()
+        inicio_cpu = time.process_time()
+        try:
+            return test(*args, **kwargs)
+        finally:
+            acumulado = reglas.setdefault(test_id, [0.0, 0.0, 0])
+            acumulado[0] += time.perf_counter() - inicio
+            acumulado[1] += time.process_time() - inicio_cpu
+            acumulado[2] += 1
+
+    return envoltura
+
+
+def _perfil_bandit(config, nombre):
+    """
+    Perfil de tests a ejecutar, armado igual que en la CLI de Bandit: el
+    perfil `nombre` de la configuración o sus listas tests y skips
+    """
+    if nombre:
+        perfil = (config.get_option('profiles') or {}).get(nombre)
+        if perfil is None:
+            raise ValueError(f"el perfil {nombre!r} no existe en la configuración de Bandit")
+        return {'include': set(perfil.get('include') or []),
+                'exclude': set(perfil.get('exclude') or [])}
+    return {'include': set(config.get_option('tests') or []),
+            'exclude': set(config.get_option('skips') or [])}
+
+
+def _ejecutar_bandit_inproceso(archivo, salida, opciones):
+    """
+    Ejecuta Bandit con su API de manager dentro del intérprete actual.
+
+    Bandit y sus plugins se importan una sola vez y el reporte se arma
+    directamente como objetos de Python, con la misma forma que produce
+    el formateador JSON de Bandit.
+    """
+    eventos = salida['eventos']
+    try:
+        with _medir(eventos, 'importacion_bandit'):
+            from bandit.core import config as b_config
+            from bandit.core import docs_utils
+            from bandit.core import extension_loader
+            from bandit.core import manager as b_manager
+            from bandit.core import utils as b_utils
+    except ImportError:
+        salida['error'] = 'sin_bandit'
+        return
+
+    try:
+        # Si el archivo de configuración cambia se vuelve a cargar
+        clave_config = opciones['config'] and (
+            opciones['config'], os.stat(opciones['config']).st_mtime_ns)
+        config = _configs_bandit.get(clave_config)
+        if config is None:
+            with _medir(eventos, 'configuracion_bandit'):
+                config = _configs_bandit[clave_config] = b_config.BanditConfig(
+                    config_file=opciones['config'])
+        perfil = _perfil_bandit(config, opciones['perfil'])
+        extension_loader.MANAGER.validate_profile(perfil)
+    except (b_utils.ConfigError, ValueError, OSError) as e:
+        salida['error'] = 'sin_reporte'
+        salida['stderr'] = str(e)
+        return
+
+    b_mgr = b_manager.BanditManager(config, 'file', profile=perfil)
+    if eventos is not None:
+        pruebas = getattr(getattr(b_mgr, 'b_ts', None), 'tests', None)
+        if isinstance(pruebas, dict):
+            for tipo, lista in pruebas.items():
+                pruebas[tipo] = [_cronometrar_test(t, salida['reglas']) for t in lista]
+
+    with _medir(eventos, 'ast_y_tests'):
+        b_mgr.discover_files([archivo])
+        b_mgr.run_tests()
+
+    with _medir(eventos, 'armado_reporte'):
+        resultados = []
+        for issue in b_mgr.get_issue_list(sev_level=opciones['severidad'],
+                                          conf_level=opciones['confianza']):
+            # Mismo rango de líneas que el formateador JSON de la CLI con -n
+            hallazgo = issue.as_dict(max_lines=LINEAS_CODIGO)
+            hallazgo['more_info'] = docs_utils.get_url(hallazgo['test_id'])
+            resultados.append(hallazgo)
+
+        salida['reporte'] = {
+            'errors': [{'filename': nombre, 'reason': motivo}
+                       for nombre, motivo in b_mgr.get_skipped()],
+            'generated_at': datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ'),
+            'metrics': b_mgr.metrics.data,
+            'results': sorted(resultados, key=lambda r: r['filename'])
+        }
+
+
+def _es_texto_formateado(nodo):
+    """
+    True si el nodo construye un string interpolando valores: f-string,
+    operador % o + sobre strings, o una llamada a .format()
+    """
+    if isinstance(nodo, ast.JoinedStr):
+        return any(isinstance(v, ast.FormattedValue) for v in nodo.values)
+    if isinstance(nodo, ast.BinOp) and isinstance(nodo.op, (ast.Mod, ast.Add)):
+        return any(isinstance(lado, (ast.Constant, ast.JoinedStr))
+                   and isinstance(getattr(lado, 'value', ''), str)
+                   for lado in (nodo.left, nodo.right))
+    if (isinstance(nodo, ast.Call) and isinstance(nodo.func, ast.Attribute)
+            and nodo.func.attr == 'format'):
+        return isinstance(nodo.func.value, (ast.Constant, ast.JoinedStr))
+    return False
+
+
+def _nombre_llamada(nodo):
+    """
+    Nombre de la función llamada: 'execute' tanto para execute(...) como
+    para cursor.execute(...)
+    """
+    if isinstance(nodo.func, ast.Name):
+        return nodo.func.id
+    if isinstance(nodo.func, ast.Attribute):
+        return nodo.func.attr
+    return ''
+
+
+class ContextoReglas:
+    """
+    Estado compartido por todas las reglas durante el recorrido de un
+    archivo: la fuente y las variables de cada ámbito a las que se asignó
+    un string formateado
+    """
+
+    def __init__(self, archivo, lineas):
+        self.archivo = archivo
+        self.lineas = lineas
+        self._ambitos = [set()]
+
+    def entrar_ambito(self):
+        self._ambitos.append(set())
+
+    def salir_ambito(self):
+        self._ambitos.pop()
+
+    def registrar_asignacion(self, nodo):
+        formateado = _es_texto_formateado(nodo.value)
+        for destino in nodo.targets:
+            if isinstance(destino, ast.Name):
+                if formateado:
+                    self._ambitos[-1].add(destino.id)
+                else:
+                    self._ambitos[-1].discard(destino.id)
+
+    def es_formateado(self, nodo):
+        """
+        Devuelve 'directo' si el nodo es un string formateado, 'variable' si
+        es una variable del ámbito actual que recibió uno, o None
+        """
+        if _es_texto_formateado(nodo):
+            return 'directo'
+        if isinstance(nodo, ast.Name) and nodo.id in self._ambitos[-1]:
+            return 'variable'
+        return None
+
+
+def regla(test_id, tipos, severidad, cwe, texto):
+    """
+    Decorador que registra una regla propia para los tipos de nodo del AST
+    indicados por nombre ('Call', 'Assign', ...). La función recibe (nodo, contexto) y devuelve la confianza
+    del hallazgo ('HIGH', 'MEDIUM', 'LOW') o None si no aplica.
+    """
+    def decorador(funcion):
+        funcion.test_id = test_id
+        funcion.tipos = tipos
+        funcion.severidad = severidad
+        funcion.cwe = cwe
+        funcion.texto = texto
+        REGLAS_PROPIAS.append(funcion)
+        return funcion
+    return decorador
+
+
+REGLAS_PROPIAS = []
+
+
+@regla('FLK001', ('Call',), 'HIGH', 1336,
+       'render_template_string recibe un template construido con datos '
+       'interpolados; posible Server-Side Template Injection. Pasa los valores '
+       'como contexto del template.')
+def ssti_render_template_string(nodo, contexto):
+    if _nombre_llamada(nodo) != 'render_template_string' or not nodo.args:
+        return None
+    origen = contexto.es_formateado(nodo.args[0])
+    return {'directo': 'HIGH', 'variable': 'MEDIUM'}.get(origen)
+
+
+@regla('FLK002', ('Call',), 'MEDIUM', 89,
+       'Consulta SQL construida con datos interpolados y pasada a execute(); '
+       'posible SQL Injection. Usa parámetros (?) en su lugar.')
+def sql_formateado_en_execute(nodo, contexto):
+    if _nombre_llamada(nodo) not in ('execute', 'executemany', 'executescript'):
+        return None
+    if not nodo.args:
+        return None
+    origen = contexto.es_formateado(nodo.args[0])
+    return {'directo': 'HIGH', 'variable': 'MEDIUM'}.get(origen)
+
+
+@regla('FLK003', ('Call',), 'MEDIUM', 79,
+       'Markup() marca como seguro un string con datos interpolados; '
+       'posible Cross-Site Scripting. Usa Markup.format() o escape().')
+def markup_formateado(nodo, contexto):
+    if _nombre_llamada(nodo) != 'Markup' or not nodo.args:
+        return None
+    origen = contexto.es_formateado(nodo.args[0])
+    return {'directo': 'HIGH', 'variable': 'MEDIUM'}.get(origen)
+
+
+class MotorReglas:
+    """
+    Ejecuta todas las reglas propias en un único recorrido del AST.
+
+    Las reglas se agrupan en una tabla de despacho por tipo de nodo, así
+    que cada nodo solo se evalúa contra las reglas que lo examinan y
+    agregar reglas no agrega recorridos ni parseos.
+    """
+
+    def __init__(self, reglas=None):
+        self.reglas = list(REGLAS_PROPIAS if reglas is None else reglas)
+        self._despacho = {}
+        for r in self.reglas:
+            for tipo in r.tipos:
+                self._despacho.setdefault(tipo, []).append(r)
+
+    def analizar(self, arbol, archivo, fuente, tiempos=None):
+        """
+        Devuelve los hallazgos de las reglas sobre `arbol`, con la misma forma
+        que los resultados de Bandit. Si se pasa `tiempos` acumula en él el
+        tiempo de cada regla como en la instrumentación de Bandit.
+        """
+        if isinstance(fuente, bytes):
+            fuente = fuente.decode('utf-8', errors='replace')
+        contexto = ContextoReglas(archivo, fuente.splitlines())
+        hallazgos = []
+        despacho = self._despacho
+        ambitos = (ast.FunctionDef, ast.AsyncFunctionDef, ast.Lambda)
+
+        # Pila explícita: (nodo, True) marca la salida de un ámbito
+        pila = [(arbol, False)]
+        while pila:
+            nodo, salida_ambito = pila.pop()
+            if salida_ambito:
+                contexto.salir_ambito()
+                continue
+
+            if isinstance(nodo, ast.Assign):
+                contexto.registrar_asignacion(nodo)
+            for r in despacho.get(type(nodo).__name__, ()):
+                inicio = time.perf_counter() if tiempos is not None else 0
+                confianza = r(nodo, contexto)
+                if tiempos is not None:
+                    acumulado = tiempos.setdefault(r.test_id, [0.0, 0.0, 0])
+                    acumulado[0] += time.perf_counter() - inicio
+                    acumulado[2] += 1
+                if confianza:
+                    hallazgos.append(self._hallazgo(r, nodo, confianza, contexto))
+
+            hijos = list(ast.iter_child_nodes(nodo))
+            if isinstance(nodo, ambitos):
+                contexto.entrar_ambito()
+                pila.append((nodo, True))
+            # Al revés para visitar los hijos en orden de aparición
+            pila.extend((hijo, False) for hijo in reversed(hijos))
+
+        return hallazgos
+
+    def _hallazgo(self, r, nodo, confianza, contexto):
+        linea = nodo.lineno
+        fin = getattr(nodo, 'end_lineno', None) or linea
+        codigo = ''.join(
+            f'{n} {contexto.lineas[n - 1]}\n'
+            for n in range(max(1, linea - 1), min(len(contexto.lineas), fin + 1) + 1))
+        return {
+            'code': codigo,
+            'col_offset': nodo.col_offset,
+            'end_col_offset': getattr(nodo, 'end_col_offset', None),
+            'filename': contexto.archivo,
+            'issue_confidence': confianza,
+            'issue_cwe': {'id': r.cwe,
+                          'link': f'https://cwe.mitre.org/data/definitions/{r.cwe}.html'},
+            'issue_severity': r.severidad,
+            'issue_text': r.texto,
+            'line_number': linea,
+            'line_range': list(range(linea, fin + 1)),
+            'more_info': '',
+            'test_id': r.test_id,
+            'test_name': r.__name__,
+        }
+
+
+MOTOR_REGLAS = MotorReglas()
+
+
+def _agregar_hallazgos(reporte, archivo, hallazgos):
+    """
+    Agrega hallazgos de las reglas propias a un reporte de Bandit y
+    actualiza sus contadores por severidad y confianza
+    """
+    reporte.setdefault('results', []).extend(hallazgos)
+    reporte['results'].sort(key=lambda r: (r.get('filename', ''),
+                                           r.get('line_number') or 0))
+    metricas = reporte.setdefault('metrics', {})
+    for nombre in (archivo, '_totals'):
+        bloque = metricas.get(nombre)
+        if bloque is None:
+            continue
+        for issue in hallazgos:
+            for clave in (f"SEVERITY.{issue['issue_severity']}",
+                          f"CONFIDENCE.{issue['issue_confidence']}"):
+                if clave in bloque:
+                    bloque[clave] += 1
+
+
+def combinar_reportes(reportes):
+    """
+    Une varios reportes de Bandit (uno por archivo) en un único reporte
+    con la misma forma que el JSON de Bandit
+    """
+    combinado = {
+        'errors': [],
+        'generated_at': datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ'),
+        'metrics': {'_totals': {}},
+        'results': []
+    }
+    totales = combinado['metrics']['_totals']
+
+    for reporte in reportes:
+        if not reporte:
+            continue
+        combinado['errors'].extend(reporte.get('errors', []))
+        combinado['results'].extend(reporte.get('results', []))
+        for nombre, valores in reporte.get('metrics', {}).items():
+            if nombre != '_totals':
+                combinado['metrics'][nombre] = valores
+                continue
+            for clave, valor in valores.items():
+                totales[clave] = totales.get(clave, 0) + valor
+
+    return combinado
+
+
+# Directorios que nunca se recorren al descubrir archivos
+DIRECTORIOS_EXCLUIDOS = {
+    '.git', '.hg', '.svn', '__pycache__', 'venv', '.venv', 'env',
+    '.tox', '.nox', '.eggs', 'build', 'dist', 'node_modules',
+    '.mypy_cache', '.pytest_cache', '.ruff_cache', '.cache_seguridad',
+}
+
+# Archivos generados por herramientas, que no tiene sentido analizar. Los
+# nombres se omiten siempre; las marcas en la cabecera solo con
+# omitir_generados, porque un comentario así no garantiza que el archivo
+# sea irrelevante para la seguridad
+PATRONES_GENERADOS = ('*_pb2.py', '*_pb2_grpc.py', '*_rc.py')
+MARCAS_GENERADO = (b'@generated', b'DO NOT EDIT', b'Generated by')
+
+
+def _es_generado(ruta, por_contenido=False):
+    if any(fnmatch.fnmatch(os.path.basename(ruta), p) for p in PATRONES_GENERADOS):
+        return True
+    if not por_contenido:
+        return False
+    try:
+        with open(ruta, 'rb') as f:
+            cabecera = f.read(512)
+    except OSError:
+        return False
+    return any(marca in cabecera for marca in MARCAS_GENERADO)
+
+
+def _excluido(ruta, excluir, raiz=''):
+    """
+    True si `ruta` está bajo un directorio excluido o coincide con un patrón
+    de `excluir`. Solo se miran los directorios por debajo de `raiz` (el
+    objetivo que se está recorriendo), así que analizar /home/u/env/proyecto
+    o pedir build/ explícitamente no excluye todo. Los patrones se comparan
+    con la ruta tal cual, con la ruta relativa a `raiz` (así `scan src/
+    --excluir "tests/*"` salta src/tests) y con cada componente
+    """
+    partes = os.path.normpath(ruta).split(os.sep)
+    rutas = [ruta]
+    if raiz:
+        relativa = os.path.relpath(ruta, raiz)
+        if relativa != os.pardir and not relativa.startswith(os.pardir + os.sep):
+            partes = relativa.split(os.sep)
+            rutas.append(relativa)
+    for parte in partes[:-1]:
+        if parte in DIRECTORIOS_EXCLUIDOS or parte.endswith('.egg-info'):
+            return True
+    return any(fnmatch.fnmatch(candidata, p)
+               for p in excluir for candidata in rutas + partes)
+
+
+def _raiz_glob(patron):
+    """
+    Parte fija de un patrón glob: los directorios antes del primer comodín
+    """
+    fijas = []
+    for parte in os.path.normpath(patron).split(os.sep):
+        if glob.has_magic(parte):
+            break
+        fijas.append(parte)
+    return os.sep.join(fijas)
+
+
+def _recorrer_directorio(directorio, excluir):
+    for raiz, dirs, nombres in os.walk(directorio):
+        # Podar en el sitio los directorios excluidos y los entornos
+        # virtuales; un patrón como "tests/*" poda tests/ porque coincide
+        # con su ruta relativa seguida de la barra
+        relativa = os.path.relpath(raiz, directorio)
+        dirs[:] = sorted(
+            d for d in dirs
+            if d not in DIRECTORIOS_EXCLUIDOS
+            and not d.endswith('.egg-info')
+            and not any(fnmatch.fnmatch(d, p)
+                        or fnmatch.fnmatch(os.path.normpath(os.path.join(relativa, d)) + os.sep, p)
+                        for p in excluir)
+            and not os.path.exists(os.path.join(raiz, d, 'pyvenv.cfg')))
+        for nombre in sorted(nombres):
+            if nombre.endswith('.py'):
+                yield os.path.join(raiz, nombre)
+
+
+def archivos_cambiados_git(referencia):
+    """
+    Archivos .py modificados, añadidos o sin seguimiento desde `referencia`,
+    con rutas relativas al directorio actual
+    """
+    import subprocess
+    try:
+        raiz = subprocess.run(['git', 'rev-parse', '--show-toplevel'],
+                              capture_output=True, text=True, check=True).stdout.strip()
+        diff = subprocess.run(['git', 'diff', '--name-only', '--diff-filter=d',
+                               referencia, '--'],
+                              capture_output=True, text=True, check=True).stdout
+        nuevos = subprocess.run(['git', 'ls-files', '--others', '--exclude-standard',
+                                 '--full-name'],
+                                capture_output=True, text=True, check=True).stdout
+    except (OSError, subprocess.CalledProcessError) as e:
+        detalle = getattr(e, 'stderr', '') or str(e)
+        print(f"❌ Error: No se pudo obtener el diff de git desde {referencia}: "
+              f"{detalle.strip()}")
+        return []
+
+    cambiados = []
+    for linea in (diff + nuevos).splitlines():
+        if linea.endswith('.py'):
+            ruta = os.path.relpath(os.path.join(raiz, linea))
+            if ruta not in cambiados and os.path.exists(ruta):
+                cambiados.append(ruta)
+    return cambiados
+
+
+def descubrir_archivos(objetivos, excluir=(), desde_ref=None,
+                       omitir_generados=False, omitidos=None):
+    """
+    Genera los archivos .py a analizar a partir de archivos, directorios
+    (recursivos) y patrones glob, a medida que los va encontrando.
+
+    Dentro de cada objetivo se saltan .git, entornos virtuales, directorios
+    de build y archivos generados (por nombre, y por su cabecera con
+    `omitir_generados`), además de los patrones de `excluir`. Los generados
+    que se saltan se agregan a la lista `omitidos`, si se pasa. Con
+    `desde_ref` solo se devuelven los archivos que cambiaron desde esa
+    referencia de git (y que estén dentro de los objetivos, si se
+    indicaron), sin recorrer el árbol.
+    """
+    objetivos = list(objetivos) or ['.']
+    vistos = set()
+
+    def nuevo(ruta, raiz):
+        ruta = os.path.normpath(ruta)
+        if ruta in vistos or _excluido(ruta, excluir, raiz):
+            return False
+        vistos.add(ruta)
+        if _es_generado(ruta, omitir_generados):
+            if omitidos is not None:
+                omitidos.append(ruta)
+            return False
+        return True
+
+    if desde_ref is not None:
+        prefijos = [os.path.normpath(o) for o in objetivos]
+        for ruta in archivos_cambiados_git(desde_ref):
+            for p in prefijos:
+                if p == '.' or ruta == p or ruta.startswith(p + os.sep):
+                    raiz = p
+                elif fnmatch.fnmatch(ruta, p):
+                    raiz = _raiz_glob(p)
+                else:
+                    continue
+                if nuevo(ruta, raiz):
+                    yield ruta
+                break
+        return
+
+    for objetivo in objetivos:
+        raiz = objetivo
+        if os.path.isdir(objetivo):
+            candidatos = _recorrer_directorio(objetivo, excluir)
+        elif os.path.exists(objetivo):
+            # Un archivo indicado explícitamente se analiza aunque no sea .py
+            ruta = os.path.normpath(objetivo)
+            if ruta not in vistos:
+                vistos.add(ruta)
+                yield ruta
+            continue
+        elif glob.has_magic(objetivo):
+            raiz = _raiz_glob(objetivo)
+            candidatos = (r for r in glob.iglob(objetivo, recursive=True)
+                          if r.endswith('.py') and os.path.isfile(r))
+        else:
+            # Se deja pasar para que analizar_archivo informe que no existe
+            candidatos = [objetivo]
+
+        for ruta in candidatos:
+            if nuevo(ruta, raiz):
+                yield os.path.normpath(ruta)
+
+
+class LectorObjetosGit:
+    """
+    Lee objetos del repositorio con un único `git cat-file --batch`.
+
+    Los árboles se recorren directamente en lugar de llamar a `git ls-tree`
+    por commit, y cada árbol se lee una sola vez: los subdirectorios que no
+    cambiaron entre commits comparten el mismo hash y se toman de memoria.
+    """
+
+    def __init__(self):
+        import subprocess
+        self._proceso = subprocess.Popen(['git', 'cat-file', '--batch'],
+                                         stdin=subprocess.PIPE,
+                                         stdout=subprocess.PIPE)
+        self._arboles = {}
+
+    def leer(self, sha):
+        """
+        Devuelve (tipo, contenido) del objeto `sha`
+        """
+        self._proceso.stdin.write(sha.encode('ascii') + b'\n')
+        self._proceso.stdin.flush()
+        cabecera = self._proceso.stdout.readline().split()
+        if len(cabecera) != 3:
+            raise ValueError(f"objeto de git no encontrado: {sha}")
+        tamano = int(cabecera[2])
+        contenido = self._proceso.stdout.read(tamano)
+        self._proceso.stdout.read(1)  # salto de línea final
+        return cabecera[1].decode('ascii'), contenido
+
+    def archivos_python(self, arbol):
+        """
+        Lista de (ruta, hash del blob) de los archivos .py bajo el árbol
+        `arbol`, con rutas relativas a la raíz del repositorio
+        """
+        archivos = self._arboles.get(arbol)
+        if archivos is not None:
+            return archivos
+
+        archivos = []
+        _, contenido = self.leer(arbol)
+        posicion = 0
+        while posicion < len(contenido):
+            espacio = contenido.index(b' ', posicion)
+            nulo = contenido.index(b'\0', espacio)
+            modo = contenido[posicion:espacio]
+            nombre = contenido[espacio + 1:nulo].decode('utf-8', errors='replace')
+            sha = contenido[nulo + 1:nulo + 21].hex()
+            posicion = nulo + 21
+            if modo == b'40000':
+                if nombre in DIRECTORIOS_EXCLUIDOS or nombre.endswith('.egg-info'):
+                    continue
+                archivos.extend((f'{nombre}/{ruta}', blob)
+                                for ruta, blob in self.archivos_python(sha))
+            elif modo in (b'100644', b'100755') and nombre.endswith('.py'):
+                archivos.append((nombre, sha))
+
+        self._arboles[arbol] = archivos
+        return archivos
+
+    def cerrar(self):
+        self._proceso.stdin.close()
+        self._proceso.wait()
+
+
+def commits_git(referencias, limite):
+    """
+    Los `limite` commits más recientes alcanzables desde `referencias`, del
+    más nuevo al más antiguo, como diccionarios con hash, árbol, fecha y
+    asunto. Las puntas de cada referencia se incluyen siempre.
+    """
+    import subprocess
+    formato = '--format=%H%x00%T%x00%ct%x00%ad%x00%s'
+    try:
+        salida = subprocess.run(['git', 'log', formato, '--date=short', '--date-order',
+                                 f'--max-count={limite}', *referencias, '--'],
+                                capture_output=True, text=True, check=True).stdout
+        puntas = subprocess.run(['git', 'log', formato, '--date=short', '--no-walk',
+                                 *referencias, '--'],
+                                capture_output=True, text=True, check=True).stdout
+    except (OSError, subprocess.CalledProcessError) as e:
+        detalle = getattr(e, 'stderr', '') or str(e)
+        print(f"❌ Error: No se pudo leer el historial de git: {detalle.strip()}")
+        return []
+
+    commits = []
+    vistos = set()
+    for linea in (salida + puntas).splitlines():
+        sha, arbol, marca, fecha, asunto = linea.split('\0', 4)
+        if sha not in vistos:
+            vistos.add(sha)
+            commits.append({'commit': sha, 'arbol': arbol, 'marca': int(marca),
+                            'fecha': fecha, 'asunto': asunto})
+    commits.sort(key=lambda c: c['marca'], reverse=True)
+    return commits
+
+
+def _tamano_archivo(archivo):
+    try:
+        return os.path.getsize(archivo)
+    except OSError:
+        return 0
+
+
+def configuracion_cache(motor, reglas, opciones=None):
+    """
+    Parte de la clave de CacheEscaneo que depende de cómo se ejecuta el
+    análisis; el archivo de configuración de Bandit entra por su contenido
+    """
+    opciones = dict(OPCIONES_BANDIT, **(opciones or {}))
+    contenido = None
+    if opciones['config']:
+        try:
+            with open(opciones['config'], 'rb') as f:
+                contenido = hashlib.sha256(f.read()).hexdigest()
+        except OSError:
+            contenido = 'ilegible'
+    return {'motor': motor,
+            'reglas': [r.test_id for r in REGLAS_PROPIAS] if reglas else [],
+            'bandit': dict(opciones, config=contenido)}
+
+
+def version_bandit():
+    """
+    Versión instalada de Bandit, o 'desconocida' si no está instalado
+    """
+    try:
+        from importlib.metadata import version
+        return version('bandit')
+    except Exception:
+        return 'desconocida'
+
+
+def _reubicar_reporte(reporte, archivo):
+    """
+    Ajusta las rutas de un reporte de un solo archivo a `archivo`, para
+    reutilizar reportes guardados de un contenido idéntico en otra ruta
+    """
+    for issue in reporte.get('results', []):
+        issue['filename'] = archivo
+    metricas = reporte.get('metrics', {})
+    for nombre in [n for n in metricas if n != '_totals']:
+        if nombre != archivo:
+            metricas[archivo] = metricas.pop(nombre)
+    return reporte
+
+
+class CacheEscaneo:
+    """
+    Cache persistente de reportes de Bandit.
+
+    Cada entrada se indexa por el hash del contenido del archivo, la versión
+    de Bandit y la configuración del análisis (motor, opciones de Bandit con
+    el contenido de su archivo de configuración, reglas propias y líneas de
+    código por hallazgo), así que un archivo que no cambió
+    devuelve sus hallazgos sin volver a ejecutar Bandit. El tamaño total se
+    limita a `max_bytes` desalojando primero las entradas usadas hace más
+    tiempo (LRU por fecha de modificación, que se actualiza en cada acierto).
+    """
+
+    def __init__(self, directorio='.cache_seguridad', max_bytes=50 * 1024 * 1024,
+                 configuracion=None, en_memoria=0):
+        self.directorio = directorio
+        self.max_bytes = max_bytes
+        self.aciertos = 0
+        self.fallos = 0
+        self.desalojos = 0
+        self._tamano_total = None
+        # Capa LRU opcional en memoria (clave -> JSON) para procesos de larga
+        # vida como el daemon; 0 la desactiva
+        self.en_memoria = en_memoria
+        self._memoria = collections.OrderedDict()
+
+        self._version_bandit = version_bandit()
+        self._firma = self.firma(configuracion)
+        os.makedirs(directorio, exist_ok=True)
+
+    def firma(self, configuracion):
+        """
+        Parte fija de las claves para una configuración de configuracion_cache;
+        el daemon la calcula en cada solicitud con la configuración del cliente
+        """
+        return json.dumps({'bandit': self._version_bandit,
+                           'lineas_codigo': LINEAS_CODIGO,
+                           'funciones': True,
+                           'configuracion': configuracion or {}},
+                          sort_keys=True).encode('utf-8')
+
+    def clave(self, archivo, firma=None):
+        """
+        Clave de cache del contenido actual de un archivo, con la firma del
+        constructor o la que se pase
+        """
+        h = hashlib.sha256(firma or self._firma)
+        with open(archivo, 'rb') as f:
+            for bloque in iter(lambda: f.read(1 << 16), b''):
+                h.update(bloque)
+        return h.hexdigest()
+
+    def _ruta(self, clave):
+        return os.path.join(self.directorio, f'{clave}.json')
+
+    def obtener(self, clave, archivo):
+        """
+        Devuelve el reporte guardado para `clave` (con las rutas ajustadas a
+        `archivo`) o None si no está en la cache
+        """
+        texto = self._memoria.get(clave)
+        if texto is not None:
+            self._memoria.move_to_end(clave)
+            self.aciertos += 1
+            return _reubicar_reporte(json.loads(texto), archivo)
+
+        ruta = self._ruta(clave)
+        try:
+            with open(ruta, 'r', encoding='utf-8') as f:
+                texto = f.read()
+            reporte = json.loads(texto)
+        except (OSError, ValueError):
+            self.fallos += 1
+            return None
+
+        # Marcar la entrada como usada recientemente
+        try:
+            os.utime(ruta)
+        except OSError:
+            pass
+        self.aciertos += 1
+        self._recordar(clave, texto)
+        return _reubicar_reporte(reporte, archivo)
+
+    def _recordar(self, clave, texto):
+        if not self.en_memoria:
+            return
+        self._memoria[clave] = texto
+        self._memoria.move_to_end(clave)
+        while len(self._memoria) > self.en_memoria:
+            self._memoria.popitem(last=False)
+
+    def guardar(self, clave, reporte):
+        """
+        Guarda un reporte y desaloja entradas antiguas si se supera el límite
+        """
+        import threading
+        ruta = self._ruta(clave)
+        # default=list recorre los hallazgos que un worker dejó en disco
+        texto = json.dumps(reporte, default=list)
+        temporal = f'{ruta}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(temporal, 'w', encoding='utf-8') as f:
+            f.write(texto)
+        # Al sobrescribir una entrada su tamaño anterior deja de contar
+        anterior = _tamano_archivo(ruta)
+        os.replace(temporal, ruta)
+        self._recordar(clave, texto)
+
+        if self._tamano_total is None:
+            self._tamano_total = sum(e[2] for e in self._entradas())
+        else:
+            self._tamano_total += _tamano_archivo(ruta) - anterior
+
+        if self._tamano_total > self.max_bytes:
+            self._desalojar()
+
+    def _entradas(self):
+        entradas = []
+        for nombre in os.listdir(self.directorio):
+            if not nombre.endswith('.json'):
+                continue
+            ruta = os.path.join(self.directorio, nombre)
+            try:
+                st = os.stat(ruta)
+            except OSError:
+                continue
+            entradas.append((st.st_mtime, ruta, st.st_size))
+        return entradas
+
+    def _desalojar(self):
+        entradas = sorted(self._entradas())
+        total = sum(e[2] for e in entradas)
+        for _, ruta, tamano in entradas:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(ruta)
+            except OSError:
+                continue
+            total -= tamano
+            self.desalojos += 1
+        self._tamano_total = total
+
+
+ESTILOS_CSS = """\
+        * {
+            margin: 0;
+            padding: 0;
+            box-sizing: border-box;
+        }
+        body {
+            font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif;
+            line-height: 1.6;
+            background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
+            padding: 20px;
+            color: #333;
+        }
+        .container {
+            max-width: 1200px;
+            margin: 0 auto;
+            background: white;
+            padding: 30px;
+            border-radius: 10px;
+            box-shadow: 0 10px 40px rgba(0,0,0,0.2);
+        }
+        h1 {
+            color: #667eea;
+            text-align: center;
+            margin-bottom: 10px;
+            font-size: 2.5em;
+        }
+        .subtitle {
+            text-align: center;
+            color: #666;
+            margin-bottom: 30px;
+        }
+        .timestamp {
+            text-align: center;
+            color: #999;
+            font-size: 0.9em;
+            margin-bottom: 40px;
+        }
+        .comparison {
+            display: grid;
+            grid-template-columns: 1fr 1fr;
+            gap: 20px;
+            margin-bottom: 40px;
+        }
+        .card {
+            background: #f8f9fa;
+            padding: 25px;
+            border-radius: 8px;
+            border-left: 5px solid #dc3545;
+        }
+        .card.secure {
+            border-left-color: #28a745;
+        }
+        .card h2 {
+            margin-bottom: 15px;
+            color: #333;
+            font-size: 1.5em;
+        }
+        .stats {
+            display: flex;
+            justify-content: space-around;
+            margin: 20px 0;
+        }
+        .stat {
+            text-align: center;
+        }
+        .stat-number {
+            font-size: 3em;
+            font-weight: bold;
+            color: #667eea;
+        }
+        .stat-label {
+            color: #666;
+            font-size: 0.9em;
+        }
+        .severity {
+            display: flex;
+            justify-content: space-between;
+            margin: 10px 0;
+            padding: 10px;
+            background: white;
+            border-radius: 5px;
+        }
+        .severity-high { border-left: 4px solid #dc3545; }
+        .severity-medium { border-left: 4px solid #ffc107; }
+        .severity-low { border-left: 4px solid #28a745; }
+        
+        .vulnerability {
+            background: white;
+            margin: 10px 0;
+            padding: 15px;
+            border-radius: 5px;
+            border-left: 4px solid #667eea;
+        }
+        .vuln-header {
+            display: flex;
+            justify-content: space-between;
+            align-items: center;
+            margin-bottom: 10px;
+        }
+        .badge {
+            padding: 4px 12px;
+            border-radius: 12px;
+            font-size: 0.85em;
+            font-weight: bold;
+        }
+        .badge-high {
+            background: #dc3545;
+            color: white;
+        }
+        .badge-medium {
+            background: #ffc107;
+            color: #333;
+        }
+        .badge-low {
+            background: #28a745;
+            color: white;
+        }
+        .improvement {
+            background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
+            color: white;
+            padding: 30px;
+            border-radius: 10px;
+            text-align: center;
+            margin: 40px 0;
+        }
+        .improvement h2 {
+            color: white;
+            margin-bottom: 20px;
+        }
+        .improvement-number {
+            font-size: 4em;
+            font-weight: bold;
+            margin: 20px 0;
+        }
+        .corrected-list {
+            background: rgba(255,255,255,0.1);
+            padding: 20px;
+            border-radius: 8px;
+            margin-top: 20px;
+            text-align: left;
+        }
+        .corrected-list h3 {
+            color: white;
+            margin-bottom: 15px;
+        }
+        .corrected-item {
+            background: rgba(255,255,255,0.2);
+            margin: 8px 0;
+            padding: 10px 15px;
+            border-radius: 5px;
+        }
+        .tabla {
+            width: 100%;
+            border-collapse: collapse;
+            margin: 20px 0;
+        }
+        .tabla th, .tabla td {
+            padding: 8px 12px;
+            border-bottom: 1px solid #eee;
+            text-align: left;
+        }
+        .tabla th {
+            background: #f8f9fa;
+        }
+        .paginacion {
+            display: flex;
+            justify-content: space-between;
+            margin: 20px 0;
+        }
+        .codigo {
+            background: #f8f9fa;
+            padding: 10px;
+            border-radius: 5px;
+            overflow-x: auto;
+            font-size: 0.85em;
+        }
+        @media (max-width: 768px) {
+            .comparison {
+                grid-template-columns: 1fr;
+            }
+        }
+"""
+
+PIE_HTML = """
+    </div>
+</body>
+</html>
+"""
+
+
+def cabecera_html(titulo, timestamp, enlace_inicio=None):
+    """
+    Inicio común de las páginas HTML del reporte
+    """
+    volver = ''
+    if enlace_inicio:
+        volver = f'<p><a href="{enlace_inicio}">← Volver al índice</a></p>'
+    return f"""
+<!DOCTYPE html>
+<html lang="es">
+<head>
+    <meta charset="UTF-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    <title>{html.escape(titulo)}</title>
+    <style>
+{ESTILOS_CSS}    </style>
+</head>
+<body>
+    <div class="container">
+        <h1>🔒 Reporte de Análisis de Seguridad</h1>
+        <div class="subtitle">Escenario 4 - Análisis con Python (Bandit)</div>
+        <div class="timestamp">Generado: {timestamp}</div>
+        {volver}
+        """
+
+
+def escribir_paginas_archivo(directorio, indice, archivo, resultados,
+                             por_pagina, timestamp):
+    """
+    Escribe las páginas de hallazgos de un archivo y devuelve la fila del
+    índice con sus totales. Está a nivel de módulo para ejecutarse en el pool.
+    """
+    prefijo = f'{indice:05d}'
+    tabla = TablaHallazgos(resultados)
+    conteos = tabla.conteo('severidad')
+
+    paginas = max(1, -(-len(tabla) // por_pagina))
+    nombre = html.escape(archivo)
+    for pagina in range(1, paginas + 1):
+        ruta = os.path.join(directorio, f'{prefijo}_{pagina}.html')
+        with open(ruta, 'w', encoding='utf-8') as f:
+            f.write(cabecera_html(f'{archivo} - página {pagina}', timestamp,
+                                  enlace_inicio='../index.html'))
+            f.write(f'<h2>{nombre}</h2>')
+            f.write(f'<p>{len(tabla)} hallazgos · Alta {conteos["HIGH"]} · '
+                    f'Media {conteos["MEDIUM"]} · Baja {conteos["LOW"]} · '
+                    f'Página {pagina} de {paginas}</p>')
+
+            inicio = (pagina - 1) * por_pagina
+            filas = tabla.filas(inicio, inicio + por_pagina)
+            for fila, (linea, test_id, sev, _, texto) in enumerate(filas, inicio):
+                f.write('<div class="vulnerability"><div class="vuln-header">')
+                f.write(f'<span>Línea {linea} · {html.escape(str(test_id))}</span>')
+                f.write(f'<span class="badge badge-{sev.lower()}">{sev}</span></div>')
+                f.write(f'<div>{html.escape(texto)}</div>')
+                if tabla.codigo[fila]:
+                    f.write(f'<pre class="codigo">{html.escape(tabla.codigo[fila])}</pre>')
+                f.write('</div>')
+
+            f.write('<div class="paginacion"><span>')
+            if pagina > 1:
+                f.write(f'<a href="{prefijo}_{pagina - 1}.html">← Anterior</a>')
+            f.write('</span><span>')
+            if pagina < paginas:
+                f.write(f'<a href="{prefijo}_{pagina + 1}.html">Siguiente →</a>')
+            f.write('</span></div>')
+            f.write(PIE_HTML)
+
+    fila = {'archivo': archivo, 'prefijo': prefijo, 'total': len(tabla),
+            'paginas': paginas}
+    fila.update((sev, conteos[sev]) for sev in SEVERIDADES)
+    return fila
+
+
+# Formato binario de reportes: cabecera fija (magia, versión, largo del
+# índice), índice JSON sin comprimir y secciones comprimidas con zlib
+MAGIA_BINARIA = b'RSEG'
+VERSION_BINARIA = 1
+_CABECERA_BINARIA = struct.Struct('<4sBI')
+
+
+def escribir_reporte_binario(reporte, ruta):
+    """
+    Escribe un reporte de Bandit en el formato binario comprimido.
+
+    Los hallazgos se agrupan en una sección por archivo y severidad, y las
+    métricas van en otra. El índice guarda la posición, el largo y el
+    número de hallazgos de cada sección, así que los conteos se leen sin
+    descomprimir nada y cada consulta descomprime solo lo que necesita.
+    """
+    grupos = {}
+    for issue in reporte.get('results', []):
+        clave = (issue.get('filename', ''), issue.get('issue_severity', 'UNKNOWN'))
+        grupos.setdefault(clave, []).append(issue)
+
+    cuerpo = []
+    posicion = 0
+
+    def agregar(valor):
+        nonlocal posicion
+        datos = zlib.compress(json.dumps(valor).encode('utf-8'), 6)
+        cuerpo.append(datos)
+        ubicacion = [posicion, len(datos)]
+        posicion += len(datos)
+        return ubicacion
+
+    indice = {
+        'generated_at': reporte.get('generated_at'),
+        'errors': reporte.get('errors', []),
+        'metricas': agregar(reporte.get('metrics', {})),
+        'secciones': [[archivo, severidad, *agregar(issues), len(issues)]
+                      for (archivo, severidad), issues in sorted(grupos.items())],
+    }
+    datos_indice = json.dumps(indice).encode('utf-8')
+
+    with open(ruta, 'wb') as f:
+        f.write(_CABECERA_BINARIA.pack(MAGIA_BINARIA, VERSION_BINARIA, len(datos_indice)))
+        f.write(datos_indice)
+        for datos in cuerpo:
+            f.write(datos)
+
+
+class ReporteBinario:
+    """
+    Lectura perezosa de un reporte escrito con escribir_reporte_binario.
+
+    El archivo se mapea en memoria y al abrirlo solo se decodifica el
+    índice; las secciones de hallazgos y las métricas se descomprimen
+    cuando se piden.
+    """
+
+    def __init__(self, ruta):
+        self.ruta = ruta
+        self._f = open(ruta, 'rb')
+        try:
+            self._mapa = mmap.mmap(self._f.fileno(), 0, access=mmap.ACCESS_READ)
+            if len(self._mapa) < _CABECERA_BINARIA.size:
+                raise ValueError(f"{ruta} no es un reporte binario")
+            magia, version, largo = _CABECERA_BINARIA.unpack_from(self._mapa, 0)
+            if magia != MAGIA_BINARIA:
+                raise ValueError(f"{ruta} no es un reporte binario")
+            if version != VERSION_BINARIA:
+                raise ValueError(f"{ruta}: versión de formato {version} no soportada")
+            inicio = _CABECERA_BINARIA.size
+            self.indice = json.loads(self._mapa[inicio:inicio + largo])
+            self._base = inicio + largo
+        except Exception:
+            self.cerrar()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.cerrar()
+
+    def _seccion(self, posicion, largo):
+        inicio = self._base + posicion
+        return json.loads(zlib.decompress(self._mapa[inicio:inicio + largo]))
+
+    def archivos(self):
+        return sorted({seccion[0] for seccion in self.indice['secciones']})
+
+    def conteos(self):
+        """
+        {archivo: {severidad: hallazgos}} leído solo del índice
+        """
+        conteos = {}
+        for archivo, severidad, _, _, cantidad in self.indice['secciones']:
+            por_archivo = conteos.setdefault(archivo, dict.fromkeys(SEVERIDADES, 0))
+            por_archivo[severidad] = por_archivo.get(severidad, 0) + cantidad
+        return conteos
+
+    def metricas(self):
+        return self._seccion(*self.indice['metricas'])
+
+    def hallazgos(self, archivos=None, severidades=None):
+        """
+        Genera los hallazgos de las secciones que coinciden con los filtros,
+        descomprimiendo solo esas
+        """
+        for archivo, severidad, posicion, largo, _ in self.indice['secciones']:
+            if archivos is not None and archivo not in archivos:
+                continue
+            if severidades is not None and severidad not in severidades:
+                continue
+            yield from self._seccion(posicion, largo)
+
+    def como_reporte(self, archivos=None, severidades=None):
+        """
+        Reporte con la forma del JSON de Bandit, opcionalmente limitado a
+        algunos archivos o severidades
+        """
+        resultados = sorted(self.hallazgos(archivos, severidades),
+                            key=lambda r: (r.get('filename', ''),
+                                           r.get('line_number') or 0))
+        return {'errors': self.indice['errors'],
+                'generated_at': self.indice['generated_at'],
+                'metrics': self.metricas(),
+                'results': resultados}
+
+    def cerrar(self):
+        mapa = getattr(self, '_mapa', None)
+        if mapa is not None:
+            mapa.close()
+            self._mapa = None
+        self._f.close()
+
+
+def cargar_reporte(ruta, severidades=None):
+    """
+    Carga un reporte guardado, en JSON o en el formato binario (.rsb)
+    """
+    if ruta.endswith('.rsb'):
+        with ReporteBinario(ruta) as binario:
+            return binario.como_reporte(severidades=severidades)
+    reporte = cargar_reporte_json(ruta)
+    if severidades is not None:
+        reporte['results'] = [r for r in reporte.get('results', [])
+                              if r.get('issue_severity') in severidades]
+    return reporte
+
+
+class EscritorNDJSON:
+    """
+    Escribe cada hallazgo como una línea JSON (NDJSON) en cuanto se produce,
+    vaciando el buffer tras cada archivo para que herramientas como jq
+    puedan consumir la salida antes de que termine el análisis
+    """
+
+    def __init__(self, destino):
+        self.destino = destino
+        if destino == '-':
+            self._f = sys.stdout
+            self._propio = False
+        else:
+            self._f = open(destino, 'w', encoding='utf-8')
+            self._propio = True
+        self.lineas = 0
+
+    def escribir(self, reporte):
+        for issue in reporte.get('results', []):
+            self._f.write(json.dumps(issue, ensure_ascii=False,
+                                     separators=(',', ':')))
+            self._f.write('\n')
+            self.lineas += 1
+        self._f.flush()
+
+    def cerrar(self):
+        if self._propio:
+            self._f.close()
+        else:
+            self._f.flush()
+
+
+def _aligerar_reporte(reporte):
+    """
+    Copia de un reporte sin la lista de hallazgos, para no retenerlos en
+    memoria cuando ya se escribieron en la salida NDJSON
+    """
+    return {
+        'errors': reporte.get('errors', []),
+        'metrics': {'_totals': reporte.get('metrics', {}).get('_totals', {})},
+        'results': []
+    }
+
+
+SEVERIDADES = ('HIGH', 'MEDIUM', 'LOW')
+CONFIANZAS = ('HIGH', 'MEDIUM', 'LOW')
+
+
+class _ColumnaCategorica:
+    """
+    Columna codificada por diccionario: cada valor distinto se guarda (e
+    interna) una sola vez y las filas solo guardan su código en un array
+    """
+    __slots__ = ('valores', '_codigos_por_valor', 'codigos')
+
+    def __init__(self):
+        self.valores = []
+        self._codigos_por_valor = {}
+        self.codigos = array.array('I')
+
+    def agregar(self, valor):
+        codigo = self._codigos_por_valor.get(valor)
+        if codigo is None:
+            codigo = self._codigos_por_valor[valor] = len(self.valores)
+            self.valores.append(sys.intern(valor) if isinstance(valor, str) else valor)
+        self.codigos.append(codigo)
+
+    def __getitem__(self, fila):
+        return self.valores[self.codigos[fila]]
+
+    def conteo(self):
+        return {self.valores[codigo]: n
+                for codigo, n in collections.Counter(self.codigos).items()}
+
+
+class TablaHallazgos:
+    """
+    Hallazgos de un reporte en columnas compactas.
+
+    Archivo, test_id, severidad, confianza, descripción, función
+    contenedora y huella se codifican por diccionario y la línea se guarda
+    en un array de enteros, así que los conteos se hacen contando códigos en
+    lugar de recorrer los diccionarios de Bandit con .get(). Los
+    diccionarios no se conservan: lo único que se guarda tal cual es el
+    fragmento de código, para las páginas HTML.
+    """
+    __slots__ = ('archivo', 'test_id', 'severidad', 'confianza', 'texto',
+                 'funcion', 'clave', 'linea', 'codigo', '_conteos')
+
+    def __init__(self, issues):
+        self.archivo = _ColumnaCategorica()
+        self.test_id = _ColumnaCategorica()
+        self.severidad = _ColumnaCategorica()
+        self.confianza = _ColumnaCategorica()
+        self.texto = _ColumnaCategorica()
+        self.funcion = _ColumnaCategorica()
+        self.clave = _ColumnaCategorica()
+        self.linea = array.array('l')
+        self.codigo = []
+        self._conteos = {}
+        for issue in issues:
+            self.archivo.agregar(issue.get('filename', ''))
+            self.test_id.agregar(issue.get('test_id', 'N/A'))
+            self.severidad.agregar(issue.get('issue_severity', 'UNKNOWN'))
+            self.confianza.agregar(issue.get('issue_confidence', 'UNKNOWN'))
+            self.texto.agregar(issue.get('issue_text', 'Sin descripción'))
+            self.funcion.agregar(issue.get('funcion', ''))
+            self.clave.agregar(_clave_hallazgo(issue))
+            linea = issue.get('line_number')
+            self.linea.append(linea if isinstance(linea, int) else -1)
+            self.codigo.append(issue.get('code', ''))
+
+    def __len__(self):
+        return len(self.linea)
+
+    def conteo(self, columna):
+        """
+        Número de hallazgos por valor de `columna` ('severidad', 'confianza',
+        'test_id', 'archivo' o 'texto'); las severidades y confianzas
+        siempre incluyen HIGH, MEDIUM y LOW
+        """
+        conteo = self._conteos.get(columna)
+        if conteo is None:
+            conteo = getattr(self, columna).conteo()
+            base = {'severidad': SEVERIDADES, 'confianza': CONFIANZAS}.get(columna)
+            if base is not None:
+                conteo = {**dict.fromkeys(base, 0), **conteo}
+            self._conteos[columna] = conteo
+        return conteo
+
+    def filas(self, inicio=0, fin=None):
+        """
+        Genera (línea, test_id, severidad, confianza, descripción) de cada
+        hallazgo; la línea es 'N/A' si Bandit no la informó
+        """
+        for i in range(inicio, len(self) if fin is None else min(fin, len(self))):
+            linea = self.linea[i]
+            yield (linea if linea >= 0 else 'N/A', self.test_id[i],
+                   self.severidad[i], self.confianza[i], self.texto[i])
+
+    def describir(self, fila):
+        """
+        Texto de una línea para el hallazgo `fila` en las comparaciones
+        """
+        linea = self.linea[fila]
+        lugar = f"línea {linea if linea >= 0 else 'N/A'}"
+        if self.funcion[fila]:
+            lugar += f", {self.funcion[fila]}()"
+        return f"{self.test_id[fila]} ({lugar}): {self.texto[fila]}"
+
+    @classmethod
+    def de_reporte(cls, reporte):
+        """
+        Tabla de los hallazgos de `reporte`, construida una sola vez aunque
+        la pidan el resumen, los totales, la comparación y el HTML
+        """
+        resultados = reporte.get('results', [])
+        guardada = _tablas_recientes.get(id(reporte))
+        if (guardada is not None and guardada[0] is reporte
+                and guardada[2] == id(resultados)
+                and len(guardada[1]) == len(resultados)):
+            _tablas_recientes.move_to_end(id(reporte))
+            return guardada[1]
+
+        tabla = cls(resultados)
+        # Se guarda el reporte junto a la tabla para que su id no se reutilice
+        _tablas_recientes[id(reporte)] = (reporte, tabla, id(resultados))
+        while len(_tablas_recientes) > 16:
+            _tablas_recientes.popitem(last=False)
+        return tabla
+
+
+# Tablas de los últimos reportes usados, por id del reporte
+_tablas_recientes = collections.OrderedDict()
+
+
+class _ResultadosDerivados:
+    """
+    Hallazgos de un reporte que un worker dejó en disco con
+    _derivar_reporte. Cada recorrido los decodifica de a uno desde el
+    archivo, así que nunca están todos en memoria; se pueden recorrer
+    varias veces y se envían a otro proceso sin copiar los hallazgos.
+    """
+    __slots__ = ('ruta', 'posicion', 'cantidad')
+
+    def __init__(self, ruta, posicion, cantidad):
+        self.ruta = ruta
+        self.posicion = posicion
+        self.cantidad = cantidad
+
+    def __len__(self):
+        return self.cantidad
+
+    def __iter__(self):
+        with open(self.ruta, 'rb') as f:
+            f.seek(self.posicion)
+            texto = io.TextIOWrapper(f, encoding='utf-8')
+            for clave, valor in _campos_reporte_json(_LectorJSON(texto)):
+                if clave == 'results':
+                    yield valor
+
+
+class ReportesAcotados:
+    """
+    Diccionario archivo -> reporte con un presupuesto de memoria.
+
+    Mientras la memoria residente del proceso esté por debajo de
+    `presupuesto` los reportes se guardan tal cual. Al alcanzarlo, los
+    reportes completos pasan a un archivo temporal (una línea JSON por
+    reporte) y en memoria solo quedan su versión aligerada con los totales y
+    la posición en el disco; al pedir uno se vuelve a leer desde el archivo.
+    Los reportes que los workers ya dejaron en `directorio` (con
+    _ResultadosDerivados como hallazgos) se guardan sin volver a escribirlos.
+    Hay que llamar a cerrar() para borrar los archivos temporales.
+    """
+
+    def __init__(self, presupuesto):
+        self.presupuesto = presupuesto
+        self._memoria = {}
+        self._derivados = {}
+        self._ligeros = {}
+        self._posiciones = {}
+        self._disco = None
+        self._directorio = None
+        self.desbordados = 0
+        self.rss_maximo = 0
+
+    @property
+    def directorio(self):
+        """
+        Directorio temporal donde los workers dejan los reportes completos
+        """
+        import tempfile
+        if self._directorio is None:
+            self._directorio = tempfile.mkdtemp(prefix='reportes_seguridad_')
+        return self._directorio
+
+    def __setitem__(self, archivo, reporte):
+        import tempfile
+        self._memoria.pop(archivo, None)
+        self._derivados.pop(archivo, None)
+        self._posiciones.pop(archivo, None)
+        self._ligeros[archivo] = None if reporte is None else _aligerar_reporte(reporte)
+        if reporte is None:
+            return
+
+        rss = rss_actual()
+        self.rss_maximo = max(self.rss_maximo, rss)
+        if isinstance(reporte.get('results'), _ResultadosDerivados):
+            self._derivados[archivo] = reporte
+            self.desbordados += 1
+            return
+        if self._disco is None and rss < self.presupuesto:
+            self._memoria[archivo] = reporte
+            return
+
+        if self._disco is None:
+            self._disco = tempfile.TemporaryFile()
+            for pendiente in list(self._memoria):
+                self._desbordar(pendiente, self._memoria.pop(pendiente))
+        self._desbordar(archivo, reporte)
+
+    def _desbordar(self, archivo, reporte):
+        datos = json.dumps(reporte).encode('utf-8')
+        self._disco.seek(0, os.SEEK_END)
+        self._posiciones[archivo] = (self._disco.tell(), len(datos))
+        self._disco.write(datos)
+        self.desbordados += 1
+
+    def __getitem__(self, archivo):
+        reporte = self._memoria.get(archivo) or self._derivados.get(archivo)
+        if reporte is not None:
+            return reporte
+        posicion = self._posiciones.get(archivo)
+        if posicion is None:
+            return self._ligeros[archivo]
+        self._disco.seek(posicion[0])
+        return json.loads(self._disco.read(posicion[1]))
+
+    def __contains__(self, archivo):
+        return archivo in self._ligeros
+
+    def __iter__(self):
+        return iter(self._ligeros)
+
+    def __len__(self):
+        return len(self._ligeros)
+
+    def get(self, archivo, defecto=None):
+        return self[archivo] if archivo in self._ligeros else defecto
+
+    def setdefault(self, archivo, defecto=None):
+        if archivo not in self._ligeros:
+            self[archivo] = defecto
+        return self[archivo]
+
+    def keys(self):
+        return self._ligeros.keys()
+
+    def items(self):
+        for archivo in self._ligeros:
+            yield archivo, self[archivo]
+
+    def values(self):
+        for archivo in self._ligeros:
+            yield self[archivo]
+
+    def aligerados(self):
+        """
+        Versiones aligeradas (solo totales) de los reportes, sin leer el disco
+        """
+        return self._ligeros.values()
+
+    def reordenar(self, archivos):
+        self._ligeros = {archivo: self._ligeros[archivo] for archivo in archivos}
+
+    def cerrar(self):
+        import shutil
+        if self._disco is not None:
+            self._disco.close()
+            self._disco = None
+        if self._directorio is not None:
+            shutil.rmtree(self._directorio, ignore_errors=True)
+            self._directorio = None
+        self._derivados.clear()
+
+
+def _reportes_aligerados(reportes):
+    if isinstance(reportes, ReportesAcotados):
+        return reportes.aligerados()
+    return reportes.values()
+
+
+def _cerrar_reportes(reportes):
+    if isinstance(reportes, ReportesAcotados):
+        reportes.cerrar()
+
+
+def _mapa_funciones(arbol):
+    """
+    Lista indexada por número de línea con el nombre calificado de la
+    función o clase que contiene cada línea ('' a nivel de módulo)
+    """
+    definiciones = []
+    pendientes = [(arbol, '')]
+    while pendientes:
+        nodo, prefijo = pendientes.pop()
+        for hijo in ast.iter_child_nodes(nodo):
+            if isinstance(hijo, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+                nombre = f'{prefijo}{hijo.name}'
+                definiciones.append((hijo.lineno, hijo.end_lineno, nombre))
+                pendientes.append((hijo, f'{nombre}.'))
+            else:
+                pendientes.append((hijo, prefijo))
+
+    # Las definiciones internas empiezan después que las externas, así
+    # que al recorrerlas en orden sobrescriben el rango de su contenedora
+    mapa = [''] * (max((d[1] for d in definiciones), default=0) + 1)
+    for inicio, fin, nombre in sorted(definiciones):
+        mapa[inicio:fin + 1] = [nombre] * (fin + 1 - inicio)
+    return mapa
+
+
+def _anotar_funciones(reporte, archivo, fuente=None, arbol=None):
+    """
+    Agrega a cada hallazgo del reporte la función que lo contiene
+    ('funcion'), calculada sobre el mismo código que se analizó para que
+    la huella no dependa de cómo esté el archivo cuando se lea el reporte
+    """
+    resultados = reporte.get('results') or []
+    if not resultados:
+        return
+    if arbol is None:
+        try:
+            if fuente is None:
+                with open(archivo, 'rb') as f:
+                    fuente = f.read()
+            arbol = ast.parse(fuente, filename=archivo)
+        except (OSError, SyntaxError, ValueError):
+            arbol = None
+    mapa = _mapa_funciones(arbol) if arbol is not None else []
+    for issue in resultados:
+        linea = issue.get('line_number')
+        issue['funcion'] = (mapa[linea] if isinstance(linea, int)
+                            and 0 <= linea < len(mapa) else '')
+
+
+def _clave_hallazgo(issue):
+    """
+    Tupla (test_id, código señalado normalizado, función contenedora) que
+    identifica un hallazgo sin depender de su número de línea. Sale solo
+    de los datos del reporte; los reportes anteriores a la anotación de
+    funciones no traen 'funcion' y cuentan como nivel de módulo.
+    """
+    señaladas = issue.get('line_range') or [issue.get('line_number')]
+    codigo = []
+    for linea in issue.get('code', '').splitlines():
+        numero, _, texto = linea.partition(' ')
+        if numero.isdigit() and int(numero) in señaladas:
+            codigo.append(' '.join(texto.split()))
+    return (issue.get('test_id', ''), '\n'.join(codigo), issue.get('funcion', ''))
+
+
+def huella_hallazgo(issue):
+    """
+    Identificador estable de un hallazgo que sobrevive a desplazamientos de
+    línea: test_id, las líneas señaladas (sin el contexto que agrega Bandit,
+    sin números de línea ni espacios sobrantes) y la función que lo contiene
+    """
+    contenido = '\0'.join(_clave_hallazgo(issue))
+    return hashlib.sha1(contenido.encode('utf-8'), usedforsecurity=False).hexdigest()
+
+
+def diferenciar_hallazgos(antes, despues):
+    """
+    Empareja los hallazgos de dos TablaHallazgos por huella con un hash join
+    y devuelve {'corregidas': [...], 'persistentes': [...], 'nuevas': [...]}
+    con los números de fila: las corregidas son filas de `antes` y el resto
+    filas de `despues`.
+
+    Es lineal en el número de hallazgos y respeta duplicados: si una huella
+    aparece dos veces antes y una después, una instancia cuenta como
+    corregida y la otra como persistente.
+    """
+    # En memoria basta con la tupla de la huella; el hash SHA-1 solo hace
+    # falta para guardarla en el historial
+    por_huella = {}
+    for fila in range(len(antes)):
+        por_huella.setdefault(antes.clave[fila], []).append(fila)
+
+    persistentes = []
+    nuevas = []
+    for fila in range(len(despues)):
+        candidatos = por_huella.get(despues.clave[fila])
+        if candidatos:
+            candidatos.pop()
+            persistentes.append(fila)
+        else:
+            nuevas.append(fila)
+
+    corregidas = [fila for grupo in por_huella.values() for fila in grupo]
+    return {'corregidas': corregidas, 'persistentes': persistentes,
+            'nuevas': nuevas}
+
+
+class HistorialEscaneos:
+    """
+    Registro de todas las ejecuciones del analizador en una base SQLite.
+
+    Cada ejecución guarda sus archivos y hallazgos en tablas indexadas, con
+    los hallazgos de cada archivo insertados en lote, para poder consultar
+    la evolución entre cientos de ejecuciones sin volver a leer reportes.
+    """
+
+    ESQUEMA = """
+        CREATE TABLE IF NOT EXISTS ejecuciones (
+            id INTEGER PRIMARY KEY,
+            fecha TEXT NOT NULL,
+            version_bandit TEXT,
+            archivos INTEGER DEFAULT 0,
+            hallazgos INTEGER DEFAULT 0,
+            alta INTEGER DEFAULT 0,
+            media INTEGER DEFAULT 0,
+            baja INTEGER DEFAULT 0
+        );
+        CREATE TABLE IF NOT EXISTS archivos (
+            id INTEGER PRIMARY KEY,
+            ejecucion_id INTEGER NOT NULL REFERENCES ejecuciones(id),
+            ruta TEXT NOT NULL,
+            loc INTEGER
+        );
+        CREATE TABLE IF NOT EXISTS hallazgos (
+            id INTEGER PRIMARY KEY,
+            ejecucion_id INTEGER NOT NULL REFERENCES ejecuciones(id),
+            archivo_id INTEGER NOT NULL REFERENCES archivos(id),
+            test_id TEXT NOT NULL,
+            severidad TEXT NOT NULL,
+            confianza TEXT,
+            linea INTEGER,
+            descripcion TEXT,
+            huella TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_ejecuciones_fecha ON ejecuciones(fecha);
+        CREATE INDEX IF NOT EXISTS idx_archivos_ejecucion ON archivos(ejecucion_id, ruta);
+        CREATE INDEX IF NOT EXISTS idx_hallazgos_ejecucion
+            ON hallazgos(ejecucion_id, severidad);
+        CREATE INDEX IF NOT EXISTS idx_hallazgos_huella
+            ON hallazgos(ejecucion_id, huella, archivo_id);
+    """
+
+    def __init__(self, ruta):
+        import sqlite3
+        self.ruta = ruta
+        self.conn = sqlite3.connect(ruta)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.executescript(self.ESQUEMA)
+
+    def iniciar_ejecucion(self, fecha):
+        cursor = self.conn.execute(
+            'INSERT INTO ejecuciones (fecha, version_bandit) VALUES (?, ?)',
+            (fecha, version_bandit()))
+        return cursor.lastrowid
+
+    def registrar_archivo(self, ejecucion_id, archivo, reporte):
+        """
+        Inserta un archivo y todos sus hallazgos con un solo executemany
+        """
+        loc = reporte.get('metrics', {}).get('_totals', {}).get('loc', 0)
+        cursor = self.conn.execute(
+            'INSERT INTO archivos (ejecucion_id, ruta, loc) VALUES (?, ?, ?)',
+            (ejecucion_id, archivo, loc))
+        archivo_id = cursor.lastrowid
+        self.conn.executemany(
+            'INSERT INTO hallazgos (ejecucion_id, archivo_id, test_id, severidad, '
+            'confianza, linea, descripcion, huella) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+            ((ejecucion_id, archivo_id, issue.get('test_id', ''),
+              issue.get('issue_severity', 'UNKNOWN'),
+              issue.get('issue_confidence', 'UNKNOWN'),
+              issue.get('line_number'), issue.get('issue_text', ''),
+              huella_hallazgo(issue))
+             for issue in reporte.get('results', [])))
+
+    def copiar_archivos(self, ejecucion_id, desde_id, omitir=()):
+        """
+        Copia a `ejecucion_id` los archivos de la ejecución `desde_id` que no
+        están en `omitir`, con sus hallazgos. Devuelve (archivos, totales)
+        de lo copiado, con los totales por severidad como en cerrar_ejecucion
+        """
+        omitir = set(omitir)
+        anteriores = self.conn.execute(
+            'SELECT id, ruta, loc FROM archivos WHERE ejecucion_id = ? ORDER BY id',
+            (desde_id,)).fetchall()
+        copiados = 0
+        totales = dict.fromkeys(('total',) + SEVERIDADES, 0)
+        for archivo_id, ruta, loc in anteriores:
+            if ruta in omitir:
+                continue
+            for severidad, cantidad in self.conn.execute(
+                    'SELECT severidad, COUNT(*) FROM hallazgos WHERE archivo_id = ? '
+                    'GROUP BY severidad', (archivo_id,)):
+                totales['total'] += cantidad
+                if severidad in totales:
+                    totales[severidad] += cantidad
+            cursor = self.conn.execute(
+                'INSERT INTO archivos (ejecucion_id, ruta, loc) VALUES (?, ?, ?)',
+                (ejecucion_id, ruta, loc))
+            self.conn.execute(
+                'INSERT INTO hallazgos (ejecucion_id, archivo_id, test_id, severidad, '
+                'confianza, linea, descripcion, huella) '
+                'SELECT ?, ?, test_id, severidad, confianza, linea, descripcion, huella '
+                'FROM hallazgos WHERE archivo_id = ? ORDER BY id',
+                (ejecucion_id, cursor.lastrowid, archivo_id))
+            copiados += 1
+        return copiados, totales
+
+    def cerrar_ejecucion(self, ejecucion_id, archivos, totales):
+        self.conn.execute(
+            'UPDATE ejecuciones SET archivos = ?, hallazgos = ?, alta = ?, '
+            'media = ?, baja = ? WHERE id = ?',
+            (archivos, totales['total'], totales['HIGH'], totales['MEDIUM'],
+             totales['LOW'], ejecucion_id))
+        self.conn.commit()
+
+    def ejecuciones(self, limite=20):
+        return self.conn.execute(
+            'SELECT id, fecha, archivos, hallazgos, alta, media, baja '
+            'FROM ejecuciones ORDER BY id DESC LIMIT ?', (limite,)).fetchall()
+
+    def ultima_ejecucion(self):
+        fila = self.conn.execute('SELECT MAX(id) FROM ejecuciones').fetchone()
+        return fila[0]
+
+    def nuevos_desde(self, desde_id, severidad='HIGH', hasta_id=None):
+        """
+        Hallazgos de `severidad` presentes en la ejecución `hasta_id` (por
+        defecto la última) que no existían en la ejecución `desde_id`, en el
+        mismo archivo y con la misma huella
+        """
+        if hasta_id is None:
+            hasta_id = self.ultima_ejecucion()
+        return self.conn.execute("""
+            SELECT a.ruta, h.linea, h.test_id, h.descripcion
+            FROM hallazgos h JOIN archivos a ON a.id = h.archivo_id
+            WHERE h.ejecucion_id = ? AND h.severidad = ?
+              AND NOT EXISTS (
+                  SELECT 1 FROM hallazgos h2 JOIN archivos a2 ON a2.id = h2.archivo_id
+                  WHERE h2.ejecucion_id = ? AND h2.huella = h.huella
+                    AND a2.ruta = a.ruta)
+            ORDER BY a.ruta, h.linea
+        """, (hasta_id, severidad, desde_id)).fetchall()
+
+    def conteos_por_semana(self):
+        """
+        Hallazgos por severidad de la última ejecución de cada semana
+        """
+        return self.conn.execute("""
+            SELECT semana, ejecuciones, alta, media, baja FROM (
+                SELECT strftime('%Y-W%W', fecha) AS semana,
+                       COUNT(*) OVER (PARTITION BY strftime('%Y-W%W', fecha)) AS ejecuciones,
+                       alta, media, baja,
+                       ROW_NUMBER() OVER (PARTITION BY strftime('%Y-W%W', fecha)
+                                          ORDER BY fecha DESC, id DESC) AS orden
+                FROM ejecuciones)
+            WHERE orden = 1
+            ORDER BY semana
+        """).fetchall()
+
+    def cerrar(self):
+        self.conn.close()
+
+
+class Instrumentacion:
+    """
+    Registra el tiempo de pared y de CPU de cada fase del análisis, por
+    archivo y por test de Bandit, muestra las fases, archivos y reglas más
+    lentos y exporta una traza en formato Chrome (chrome://tracing, Perfetto)
+    """
+
     def __init__(self):
+        self.origen = time.perf_counter()
+        self.eventos = []
+        self.reglas = {}
+
+    @contextlib.contextmanager
+    def fase(self, nombre, archivo=None):
+        inicio = time.perf_counter()
+        inicio_cpu = time.process_time()
+        try:
+            yield
+        finally:
+            self.agregar(nombre, inicio, time.perf_counter() - inicio,
+                         time.process_time() - inicio_cpu, archivo)
+
+    def agregar(self, nombre, inicio, duracion, cpu, archivo=None, pid=None):
+        self.eventos.append({'nombre': nombre, 'inicio': inicio,
+                             'duracion': duracion, 'cpu': cpu,
+                             'archivo': archivo, 'pid': pid or os.getpid()})
+
+    def agregar_salida(self, salida):
+        """
+        Incorpora los tiempos medidos por ejecutar_bandit, posiblemente en
+        otro proceso del pool
+        """
+        for nombre, inicio, duracion, cpu in salida.get('eventos') or []:
+            self.agregar(nombre, inicio, duracion, cpu, salida['archivo'],
+                         salida.get('pid'))
+        for test_id, (duracion, cpu, llamadas) in salida.get('reglas', {}).items():
+            acumulado = self.reglas.setdefault(test_id, [0.0, 0.0, 0])
+            acumulado[0] += duracion
+            acumulado[1] += cpu
+            acumulado[2] += llamadas
+
+    def totales(self, clave='nombre'):
+        """
+        {fase: [pared, cpu, veces]} sumando los eventos de todas las
+        ejecuciones; con clave='archivo' agrupa por archivo en su lugar. Con
+        un pool los eventos de los workers se suman, así que la pared total
+        de una fase puede superar la duración del análisis.
+        """
+        totales = {}
+        for evento in self.eventos:
+            if not evento[clave]:
+                continue
+            acumulado = totales.setdefault(evento[clave], [0.0, 0.0, 0])
+            acumulado[0] += evento['duracion']
+            acumulado[1] += evento['cpu']
+            acumulado[2] += 1
+        return totales
+
+    def mostrar_tabla(self, limite=10):
+        fases = self.totales()
+        archivos = self.totales('archivo')
+
+        print(f"\n🔬 PERFIL DEL ANÁLISIS")
+        for titulo, datos in (('Fases', fases),
+                              (f'Top {limite} archivos más lentos', archivos),
+                              (f'Top {limite} reglas más lentas', self.reglas)):
+            if not datos:
+                continue
+            print(f"{'─'*80}")
+            print(f"{titulo:<52} {'Pared (s)':>9} {'CPU (s)':>9} {'Veces':>7}")
+            ordenados = sorted(datos.items(), key=lambda d: d[1][0], reverse=True)
+            for nombre, (duracion, cpu, veces) in ordenados[:limite]:
+                if len(nombre) > 52:
+                    nombre = '…' + nombre[-51:]
+                print(f"{nombre:<52} {duracion:>9.4f} {cpu:>9.4f} {veces:>7}")
+
+    def exportar_traza(self, ruta):
+        """
+        Escribe los eventos en el formato JSON de Chrome Trace
+        """
+        eventos = []
+        for evento in self.eventos:
+            argumentos = {'cpu_ms': round(evento['cpu'] * 1000, 3)}
+            if evento['archivo']:
+                argumentos['archivo'] = evento['archivo']
+            eventos.append({
+                'name': evento['nombre'],
+                'cat': 'archivo' if evento['archivo'] else 'fase',
+                'ph': 'X',
+                'ts': round((evento['inicio'] - self.origen) * 1e6, 1),
+                'dur': round(evento['duracion'] * 1e6, 1),
+                'pid': evento['pid'],
+                'tid': evento['pid'],
+                'args': argumentos,
+            })
+        reglas = {test_id: {'pared_s': round(d, 6), 'cpu_s': round(c, 6), 'llamadas': n}
+                  for test_id, (d, c, n) in self.reglas.items()}
+        with open(ruta, 'w', encoding='utf-8') as f:
+            json.dump({'traceEvents': eventos, 'displayTimeUnit': 'ms',
+                       'otherData': {'reglas_bandit': reglas}}, f)
+        print(f"\n✅ Traza de rendimiento generada: {ruta}")
+
+
+# Dirección por defecto del daemon: socket Unix donde existe, si no TCP local
+DIRECCION_DAEMON = ('.analisis_seguridad.sock' if os.name == 'posix'
+                    else '127.0.0.1:8765')
+
+
+def _direccion_socket(direccion):
+    """
+    (familia, dirección) de socket para una ruta de socket Unix o 'host:puerto'
+    """
+    import socket
+    host, _, puerto = direccion.rpartition(':')
+    if host and puerto.isdigit() and not os.path.exists(direccion):
+        return socket.AF_INET, (host, int(puerto))
+    return socket.AF_UNIX, direccion
+
+
+def _dentro_de(raiz, ruta):
+    """
+    True si `ruta`, con los enlaces simbólicos resueltos, está bajo `raiz`
+    """
+    ruta = os.path.realpath(ruta)
+    return os.path.commonpath([raiz, ruta]) == raiz
+
+
+def _precalentar_bandit(motor):
+    """
+    Importa Bandit y carga su configuración en un worker del pool, para que
+    la primera solicitud no pague ese costo
+    """
+    if motor != 'inproceso':
+        return False
+    try:
+        from bandit.core import config as b_config
+        from bandit.core import manager  # noqa: F401
+    except ImportError:
+        return False
+    if None not in _configs_bandit:
+        _configs_bandit[None] = b_config.BanditConfig()
+    return True
+
+
+class ServidorAnalisis:
+    """
+    Daemon que mantiene Bandit cargado en un pool de procesos y la cache en
+    memoria, y atiende solicitudes de análisis por un socket Unix (o TCP
+    local).
+
+    El protocolo es JSON por líneas: el cliente envía una solicitud y el
+    servidor responde con una línea por hallazgo, una línea de cierre por
+    archivo y una línea final, a medida que cada archivo termina.
+
+    Cualquier proceso local puede conectarse, así que el daemon solo lee
+    archivos bajo `raiz` y nunca escribe reportes: eso lo hace el cliente.
+    El motor, las reglas propias y las opciones de Bandit los elige cada
+    solicitud; `motor` solo indica cuál se precarga en los workers.
+    """
+
+    def __init__(self, direccion=DIRECCION_DAEMON, workers=None, motor='inproceso',
+                 cache=None, max_clientes=8, raiz='.'):
+        import threading
+        self.direccion = direccion
+        self.workers = workers or os.cpu_count() or 1
+        self.motor = motor
+        self.raiz = os.path.realpath(raiz)
+        self.cache = cache
+        self._clientes = threading.BoundedSemaphore(max_clientes)
+        self._candado_cache = threading.Lock()
+        self._candado_pool = threading.Lock()
+        self.pool = None
+
+    def iniciar(self):
+        """
+        Arranca el daemon y bloquea hasta Ctrl+C
+        """
+        import socket
+        from concurrent import futures
+        import signal
+        import socketserver
+
+        familia, direccion = _direccion_socket(self.direccion)
+        if familia == getattr(socket, 'AF_UNIX', None) and os.path.exists(direccion):
+            if ClienteAnalisis(self.direccion).disponible():
+                print(f"⚠️  Ya hay un daemon escuchando en {self.direccion}")
+                return
+            os.remove(direccion)
+
+        self.pool = futures.ProcessPoolExecutor(max_workers=self.workers)
+        calientes = sum(self.pool.map(_precalentar_bandit, [self.motor] * self.workers))
+
+        servidor = self
+
+        class Manejador(socketserver.StreamRequestHandler):
+            def handle(self):
+                servidor._atender(self.rfile, self.wfile)
+
+        if familia == socket.AF_INET:
+            clase = socketserver.ThreadingTCPServer
+            clase.allow_reuse_address = True
+        else:
+            clase = socketserver.ThreadingUnixStreamServer
+        clase.daemon_threads = True
+
+        def detener(*_):
+            raise KeyboardInterrupt
+
+        # SIGTERM (systemd, kill) se trata igual que Ctrl+C para limpiar el socket
+        signal.signal(signal.SIGTERM, detener)
+
+        try:
+            with clase(direccion, Manejador) as srv:
+                print(f"🛰️  Daemon de análisis escuchando en {self.direccion} "
+                      f"({self.workers} worker(s), {calientes} con Bandit precargado, "
+                      f"raíz {self.raiz}). Ctrl+C para detener")
+                srv.serve_forever()
+        except KeyboardInterrupt:
+            print("\n👋 Daemon detenido")
+        finally:
+            self.pool.shutdown(cancel_futures=True)
+            if familia != socket.AF_INET and os.path.exists(direccion):
+                os.remove(direccion)
+
+    def _reconstruir_pool(self, roto):
+        """
+        Reemplaza el pool si un worker murió (BrokenProcessPool); si otro
+        hilo ya lo reemplazó no hace nada
+        """
+        from concurrent import futures
+        with self._candado_pool:
+            if self.pool is roto:
+                print("⚠️  Un worker del daemon terminó de forma inesperada; "
+                      "se reinicia el pool")
+                roto.shutdown(wait=False, cancel_futures=True)
+                self.pool = futures.ProcessPoolExecutor(max_workers=self.workers)
+
+    def _enviar_tarea(self, *argumentos):
+        """
+        Envía ejecutar_bandit al pool y devuelve (pool, futuro), reconstruyendo
+        el pool una vez si está roto
+        """
+        from concurrent.futures.process import BrokenProcessPool
+
+        pool = self.pool
+        try:
+            return pool, pool.submit(ejecutar_bandit, *argumentos)
+        except BrokenProcessPool:
+            self._reconstruir_pool(pool)
+            pool = self.pool
+            return pool, pool.submit(ejecutar_bandit, *argumentos)
+
+    def _validar_solicitud(self, solicitud):
+        """
+        Devuelve (motor, reglas, opciones) de la solicitud o un mensaje de
+        error si no se puede atender tal como la pidió el cliente
+        """
+        motor = solicitud.get('motor', self.motor)
+        if motor not in MOTORES:
+            return f"motor desconocido: {motor}"
+        opciones = solicitud.get('opciones') or {}
+        if not isinstance(opciones, dict) or set(opciones) - set(OPCIONES_BANDIT):
+            return "opciones de Bandit inválidas"
+        opciones = dict(OPCIONES_BANDIT, **opciones)
+        for nivel in ('severidad', 'confianza'):
+            if opciones[nivel] not in (SEVERIDADES if nivel == 'severidad' else CONFIANZAS):
+                return f"{nivel} inválida: {opciones[nivel]}"
+        if opciones['config'] and not _dentro_de(self.raiz, opciones['config']):
+            return f"la configuración de Bandit está fuera de {self.raiz}"
+        return motor, bool(solicitud.get('reglas', False)), opciones
+
+    def _enviar(self, wfile, mensaje):
+        wfile.write(json.dumps(mensaje, ensure_ascii=False).encode('utf-8') + b'\n')
+
+    def _enviar_salida(self, wfile, salida):
+        reporte = salida['reporte'] or {}
+        for issue in reporte.get('results', []):
+            self._enviar(wfile, {'tipo': 'hallazgo', 'archivo': salida['archivo'],
+                                 'hallazgo': issue})
+        self._enviar(wfile, {
+            'tipo': 'archivo', 'archivo': salida['archivo'],
+            'error': salida['error'], 'stdout': salida['stdout'],
+            'stderr': salida['stderr'],
+            'errors': reporte.get('errors', []),
+            'metrics': reporte.get('metrics', {}),
+            'generated_at': reporte.get('generated_at')})
+        wfile.flush()
+
+    def _atender(self, rfile, wfile):
+        from concurrent import futures
+        from concurrent.futures.process import BrokenProcessPool
+
+        with self._clientes:
+            try:
+                solicitud = json.loads(rfile.readline() or b'{}')
+            except ValueError:
+                self._enviar(wfile, {'tipo': 'error', 'mensaje': 'solicitud inválida'})
+                return
+
+            if solicitud.get('tipo') == 'ping':
+                self._enviar(wfile, {'tipo': 'pong', 'motor': self.motor,
+                                     'raiz': self.raiz})
+                return
+
+            validada = self._validar_solicitud(solicitud)
+            if isinstance(validada, str):
+                self._enviar(wfile, {'tipo': 'error', 'mensaje': validada})
+                return
+            motor, reglas, opciones = validada
+            firma = None
+            if self.cache is not None:
+                firma = self.cache.firma(configuracion_cache(motor, reglas, opciones))
+
+            inicio = time.perf_counter()
+            archivos = solicitud.get('archivos', [])
+            futuros = {}
+            for archivo in archivos:
+                if not _dentro_de(self.raiz, archivo):
+                    self._enviar_salida(wfile, {
+                        'archivo': archivo, 'reporte': None, 'error': 'sin_reporte',
+                        'stdout': '', 'stderr': f'el archivo está fuera de {self.raiz}'})
+                    continue
+                clave = reporte = None
+                if self.cache is not None and os.path.exists(archivo):
+                    # El hash lee el archivo completo: se calcula fuera del
+                    # candado para no serializar a los demás clientes
+                    clave = self.cache.clave(archivo, firma)
+                    with self._candado_cache:
+                        reporte = self.cache.obtener(clave, archivo)
+                if reporte is not None:
+                    self._enviar_salida(wfile, {'archivo': archivo, 'reporte': reporte,
+                                                'error': None, 'stdout': '', 'stderr': ''})
+                    continue
+                pool, futuro = self._enviar_tarea(archivo, motor, False, False,
+                                                  reglas, opciones)
+                futuros[futuro] = (archivo, clave, pool)
+
+            for futuro in futures.as_completed(futuros):
+                archivo, clave, pool = futuros[futuro]
+                try:
+                    salida = futuro.result()
+                except Exception as e:
+                    if isinstance(e, BrokenProcessPool):
+                        self._reconstruir_pool(pool)
+                    salida = {'archivo': archivo, 'reporte': None, 'error': 'sin_reporte',
+                              'stdout': '', 'stderr': str(e)}
+                if self.cache is not None and clave and salida['reporte'] is not None:
+                    with self._candado_cache:
+                        self.cache.guardar(clave, salida['reporte'])
+                self._enviar_salida(wfile, salida)
+
+            self._enviar(wfile, {'tipo': 'fin', 'archivos': len(archivos),
+                                 'segundos': round(time.perf_counter() - inicio, 6)})
+            wfile.flush()
+
+
+class ClienteAnalisis:
+    """
+    Cliente del daemon: envía los archivos a analizar y devuelve cada
+    resultado con la forma de ejecutar_bandit a medida que llega
+    """
+
+    def __init__(self, direccion=DIRECCION_DAEMON):
+        self.direccion = direccion
+        # Directorio bajo el que el daemon acepta archivos, según su respuesta al ping
+        self.raiz = None
+
+    def _conectar(self, timeout=None):
+        import socket
+        familia, direccion = _direccion_socket(self.direccion)
+        conexion = socket.socket(familia, socket.SOCK_STREAM)
+        conexion.settimeout(timeout)
+        try:
+            conexion.connect(direccion)
+        except OSError:
+            conexion.close()
+            raise
+        return conexion
+
+    def disponible(self):
+        """
+        True si hay un daemon respondiendo en la dirección
+        """
+        import socket
+        familia, direccion = _direccion_socket(self.direccion)
+        if familia != socket.AF_INET and not os.path.exists(direccion):
+            return False
+        try:
+            with self._conectar(timeout=0.5) as conexion, conexion.makefile('rwb') as f:
+                f.write(b'{"tipo": "ping"}\n')
+                f.flush()
+                respuesta = json.loads(f.readline() or b'{}')
+        except (OSError, ValueError):
+            return False
+        self.raiz = respuesta.get('raiz')
+        return respuesta.get('tipo') == 'pong'
+
+    def acepta(self, ruta):
+        """
+        True si el daemon va a aceptar analizar `ruta`
+        """
+        return self.raiz is not None and _dentro_de(self.raiz, ruta)
+
+    def analizar(self, archivos, motor=None, reglas=False, opciones=None):
+        """
+        Envía los archivos al daemon, que los analiza con el motor (None =
+        el que precarga el daemon), las reglas y las opciones indicadas, sin
+        escribir nada en disco
+        """
+        # El daemon puede tener otro directorio de trabajo: se envían rutas
+        # absolutas y se devuelven con el nombre que usó el llamador
+        absolutos = {}
+        for archivo in archivos:
+            absolutos.setdefault(os.path.abspath(archivo), archivo)
+        solicitud = {'tipo': 'analizar', 'archivos': list(absolutos),
+                     'reglas': reglas,
+                     'opciones': dict(OPCIONES_BANDIT, **(opciones or {}))}
+        if motor is not None:
+            solicitud['motor'] = motor
+
+        with self._conectar() as conexion, conexion.makefile('rwb') as f:
+            f.write(json.dumps(solicitud).encode('utf-8') + b'\n')
+            f.flush()
+            hallazgos = {}
+            for linea in f:
+                mensaje = json.loads(linea)
+                if mensaje['tipo'] == 'hallazgo':
+                    hallazgos.setdefault(mensaje['archivo'], []).append(mensaje['hallazgo'])
+                elif mensaje['tipo'] == 'archivo':
+                    original = absolutos.get(mensaje['archivo'], mensaje['archivo'])
+                    reporte = None
+                    if mensaje['error'] is None:
+                        reporte = _reubicar_reporte({
+                            'errors': mensaje['errors'],
+                            'generated_at': mensaje['generated_at'],
+                            'metrics': mensaje['metrics'],
+                            'results': hallazgos.pop(mensaje['archivo'], [])
+                        }, original)
+                    yield {'archivo': original, 'reporte': reporte,
+                           'error': mensaje['error'], 'stdout': mensaje['stdout'],
+                           'stderr': mensaje['stderr'], 'eventos': None, 'reglas': {}}
+                elif mensaje['tipo'] == 'error':
+                    # Solicitud rechazada: ningún archivo se analizó
+                    for original in absolutos.values():
+                        yield {'archivo': original, 'reporte': None,
+                               'error': 'sin_reporte', 'stdout': '',
+                               'stderr': f"el daemon rechazó la solicitud: {mensaje['mensaje']}",
+                               'eventos': None, 'reglas': {}}
+                    break
+                elif mensaje['tipo'] == 'fin':
+                    break
+
+
+class VigilanteArchivos:
+    """
+    Detecta modificaciones en un conjunto de archivos.
+
+    En Linux usa inotify (vía ctypes) sobre los directorios que los
+    contienen, para enterarse también de los editores que guardan
+    renombrando un archivo temporal. Donde inotify no está disponible
+    consulta os.stat cada `intervalo` segundos. Las ráfagas de guardados se
+    agrupan: esperar_cambios() solo devuelve cuando pasan `debounce`
+    segundos sin eventos nuevos.
+    """
+
+    # Constantes de <sys/inotify.h>
+    _IN_CLOSE_WRITE = 0x008
+    _IN_MOVED_TO = 0x080
+    _IN_CREATE = 0x100
+
+    def __init__(self, archivos, debounce=0.3, intervalo=0.5):
+        # Ruta absoluta -> nombre tal como lo pasó el usuario
+        self.archivos = {os.path.abspath(a): a for a in archivos}
+        self.debounce = debounce
+        self.intervalo = intervalo
+        self._fd = None
+        self._directorios = {}
+        self._estados = {}
+        if not self._iniciar_inotify():
+            self._estados = {ruta: self._estado(ruta) for ruta in self.archivos}
+
+    @property
+    def mecanismo(self):
+        return 'inotify' if self._fd is not None else 'polling'
+
+    def _iniciar_inotify(self):
+        if not sys.platform.startswith('linux'):
+            return False
+        try:
+            import ctypes
+            import ctypes.util
+            libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6',
+                               use_errno=True)
+            fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+            if fd < 0:
+                return False
+            mascara = self._IN_CLOSE_WRITE | self._IN_MOVED_TO | self._IN_CREATE
+            for directorio in {os.path.dirname(r) for r in self.archivos}:
+                wd = libc.inotify_add_watch(fd, directorio.encode(), mascara)
+                if wd < 0:
+                    os.close(fd)
+                    return False
+                self._directorios[wd] = directorio
+        except (OSError, AttributeError):
+            return False
+        self._fd = fd
+        return True
+
+    def _estado(self, ruta):
+        try:
+            st = os.stat(ruta)
+            return (st.st_mtime_ns, st.st_size)
+        except OSError:
+            return None
+
+    def _leer_eventos(self, timeout):
+        """
+        Devuelve el conjunto de archivos vigilados que cambiaron en como
+        máximo `timeout` segundos (None = esperar indefinidamente)
+        """
+        limite = None if timeout is None else time.monotonic() + timeout
+
+        if self._fd is not None:
+            import select
+            import struct
+            cambiados = set()
+            while not cambiados:
+                espera = None
+                if limite is not None:
+                    espera = max(0, limite - time.monotonic())
+                listos, _, _ = select.select([self._fd], [], [], espera)
+                if not listos:
+                    break
+                datos = os.read(self._fd, 64 * 1024)
+                desplazamiento = 0
+                while desplazamiento < len(datos):
+                    wd, _, _, largo = struct.unpack_from('iIII', datos, desplazamiento)
+                    inicio = desplazamiento + 16
+                    nombre = datos[inicio:inicio + largo].rstrip(b'\0').decode(
+                        errors='replace')
+                    desplazamiento = inicio + largo
+                    # Los eventos de otros archivos del directorio se ignoran
+                    ruta = os.path.join(self._directorios.get(wd, ''), nombre)
+                    if ruta in self.archivos:
+                        cambiados.add(ruta)
+            return cambiados
+
+        while True:
+            cambiados = set()
+            for ruta in self.archivos:
+                estado = self._estado(ruta)
+                if estado != self._estados.get(ruta):
+                    self._estados[ruta] = estado
+                    cambiados.add(ruta)
+            if cambiados:
+                return cambiados
+            if limite is not None and time.monotonic() >= limite:
+                return set()
+            espera = self.intervalo
+            if limite is not None:
+                espera = max(0, min(espera, limite - time.monotonic()))
+            time.sleep(espera)
+
+    def esperar_cambios(self):
+        """
+        Bloquea hasta que cambie algún archivo y devuelve los nombres de
+        todos los que cambiaron durante la ráfaga
+        """
+        cambiados = self._leer_eventos(None)
+        while True:
+            mas = self._leer_eventos(self.debounce)
+            if not mas:
+                break
+            cambiados |= mas
+        return [self.archivos[r] for r in self.archivos if r in cambiados]
+
+    def cerrar(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+
+def mostrar_omitidos(omitidos):
+    """
+    Lista los archivos generados que se saltaron al descubrir los objetivos
+    """
+    if omitidos:
+        print(f"\n⏭️  {len(omitidos)} archivo(s) generado(s) omitido(s):")
+        for ruta in omitidos:
+            print(f"   - {ruta}")
+
+
+class AnalizadorSeguridad:
+    def __init__(self, workers=1, motor='subproceso', guardar_json=True,
+                 cache=None, ndjson=None, conservar_resultados=True,
+                 directorio_html='reporte_seguridad', historial=None,
+                 instrumentacion=None, daemon=None, reglas=False,
+                 memoria_max=None, guardar_binario=False, opciones_bandit=None):
         self.resultados = {
             'app_vulnerable': None,
             'app_segura': None,
             'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
         }
+        # Número de procesos para analizar varios archivos a la vez
+        self.workers = workers or os.cpu_count() or 1
+        # 'subproceso' lanza `python -m bandit` por archivo; 'inproceso'
+        # usa la API de Bandit sin salir del intérprete
+        self.motor = motor
+        # Escribir <archivo>_bandit_report.json junto a cada archivo
+        self.guardar_json = guardar_json
+        # Escribir también <archivo>_bandit_report.rsb (formato binario comprimido)
+        self.guardar_binario = guardar_binario
+        # CacheEscaneo opcional para no reanalizar archivos sin cambios
+        self.cache = cache
+        # EscritorNDJSON opcional que recibe cada hallazgo al producirse
+        self.ndjson = ndjson
+        # Con False solo se guardan los totales de cada archivo, de modo que
+        # la memoria no crece con el número de hallazgos
+        self.conservar_resultados = conservar_resultados
+        self.totales = {'total': 0, 'HIGH': 0, 'MEDIUM': 0, 'LOW': 0}
+        # Directorio del reporte HTML paginado al analizar objetivos (None = no generarlo)
+        self.directorio_html = directorio_html
+        # HistorialEscaneos opcional donde se registra cada ejecución
+        self.historial = historial
+        self._ejecucion_id = None
+        # Última ejecución registrada y (archivos, totales) copiados de la
+        # anterior en la ejecución abierta, para los reanálisis de --watch
+        self._ultima_ejecucion = None
+        self._copiados = (0, {})
+        # Instrumentacion opcional con los tiempos de cada fase
+        self.instrumentacion = instrumentacion
+        # ClienteAnalisis opcional: si hay un daemon corriendo se le delega
+        # la ejecución de Bandit (y su cache)
+        self.daemon = daemon
+        # Ejecutar también las reglas propias de MotorReglas en cada archivo
+        self.reglas = reglas
+        # Configuración, perfil y niveles mínimos de Bandit (ver OPCIONES_BANDIT)
+        self.opciones_bandit = dict(OPCIONES_BANDIT, **(opciones_bandit or {}))
+        # Presupuesto de memoria residente en bytes: al superarlo los reportes
+        # por archivo se guardan en disco (ReportesAcotados)
+        self.memoria_max = memoria_max
+        # Primera página del reporte paginado de cada archivo, para enlazarla
+        # desde el reporte comparativo
+        self.paginas_html = {}
+
+    def _fase(self, nombre, archivo=None):
+        if self.instrumentacion is None:
+            return contextlib.nullcontext()
+        return self.instrumentacion.fase(nombre, archivo)
 
     def analizar_archivo(self, archivo):
         """
         Analiza un archivo Python con Bandit
         """
+        try:
+            if self.daemon is not None:
+                for salida in self._analizar_en_daemon([archivo]):
+                    return self._procesar_salida(salida)
+                return None
+
+            clave, salida = self._salida_desde_cache(archivo)
+            if salida is None:
+                salida = ejecutar_bandit(archivo, self.motor, self.guardar_json,
+                                         self.instrumentacion is not None,
+                                         self.reglas, self.opciones_bandit)
+                self._guardar_en_cache(clave, salida)
+            return self._procesar_salida(salida)
+
+        except Exception as e:
+            print(f"❌ Error al analizar {archivo}: {str(e)}")
+            import traceback
+            traceback.print_exc()
+            return None
+
+    def _analizar_en_daemon(self, archivos):
+        """
+        Analiza en el daemon con la configuración de este analizador; el
+        daemon no escribe archivos, así que el JSON se guarda aquí
+        """
+        for salida in self.daemon.analizar(archivos, self.motor, self.reglas,
+                                           self.opciones_bandit):
+            if self.guardar_json and salida['reporte'] is not None:
+                with self._fase('escritura_json', salida['archivo']):
+                    with open(ruta_reporte_json(salida['archivo']), 'w',
+                              encoding='utf-8') as f:
+                        json.dump(salida['reporte'], f, indent=2)
+            yield salida
+
+    def _salida_desde_cache(self, archivo):
+        """
+        Busca un archivo en la cache. Devuelve (clave, salida), donde salida
+        tiene la forma de ejecutar_bandit o es None si no hubo acierto
+        """
+        if self.cache is None or not os.path.exists(archivo):
+            return None, None
+
+        with self._fase('cache', archivo):
+            clave = self.cache.clave(archivo)
+            reporte = self.cache.obtener(clave, archivo)
+        if reporte is None:
+            return clave, None
+
+        if self.guardar_json and not os.path.exists(ruta_reporte_json(archivo)):
+            with open(ruta_reporte_json(archivo), 'w', encoding='utf-8') as f:
+                json.dump(reporte, f, indent=2)
+
+        return clave, {'archivo': archivo, 'reporte': reporte,
+                       'error': None, 'stdout': '', 'stderr': ''}
+
+    def _guardar_en_cache(self, clave, salida):
+        if self.cache is not None and clave and salida['reporte'] is not None:
+            with self._fase('cache', salida['archivo']):
+                self.cache.guardar(clave, salida['reporte'])
+
+    def _procesar_salida(self, salida):
+        """
+        Muestra en consola la salida de ejecutar_bandit y devuelve el reporte
+        """
+        archivo = salida['archivo']
         print(f"\n{'='*80}")
         print(f"Analizando: {archivo}")
         print(f"{'='*80}\n")
 
-        try:
-            # Verificar que el archivo existe
-            if not os.path.exists(archivo):
-                print(f"❌ Error: El archivo {archivo} no existe")
-                return None
+        if salida['error'] == 'no_existe':
+            print(f"❌ Error: El archivo {archivo} no existe")
+            return None
 
-            # Ejecutar Bandit con formato JSON como módulo de Python
-            cmd = [
-                sys.executable,
-                '-m', 'bandit',
-                '-f', 'json',
-                '-o', f'{archivo}_bandit_report.json',
-                archivo
-            ]
-
-            resultado = subprocess.run(
-                cmd,
-                capture_output=True,
-                text=True
-            )
-
-            # Verificar si hubo un error al ejecutar
-            if resultado.returncode == 1:
-                # Código 1 de Bandit significa que encontró problemas (es normal)
-                pass
-            elif "No module named" in resultado.stderr or "No module named" in resultado.stdout:
-                print("❌ Error: Bandit no está instalado.")
-                print("Instala las dependencias con: pip install -r requirements.txt")
-                sys.exit(1)
+        if salida['error'] == 'sin_bandit':
+            print("❌ Error: Bandit no está instalado.")
+            print("Instala las dependencias con: pip install -r requirements.txt")
+            sys.exit(1)
 
-            # Leer el reporte JSON
-            if not os.path.exists(f'{archivo}_bandit_report.json'):
-                print(f"❌ Error: No se pudo generar el reporte para {archivo}")
-                print(f"Salida del comando: {resultado.stdout}")
-                print(f"Errores: {resultado.stderr}")
-                return None
+        if salida['error'] == 'sin_reporte':
+            print(f"❌ Error: No se pudo generar el reporte para {archivo}")
+            print(f"Salida del comando: {salida['stdout']}")
+            print(f"Errores: {salida['stderr']}")
+            return None
+
+        reporte = salida['reporte']
+        if self.instrumentacion is not None:
+            self.instrumentacion.agregar_salida(salida)
+
+        if self.ndjson is not None:
+            with self._fase('ndjson', archivo):
+                self.ndjson.escribir(reporte)
+        if self.guardar_binario:
+            with self._fase('escritura_binaria', archivo):
+                escribir_reporte_binario(reporte, ruta_reporte_binario(archivo))
+        if self._ejecucion_id is not None:
+            with self._fase('historial', archivo):
+                self.historial.registrar_archivo(self._ejecucion_id, archivo, reporte)
+        self._acumular_totales(reporte)
+
+        # Mostrar resumen en consola
+        with self._fase('resumen', archivo):
+            self.mostrar_resumen(reporte, archivo)
+
+        if not self.conservar_resultados:
+            return _aligerar_reporte(reporte)
+        return reporte
+
+    def _iniciar_ejecucion(self, copiar_desde=None, cambiados=()):
+        """
+        Reinicia los totales y, con historial, abre una ejecución en la que
+        _procesar_salida registra cada archivo analizado. Con `copiar_desde`
+        la ejecución parte de los archivos de esa ejecución, salvo los
+        `cambiados`, así un reanálisis parcial queda como una foto completa
+        """
+        self.totales = {'total': 0, 'HIGH': 0, 'MEDIUM': 0, 'LOW': 0}
+        self._copiados = (0, {})
+        if self.historial is not None:
+            self._ejecucion_id = self.historial.iniciar_ejecucion(
+                datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+            if copiar_desde is not None:
+                self._copiados = self.historial.copiar_archivos(
+                    self._ejecucion_id, copiar_desde, cambiados)
+
+    def _cerrar_ejecucion(self, reportes):
+        """
+        Guarda los totales de la ejecución abierta por _iniciar_ejecucion
+        """
+        if self._ejecucion_id is None:
+            return
+        copiados, totales_copiados = self._copiados
+        analizados = sum(1 for r in _reportes_aligerados(reportes) if r) + copiados
+        totales = {clave: valor + totales_copiados.get(clave, 0)
+                   for clave, valor in self.totales.items()}
+        self.historial.cerrar_ejecucion(self._ejecucion_id, analizados, totales)
+        print(f"\n🗃️  Ejecución #{self._ejecucion_id} registrada en "
+              f"{self.historial.ruta}")
+        self._ultima_ejecucion = self._ejecucion_id
+        self._ejecucion_id = None
+
+    def _acumular_totales(self, reporte):
+        tabla = TablaHallazgos.de_reporte(reporte)
+        conteo = tabla.conteo('severidad')
+        self.totales['total'] += len(tabla)
+        for sev in SEVERIDADES:
+            self.totales[sev] += conteo[sev]
+
+    def analizar_archivos(self, archivos):
+        """
+        Analiza varios archivos repartiéndolos en un pool de procesos.
+
+        Si recibe una lista, los archivos más grandes se envían primero para
+        que uno grande no quede solo al final de la ejecución. Si recibe un
+        iterador (por ejemplo descubrir_archivos) cada archivo se envía al
+        pool en cuanto aparece, sin esperar a que termine el descubrimiento.
+        Devuelve un diccionario archivo -> reporte en el orden recibido.
+        """
+        en_lista = isinstance(archivos, (list, tuple))
+        if en_lista:
+            orden = sorted(archivos, key=_tamano_archivo, reverse=True)
+        else:
+            orden = archivos
+        recibidos = []
+        reportes = {} if self.memoria_max is None else ReportesAcotados(self.memoria_max)
+        self._iniciar_ejecucion()
+        inicio = time.perf_counter()
+
+        try:
+            if self.daemon is not None:
+                # El daemon reparte entre sus workers y responde archivo a archivo
+                orden = list(orden)
+                recibidos.extend(orden)
+                for salida in self._analizar_en_daemon(orden):
+                    reportes[salida['archivo']] = self._procesar_salida(salida)
+                for archivo in orden:
+                    reportes.setdefault(archivo, None)
+            elif self.workers <= 1 or (en_lista and len(archivos) <= 1):
+                for archivo in orden:
+                    recibidos.append(archivo)
+                    reportes[archivo] = self.analizar_archivo(archivo)
+            else:
+                self._analizar_en_pool(orden, en_lista, archivos, recibidos, reportes)
+        except BaseException:
+            # Si la ejecución no termina nadie más va a cerrar los reportes
+            _cerrar_reportes(reportes)
+            raise
+
+        duracion = time.perf_counter() - inicio
+        if isinstance(reportes, ReportesAcotados):
+            reportes.reordenar(recibidos)
+        else:
+            reportes = {archivo: reportes[archivo] for archivo in recibidos}
+        self._cerrar_ejecucion(reportes)
+        if not isinstance(reportes, ReportesAcotados):
+            # Con presupuesto de memoria no se arma el reporte combinado
+            self.resultados['combinado'] = combinar_reportes(reportes.values())
+        self.mostrar_rendimiento(reportes, duracion)
+        return reportes
 
-            with open(f'{archivo}_bandit_report.json', 'r', encoding='utf-8') as f:
-                reporte = json.load(f)
+    def _analizar_en_pool(self, orden, en_lista, archivos, recibidos, reportes):
+        import queue
+        from concurrent import futures
+        workers = min(self.workers, len(archivos)) if en_lista else self.workers
+        terminados = queue.Queue()
+        pendientes = 0
+        # Con presupuesto de memoria los workers dejan el reporte completo
+        # en disco y solo devuelven su versión sin hallazgos
+        derivar = reportes.directorio if isinstance(reportes, ReportesAcotados) else None
+        with futures.ProcessPoolExecutor(max_workers=workers) as pool:
+            for archivo in orden:
+                recibidos.append(archivo)
+                # Los aciertos de cache se resuelven aquí; solo los fallos van al pool
+                clave, salida = self._salida_desde_cache(archivo)
+                if salida is not None:
+                    reportes[archivo] = self._procesar_salida(salida)
+                else:
+                    futuro = pool.submit(ejecutar_bandit, archivo,
+                                         self.motor, self.guardar_json,
+                                         self.instrumentacion is not None,
+                                         self.reglas, self.opciones_bandit,
+                                         derivar)
+                    futuro.add_done_callback(
+                        lambda f, a=archivo, c=clave: terminados.put((f, a, c)))
+                    pendientes += 1
 
-            # Mostrar resumen en consola
-            self.mostrar_resumen(reporte, archivo)
+                # Mostrar lo que ya terminó mientras se siguen descubriendo archivos
+                while not terminados.empty():
+                    self._recoger_futuro(*terminados.get(), reportes)
+                    pendientes -= 1
 
-            return reporte
+            while pendientes:
+                self._recoger_futuro(*terminados.get(), reportes)
+                pendientes -= 1
 
+    def _recoger_futuro(self, futuro, archivo, clave, reportes):
+        try:
+            salida = futuro.result()
+            if salida.get('derivado'):
+                salida['reporte']['results'] = _ResultadosDerivados(*salida.pop('derivado'))
+            self._guardar_en_cache(clave, salida)
+            reportes[archivo] = self._procesar_salida(salida)
         except Exception as e:
             print(f"❌ Error al analizar {archivo}: {str(e)}")
-            import traceback
-            traceback.print_exc()
-            return None
+            reportes[archivo] = None
+
+    def mostrar_rendimiento(self, reportes, duracion):
+        """
+        Muestra archivos/segundo y líneas de código/segundo de un análisis
+        """
+        analizados = [r for r in _reportes_aligerados(reportes) if r]
+        total_loc = sum(r.get('metrics', {}).get('_totals', {}).get('loc', 0)
+                        for r in analizados)
+        duracion = max(duracion, 1e-9)
+
+        print(f"\n⏱️  RENDIMIENTO ({self.workers} worker(s))")
+        print(f"{'─'*80}")
+        print(f"Archivos analizados: {len(analizados)} de {len(reportes)}")
+        print(f"Tiempo total: {duracion:.2f} s")
+        print(f"Archivos/segundo: {len(analizados) / duracion:.2f}")
+        print(f"LOC/segundo: {total_loc / duracion:.1f}")
+
+        if self.cache is not None:
+            consultas = self.cache.aciertos + self.cache.fallos
+            ratio = (self.cache.aciertos / consultas * 100) if consultas else 0
+            print(f"Cache: {self.cache.aciertos} aciertos, {self.cache.fallos} fallos "
+                  f"({ratio:.1f}% aciertos), {self.cache.desalojos} desalojos")
+
+        if isinstance(reportes, ReportesAcotados):
+            print(f"Memoria: {reportes.desbordados} reportes desbordados a disco "
+                  f"(RSS máximo {reportes.rss_maximo / 1024 / 1024:.1f} MB de "
+                  f"{reportes.presupuesto / 1024 / 1024:.1f} MB)")
 
     def mostrar_resumen(self, reporte, archivo):
         """
         Muestra un resumen de las vulnerabilidades encontradas
         """
-        resultados = reporte.get('results', [])
+        tabla = TablaHallazgos.de_reporte(reporte)
         metricas = reporte.get('metrics', {})
 
         print(f"\n📊 RESUMEN DEL ANÁLISIS: {archivo}")
@@ -88,21 +3146,13 @@ class AnalizadorSeguridad:
 
         # Estadísticas generales
         total_loc = metricas.get('_totals', {}).get('loc', 0)
-        total_issues = len(resultados)
+        total_issues = len(tabla)
 
         print(f"Total de problemas encontrados: {total_issues}")
 
         # Clasificar por severidad
-        severidades = {'HIGH': 0, 'MEDIUM': 0, 'LOW': 0}
-        confianzas = {'HIGH': 0, 'MEDIUM': 0, 'LOW': 0}
-
-        for issue in resultados:
-            sev = issue.get('issue_severity', 'UNKNOWN')
-            conf = issue.get('issue_confidence', 'UNKNOWN')
-            if sev in severidades:
-                severidades[sev] += 1
-            if conf in confianzas:
-                confianzas[conf] += 1
+        severidades = tabla.conteo('severidad')
+        confianzas = tabla.conteo('confianza')
 
         print(f"\nPor severidad:")
         print(f"  🔴 Alta:    {severidades['HIGH']}")
@@ -115,17 +3165,12 @@ class AnalizadorSeguridad:
         print(f"  Baja:    {confianzas['LOW']}")
 
         # Mostrar detalles de las vulnerabilidades
-        if resultados:
+        if total_issues:
             print(f"\n🔍 VULNERABILIDADES DETECTADAS:")
             print(f"{'─'*80}\n")
 
-            for i, issue in enumerate(resultados, 1):
-                severidad = issue.get('issue_severity', 'UNKNOWN')
-                confianza = issue.get('issue_confidence', 'UNKNOWN')
-                linea = issue.get('line_number', 'N/A')
-                texto = issue.get('issue_text', 'Sin descripción')
-                test_id = issue.get('test_id', 'N/A')
-
+            for i, (linea, test_id, severidad, confianza, texto) in enumerate(
+                    tabla.filas(), 1):
                 # Emoji según severidad
                 emoji = '🔴' if severidad == 'HIGH' else '🟡' if severidad == 'MEDIUM' else '🟢'
 
@@ -142,298 +3187,205 @@ class AnalizadorSeguridad:
         """
         Compara los resultados entre app vulnerable y segura
         """
+        with self._fase('comparacion'):
+            self.comparar_reportes(self.resultados['app_vulnerable'],
+                                   self.resultados['app_segura'],
+                                   'app_vulnerable.py', 'app_segura.py')
+
+    def comparar_reportes(self, antes, despues, nombre_antes, nombre_despues):
+        """
+        Compara dos reportes hallazgo por hallazgo usando sus huellas, de
+        modo que el emparejamiento no depende de los números de línea
+        """
         print(f"\n{'='*80}")
-        print("COMPARACIÓN: Aplicación Vulnerable vs Segura")
+        print(f"COMPARACIÓN: {nombre_antes} vs {nombre_despues}")
         print(f"{'='*80}\n")
 
-        vuln_issues = len(self.resultados['app_vulnerable'].get('results', []))
-        segura_issues = len(self.resultados['app_segura'].get('results', []))
+        tabla_antes = TablaHallazgos.de_reporte(antes)
+        tabla_despues = TablaHallazgos.de_reporte(despues)
+        vuln_issues = len(tabla_antes)
+        segura_issues = len(tabla_despues)
 
         mejora = vuln_issues - segura_issues
         porcentaje = (mejora / vuln_issues * 100) if vuln_issues > 0 else 0
 
-        print(f"Vulnerabilidades en app_vulnerable.py: {vuln_issues}")
-        print(f"Vulnerabilidades en app_segura.py: {segura_issues}")
+        print(f"Vulnerabilidades en {nombre_antes}: {vuln_issues}")
+        print(f"Vulnerabilidades en {nombre_despues}: {segura_issues}")
         print(
             f"\n✨ Mejora: {mejora} vulnerabilidades corregidas ({porcentaje:.1f}% reducción)")
 
         # Identificar qué vulnerabilidades fueron corregidas
-        vuln_tests = set(
-            issue['test_id'] for issue in self.resultados['app_vulnerable'].get('results', []))
-        segura_tests = set(
-            issue['test_id'] for issue in self.resultados['app_segura'].get('results', []))
-
-        corregidas = vuln_tests - segura_tests
-        persistentes = vuln_tests & segura_tests
-        nuevas = segura_tests - vuln_tests
-
-        if corregidas:
-            print(f"\n✅ Tipos de vulnerabilidades corregidas:")
-            for test_id in corregidas:
-                print(f"   - {test_id}")
-
-        if persistentes:
-            print(f"\n⚠️  Tipos de vulnerabilidades persistentes:")
-            for test_id in persistentes:
-                print(f"   - {test_id}")
-
-        if nuevas:
-            print(f"\n❗ Nuevos problemas introducidos:")
-            for test_id in nuevas:
-                print(f"   - {test_id}")
+        diferencia = diferenciar_hallazgos(tabla_antes, tabla_despues)
+
+        if diferencia['corregidas']:
+            print(f"\n✅ Vulnerabilidades corregidas ({len(diferencia['corregidas'])}):")
+            for fila in diferencia['corregidas']:
+                print(f"   - {tabla_antes.describir(fila)}")
+
+        if diferencia['persistentes']:
+            print(f"\n⚠️  Vulnerabilidades persistentes ({len(diferencia['persistentes'])}):")
+            for fila in diferencia['persistentes']:
+                print(f"   - {tabla_despues.describir(fila)}")
+
+        if diferencia['nuevas']:
+            print(f"\n❗ Nuevos problemas introducidos ({len(diferencia['nuevas'])}):")
+            for fila in diferencia['nuevas']:
+                print(f"   - {tabla_despues.describir(fila)}")
+
+        return diferencia
 
     def generar_reporte_html(self):
         """
         Genera un reporte HTML comparativo
         """
-        html = f"""
-<!DOCTYPE html>
-<html lang="es">
-<head>
-    <meta charset="UTF-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>Reporte de Análisis de Seguridad - Escenario 4</title>
-    <style>
-        * {{
-            margin: 0;
-            padding: 0;
-            box-sizing: border-box;
-        }}
-        body {{
-            font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif;
-            line-height: 1.6;
-            background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-            padding: 20px;
-            color: #333;
-        }}
-        .container {{
-            max-width: 1200px;
-            margin: 0 auto;
-            background: white;
-            padding: 30px;
-            border-radius: 10px;
-            box-shadow: 0 10px 40px rgba(0,0,0,0.2);
-        }}
-        h1 {{
-            color: #667eea;
-            text-align: center;
-            margin-bottom: 10px;
-            font-size: 2.5em;
-        }}
-        .subtitle {{
-            text-align: center;
-            color: #666;
-            margin-bottom: 30px;
-        }}
-        .timestamp {{
-            text-align: center;
-            color: #999;
-            font-size: 0.9em;
-            margin-bottom: 40px;
-        }}
-        .comparison {{
-            display: grid;
-            grid-template-columns: 1fr 1fr;
-            gap: 20px;
-            margin-bottom: 40px;
-        }}
-        .card {{
-            background: #f8f9fa;
-            padding: 25px;
-            border-radius: 8px;
-            border-left: 5px solid #dc3545;
-        }}
-        .card.secure {{
-            border-left-color: #28a745;
-        }}
-        .card h2 {{
-            margin-bottom: 15px;
-            color: #333;
-            font-size: 1.5em;
-        }}
-        .stats {{
-            display: flex;
-            justify-content: space-around;
-            margin: 20px 0;
-        }}
-        .stat {{
-            text-align: center;
-        }}
-        .stat-number {{
-            font-size: 3em;
-            font-weight: bold;
-            color: #667eea;
-        }}
-        .stat-label {{
-            color: #666;
-            font-size: 0.9em;
-        }}
-        .severity {{
-            display: flex;
-            justify-content: space-between;
-            margin: 10px 0;
-            padding: 10px;
-            background: white;
-            border-radius: 5px;
-        }}
-        .severity-high {{ border-left: 4px solid #dc3545; }}
-        .severity-medium {{ border-left: 4px solid #ffc107; }}
-        .severity-low {{ border-left: 4px solid #28a745; }}
-        
-        .vulnerability {{
-            background: white;
-            margin: 10px 0;
-            padding: 15px;
-            border-radius: 5px;
-            border-left: 4px solid #667eea;
-        }}
-        .vuln-header {{
-            display: flex;
-            justify-content: space-between;
-            align-items: center;
-            margin-bottom: 10px;
-        }}
-        .badge {{
-            padding: 4px 12px;
-            border-radius: 12px;
-            font-size: 0.85em;
-            font-weight: bold;
-        }}
-        .badge-high {{
-            background: #dc3545;
-            color: white;
-        }}
-        .badge-medium {{
-            background: #ffc107;
-            color: #333;
-        }}
-        .badge-low {{
-            background: #28a745;
-            color: white;
-        }}
-        .improvement {{
-            background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-            color: white;
-            padding: 30px;
-            border-radius: 10px;
-            text-align: center;
-            margin: 40px 0;
-        }}
-        .improvement h2 {{
-            color: white;
-            margin-bottom: 20px;
-        }}
-        .improvement-number {{
-            font-size: 4em;
-            font-weight: bold;
-            margin: 20px 0;
-        }}
-        .corrected-list {{
-            background: rgba(255,255,255,0.1);
-            padding: 20px;
-            border-radius: 8px;
-            margin-top: 20px;
-            text-align: left;
-        }}
-        .corrected-list h3 {{
-            color: white;
-            margin-bottom: 15px;
-        }}
-        .corrected-item {{
-            background: rgba(255,255,255,0.2);
-            margin: 8px 0;
-            padding: 10px 15px;
-            border-radius: 5px;
-        }}
-        @media (max-width: 768px) {{
-            .comparison {{
-                grid-template-columns: 1fr;
-            }}
-        }}
-    </style>
-</head>
-<body>
-    <div class="container">
-        <h1>🔒 Reporte de Análisis de Seguridad</h1>
-        <div class="subtitle">Escenario 4 - Análisis con Python (Bandit)</div>
-        <div class="timestamp">Generado: {self.resultados['timestamp']}</div>
-        """
-
         # Estadísticas comparativas
-        vuln_results = self.resultados['app_vulnerable'].get('results', [])
-        segura_results = self.resultados['app_segura'].get('results', [])
+        tabla_vuln = TablaHallazgos.de_reporte(self.resultados['app_vulnerable'])
+        tabla_segura = TablaHallazgos.de_reporte(self.resultados['app_segura'])
 
-        vuln_count = len(vuln_results)
-        segura_count = len(segura_results)
+        vuln_count = len(tabla_vuln)
+        segura_count = len(tabla_segura)
         mejora = vuln_count - segura_count
         porcentaje = (mejora / vuln_count * 100) if vuln_count > 0 else 0
 
-        # Sección de mejora
-        html += f"""
+        # El documento se escribe por secciones en lugar de acumularlo
+        with open('reporte_seguridad.html', 'w', encoding='utf-8') as f:
+            f.write(cabecera_html('Reporte de Análisis de Seguridad - Escenario 4',
+                                  self.resultados['timestamp']))
+
+            # Sección de mejora
+            f.write(f"""
         <div class="improvement">
             <h2>✨ Resultados de la Corrección</h2>
             <div class="improvement-number">{mejora}</div>
             <p style="font-size: 1.2em;">Vulnerabilidades corregidas ({porcentaje:.1f}% reducción)</p>
-        """
+        """)
 
-        # Listar vulnerabilidades corregidas
-        vuln_tests = {issue['test_id']: issue['issue_text']
-                      for issue in vuln_results}
-        segura_tests = set(issue['test_id'] for issue in segura_results)
-        corregidas = {k: v for k, v in vuln_tests.items()
-                      if k not in segura_tests}
+            # Listar vulnerabilidades corregidas
+            corregidas = diferenciar_hallazgos(tabla_vuln, tabla_segura)['corregidas']
 
-        if corregidas:
-            html += """
+            if corregidas:
+                f.write("""
             <div class="corrected-list">
                 <h3>Vulnerabilidades Corregidas:</h3>
-            """
-            for test_id, descripcion in corregidas.items():
-                html += f'<div class="corrected-item">✅ {test_id}: {descripcion}</div>'
-            html += "</div>"
+            """)
+                for fila in corregidas:
+                    f.write(f'<div class="corrected-item">✅ '
+                            f'{html.escape(tabla_vuln.describir(fila))}</div>')
+                f.write("</div>")
 
-        html += "</div>"
+            f.write("</div>")
 
-        # Comparación lado a lado
-        html += '<div class="comparison">'
+            # Comparación lado a lado
+            f.write('<div class="comparison">')
 
-        # Aplicación vulnerable
-        html += self._generar_card_html("app_vulnerable.py", vuln_results, "")
+            # Aplicación vulnerable
+            f.write(self._generar_card_html("app_vulnerable.py", tabla_vuln, "",
+                                            self._enlace_paginas('app_vulnerable.py')))
 
-        # Aplicación segura
-        html += self._generar_card_html("app_segura.py",
-                                        segura_results, "secure")
+            # Aplicación segura
+            f.write(self._generar_card_html("app_segura.py",
+                                            tabla_segura, "secure",
+                                            self._enlace_paginas('app_segura.py')))
 
-        html += "</div>"
+            f.write("</div>")
+            f.write(PIE_HTML)
 
-        html += """
-    </div>
-</body>
-</html>
+        print(f"\n✅ Reporte HTML generado: reporte_seguridad.html")
+
+    def generar_reporte_html_multi(self, reportes, directorio='reporte_seguridad',
+                                   por_pagina=200):
+        """
+        Genera un reporte HTML para cualquier número de archivos: un
+        index.html con los totales por archivo y, para cada archivo, páginas
+        con `por_pagina` hallazgos. Las páginas de cada archivo se generan en
+        paralelo en el pool y se escriben al disco hallazgo a hallazgo, sin
+        construir el documento completo en memoria.
         """
+        from concurrent import futures
+        paginas_dir = os.path.join(directorio, 'archivos')
+        os.makedirs(paginas_dir, exist_ok=True)
+        timestamp = self.resultados['timestamp']
 
-        with open('reporte_seguridad.html', 'w', encoding='utf-8') as f:
-            f.write(html)
+        # Las páginas de una ejecución anterior con más archivos o hallazgos
+        # no se sobrescriben: se borran para no dejar enlaces a datos viejos
+        for nombre in os.listdir(paginas_dir):
+            if fnmatch.fnmatch(nombre, '[0-9][0-9][0-9][0-9][0-9]_*.html'):
+                os.remove(os.path.join(paginas_dir, nombre))
 
-        print(f"\n✅ Reporte HTML generado: reporte_seguridad.html")
+        # Las tareas se generan de a una para que con ReportesAcotados solo se
+        # lean del disco los reportes que se están escribiendo
+        tareas = ((indice, archivo, reporte.get('results', []))
+                  for indice, (archivo, reporte) in enumerate(reportes.items())
+                  if reporte)
+        filas = []
+        if self.workers <= 1 or len(reportes) <= 1:
+            for tarea in tareas:
+                filas.append(escribir_paginas_archivo(
+                    paginas_dir, *tarea, por_pagina, timestamp))
+        else:
+            workers = min(self.workers, len(reportes))
+            with futures.ProcessPoolExecutor(max_workers=workers) as pool:
+                futuros = collections.deque()
+                for tarea in tareas:
+                    futuros.append(pool.submit(escribir_paginas_archivo, paginas_dir,
+                                               *tarea, por_pagina, timestamp))
+                    if len(futuros) >= self.workers * 2:
+                        filas.append(futuros.popleft().result())
+                filas.extend(futuro.result() for futuro in futuros)
+
+        self.paginas_html = {fila['archivo']: os.path.join(paginas_dir,
+                                                          f"{fila['prefijo']}_1.html")
+                             for fila in filas}
 
-    def _generar_card_html(self, nombre, resultados, clase_extra=""):
+        indice_html = os.path.join(directorio, 'index.html')
+        with open(indice_html, 'w', encoding='utf-8') as f:
+            f.write(cabecera_html('Reporte de Análisis de Seguridad', timestamp))
+            total = sum(fila['total'] for fila in filas)
+            f.write('<div class="stats">')
+            for etiqueta, valor in (('Archivos', len(filas)), ('Total Issues', total)):
+                f.write(f'<div class="stat"><div class="stat-number">{valor}</div>'
+                        f'<div class="stat-label">{etiqueta}</div></div>')
+            f.write('</div>')
+
+            f.write('<table class="tabla"><tr><th>Archivo</th><th>Total</th>'
+                    '<th>Alta</th><th>Media</th><th>Baja</th><th>Páginas</th></tr>')
+            for fila in sorted(filas, key=lambda fl: (-fl['HIGH'], -fl['total'])):
+                enlace = f"archivos/{fila['prefijo']}_1.html"
+                f.write(f'<tr><td><a href="{enlace}">{html.escape(fila["archivo"])}</a></td>'
+                        f'<td>{fila["total"]}</td><td>{fila["HIGH"]}</td>'
+                        f'<td>{fila["MEDIUM"]}</td><td>{fila["LOW"]}</td>'
+                        f'<td>{fila["paginas"]}</td></tr>')
+            f.write('</table>')
+            f.write(PIE_HTML)
+
+        print(f"\n✅ Reporte HTML generado: {indice_html} "
+              f"({sum(fl['paginas'] for fl in filas)} páginas de archivos)")
+        return indice_html
+
+    def _enlace_paginas(self, nombre):
+        """
+        Enlace relativo a reporte_seguridad.html de la primera página del
+        reporte paginado del archivo `nombre`, o None si no se generó
         """
-        Genera HTML para una tarjeta de aplicación
+        for archivo, ruta in self.paginas_html.items():
+            if os.path.basename(archivo) == nombre:
+                return os.path.relpath(ruta).replace(os.sep, '/')
+        return None
+
+    def _generar_card_html(self, nombre, tabla, clase_extra="", enlace=None):
+        """
+        Genera HTML para una tarjeta de aplicación a partir de su TablaHallazgos;
+        `enlace` apunta a la lista completa en el reporte paginado
         """
         # Contar por severidad
-        severidades = {'HIGH': 0, 'MEDIUM': 0, 'LOW': 0}
-        for issue in resultados:
-            sev = issue.get('issue_severity', 'UNKNOWN')
-            if sev in severidades:
-                severidades[sev] += 1
+        severidades = tabla.conteo('severidad')
 
         html = f'<div class="card {clase_extra}">'
         html += f'<h2>{"🔴" if not clase_extra else "🟢"} {nombre}</h2>'
 
         html += '<div class="stats">'
         html += '<div class="stat">'
-        html += f'<div class="stat-number">{len(resultados)}</div>'
+        html += f'<div class="stat-number">{len(tabla)}</div>'
         html += '<div class="stat-label">Total Issues</div>'
         html += '</div>'
         html += '</div>'
@@ -451,23 +3403,360 @@ class AnalizadorSeguridad:
         html += '</div>'
 
         # Listar vulnerabilidades
-        if resultados:
-            for issue in resultados[:5]:  # Mostrar solo las primeras 5
-                sev = issue.get('issue_severity', 'UNKNOWN').lower()
-                linea = issue.get('line_number', 'N/A')
-                texto = issue.get('issue_text', 'Sin descripción')
+        if len(tabla):
+            for linea, _, severidad, _, texto in tabla.filas(0, 5):  # Mostrar solo las primeras 5
+                sev = severidad.lower()
 
                 html += f'<div class="vulnerability">'
                 html += f'<div class="vuln-header">'
                 html += f'<span>Línea {linea}</span>'
-                html += f'<span class="badge badge-{sev}">{issue.get("issue_severity", "UNKNOWN")}</span>'
+                html += f'<span class="badge badge-{sev}">{severidad}</span>'
                 html += f'</div>'
                 html += f'<div>{texto}</div>'
                 html += f'</div>'
 
+            if enlace:
+                html += (f'<p><a href="{enlace}">Ver los {len(tabla)} hallazgos '
+                         f'con su código →</a></p>')
+            elif len(tabla) > 5:
+                html += f'<p>… y {len(tabla) - 5} más</p>'
+
         html += '</div>'
         return html
 
+    def vigilar(self, archivos, debounce=0.3):
+        """
+        Analiza los archivos y se queda esperando cambios: cada vez que se
+        guarda alguno vuelve a analizar solo los modificados y actualiza la
+        comparación y el reporte HTML
+        """
+        archivos = list(archivos)
+        reportes = self.analizar_archivos(archivos)
+        vigilante = None
+        try:
+            self._generar_paginas(reportes)
+            self._actualizar_comparacion(reportes)
+
+            vigilante = VigilanteArchivos(archivos, debounce=debounce)
+            print(f"\n👀 Vigilando {len(archivos)} archivo(s) con {vigilante.mecanismo} "
+                  f"(Ctrl+C para salir)")
+            while True:
+                cambiados = vigilante.esperar_cambios()
+                print(f"\n🔄 Cambios detectados: {', '.join(cambiados)}")
+                # Cada reanálisis queda en el historial como una ejecución
+                # completa: los archivos que no cambiaron se copian de la
+                # ejecución anterior
+                self._iniciar_ejecucion(self._ultima_ejecucion, cambiados)
+                nuevos = {archivo: self.analizar_archivo(archivo)
+                          for archivo in cambiados}
+                self._cerrar_ejecucion(nuevos)
+                for archivo, reporte in nuevos.items():
+                    reportes[archivo] = reporte
+                self._generar_paginas(reportes)
+                self._actualizar_comparacion(reportes)
+        except KeyboardInterrupt:
+            print("\n👋 Vigilancia detenida")
+        finally:
+            if vigilante is not None:
+                vigilante.cerrar()
+            _cerrar_reportes(reportes)
+
+    def _generar_paginas(self, reportes):
+        """
+        Regenera el reporte HTML paginado si está activado
+        """
+        if self.directorio_html:
+            with self._fase('reporte_html'):
+                self.generar_reporte_html_multi(reportes, self.directorio_html)
+
+    def _actualizar_comparacion(self, reportes):
+        """
+        Asigna los reportes de las dos aplicaciones y, si ambos están
+        disponibles, vuelve a compararlos y regenera el HTML
+        """
+        for archivo in reportes:
+            nombre = os.path.splitext(os.path.basename(archivo))[0]
+            if nombre in ('app_vulnerable', 'app_segura'):
+                self.resultados[nombre] = reportes[archivo]
+
+        if self.resultados['app_vulnerable'] and self.resultados['app_segura']:
+            self.comparar_resultados()
+            with self._fase('reporte_html'):
+                self.generar_reporte_html()
+
+    def analizar_objetivos(self, objetivos, desde_ref=None, excluir=(),
+                           omitir_generados=False):
+        """
+        Analiza los archivos descubiertos a partir de archivos, directorios,
+        patrones glob o los cambios desde una referencia de git
+        """
+        print("\n" + "="*80)
+        print("🔍 ANÁLISIS DE SEGURIDAD - ESCENARIO 4")
+        print("="*80)
+
+        omitidos = []
+        archivos = descubrir_archivos(objetivos, excluir=excluir,
+                                      desde_ref=desde_ref,
+                                      omitir_generados=omitir_generados,
+                                      omitidos=omitidos)
+        reportes = self.analizar_archivos(archivos)
+        mostrar_omitidos(omitidos)
+        if not reportes:
+            print("\n⚠️  No se encontraron archivos Python para analizar")
+            return
+
+        self.mostrar_totales()
+        try:
+            if self.conservar_resultados:
+                # El paginado va primero para que la comparación pueda enlazarlo
+                self._generar_paginas(reportes)
+                self._actualizar_comparacion(reportes)
+        finally:
+            _cerrar_reportes(reportes)
+        if self.ndjson is not None:
+            print(f"\n📄 {self.ndjson.lineas} hallazgos escritos en "
+                  f"{'stdout' if self.ndjson.destino == '-' else self.ndjson.destino}")
+
+        print("\n" + "="*80)
+        print("✅ ANÁLISIS COMPLETADO")
+        print("="*80)
+
+    def analizar_historial_git(self, referencias=('HEAD',), commits=100, excluir=(),
+                               omitir_generados=False):
+        """
+        Analiza los últimos `commits` commits de `referencias` ejecutando
+        Bandit una sola vez por blob distinto.
+
+        La mayoría de los archivos no cambia entre commits, así que cada
+        contenido se analiza (o se toma de la cache) una vez y su reporte se
+        reparte a todos los commits y rutas que lo contienen. Para cada
+        hallazgo se muestra el commit donde apareció por primera vez y si
+        sigue presente en la punta de cada referencia.
+        """
+        import shutil
+        import subprocess
+        import tempfile
+        print("\n" + "="*80)
+        print("🕰️  ANÁLISIS DEL HISTORIAL DE GIT - ESCENARIO 4")
+        print("="*80)
+
+        lista = commits_git(referencias, commits)
+        if not lista:
+            print("\n⚠️  No se encontraron commits para analizar")
+            return None
+
+        inicio = time.perf_counter()
+        lector = LectorObjetosGit()
+        temporal = tempfile.mkdtemp(prefix='blobs_seguridad_')
+        guardar_json, self.guardar_json = self.guardar_json, False
+        omitidos = set()
+        try:
+            # Árbol de cada commit y blobs distintos (con la primera ruta en que aparecen)
+            with self._fase('arboles_git'):
+                for c in lista:
+                    c['archivos'] = []
+                    for ruta, blob in lector.archivos_python(c['arbol']):
+                        if _excluido(ruta, excluir):
+                            continue
+                        if _es_generado(ruta):
+                            omitidos.add(ruta)
+                            continue
+                        c['archivos'].append((ruta, blob))
+                blobs = {}
+                for c in lista:
+                    for ruta, blob in c['archivos']:
+                        blobs.setdefault(blob, ruta)
+
+            with self._fase('extraccion_blobs'):
+                rutas_blob = {}
+                for blob in blobs:
+                    _, contenido = lector.leer(blob)
+                    if omitir_generados and any(marca in contenido[:512]
+                                                for marca in MARCAS_GENERADO):
+                        omitidos.add(blobs[blob])
+                        continue
+                    ruta = os.path.join(temporal, f'{blob}.py')
+                    with open(ruta, 'wb') as f:
+                        f.write(contenido)
+                    rutas_blob[ruta] = blob
+
+            aciertos = self.cache.aciertos if self.cache is not None else 0
+            hallazgos_blob = {}
+            for ruta, reporte in self._reportes_blobs(list(rutas_blob)):
+                # Hallazgos idénticos del mismo archivo comparten clave: se
+                # guarda el primero y cuántas veces aparece
+                agrupados = {}
+                for issue in reporte.get('results', []):
+                    clave = _clave_hallazgo(issue)
+                    if clave in agrupados:
+                        agrupados[clave][1] += 1
+                    else:
+                        agrupados[clave] = [issue, 1]
+                hallazgos_blob[rutas_blob[ruta]] = [
+                    (clave, issue, cantidad)
+                    for clave, (issue, cantidad) in agrupados.items()]
+            aciertos = (self.cache.aciertos - aciertos) if self.cache is not None else 0
+        finally:
+            self.guardar_json = guardar_json
+            lector.cerrar()
+            shutil.rmtree(temporal, ignore_errors=True)
+
+        # Repartir los hallazgos de cada blob a los commits que lo contienen
+        with self._fase('reparto_commits'):
+            presencia = {}
+            for indice, c in enumerate(lista):
+                conteo = {'total': 0, 'HIGH': 0, 'MEDIUM': 0, 'LOW': 0}
+                for ruta, blob in c['archivos']:
+                    for clave, issue, cantidad in hallazgos_blob.get(blob, ()):
+                        conteo['total'] += cantidad
+                        sev = issue.get('issue_severity', 'UNKNOWN')
+                        if sev in conteo:
+                            conteo[sev] += cantidad
+                        # 'commits' va de índice de commit a cuántas veces aparece
+                        estado = presencia.get((ruta, clave))
+                        if estado is None:
+                            presencia[(ruta, clave)] = {
+                                'ruta': ruta, 'issue': issue, 'commits': {indice: cantidad}}
+                        else:
+                            estado['commits'][indice] = cantidad
+                c['conteo'] = conteo
+                c['archivos'] = len(c['archivos'])
+
+        duracion = time.perf_counter() - inicio
+        puntas = {}
+        for referencia in referencias:
+            sha = subprocess.run(['git', 'rev-parse', f'{referencia}^{{commit}}'],
+                                 capture_output=True, text=True).stdout.strip()
+            puntas[referencia] = next((i for i, c in enumerate(lista)
+                                       if c['commit'] == sha), None)
+
+        self.mostrar_historial_git(lista, presencia, puntas)
+        mostrar_omitidos(sorted(omitidos))
+        print(f"\n⚡ {len(lista)} commits, {sum(c['archivos'] for c in lista)} "
+              f"archivos y {len(blobs)} blobs distintos "
+              f"({len(rutas_blob) - aciertos} analizados con Bandit, "
+              f"{aciertos} desde la cache) en {duracion:.2f}s")
+        return {'commits': lista, 'hallazgos': list(presencia.values())}
+
+    def _reportes_blobs(self, rutas):
+        """
+        Genera (ruta, reporte) para cada archivo de `rutas` sin imprimir el
+        resumen por archivo, usando la cache, el daemon o el pool de procesos
+        """
+        # Los blobs se extraen a un directorio temporal: si queda fuera de
+        # la raíz del daemon se analizan en este proceso
+        if self.daemon is not None and all(self.daemon.acepta(r) for r in rutas):
+            salidas = self.daemon.analizar(rutas, self.motor, self.reglas,
+                                           self.opciones_bandit)
+        else:
+            salidas = self._salidas_locales(rutas)
+
+        for salida in salidas:
+            if salida['error'] == 'sin_bandit':
+                print("❌ Error: Bandit no está instalado.")
+                print("Instala las dependencias con: pip install -r requirements.txt")
+                sys.exit(1)
+            if salida['reporte'] is None:
+                print(f"⚠️  No se pudo analizar el blob {os.path.basename(salida['archivo'])}"
+                      + (f": {salida['stderr'].strip()}" if salida['stderr'] else ''))
+                continue
+            if self.instrumentacion is not None:
+                self.instrumentacion.agregar_salida(salida)
+            yield salida['archivo'], salida['reporte']
+
+    def _salidas_locales(self, rutas):
+        from concurrent import futures
+        medir = self.instrumentacion is not None
+        pendientes = []
+        for ruta in rutas:
+            clave, salida = self._salida_desde_cache(ruta)
+            if salida is not None:
+                yield salida
+            else:
+                pendientes.append((ruta, clave))
+
+        if self.workers <= 1 or len(pendientes) <= 1:
+            for ruta, clave in pendientes:
+                salida = ejecutar_bandit(ruta, self.motor, False, medir, self.reglas,
+                                         self.opciones_bandit)
+                self._guardar_en_cache(clave, salida)
+                yield salida
+            return
+
+        workers = min(self.workers, len(pendientes))
+        with futures.ProcessPoolExecutor(max_workers=workers) as pool:
+            futuros = {pool.submit(ejecutar_bandit, ruta, self.motor, False, medir,
+                                   self.reglas, self.opciones_bandit): (ruta, clave)
+                       for ruta, clave in pendientes}
+            for futuro in futures.as_completed(futuros):
+                ruta, clave = futuros[futuro]
+                # Un blob que rompe a su worker no detiene el resto del historial
+                try:
+                    salida = futuro.result()
+                except Exception as e:
+                    salida = {'archivo': ruta, 'reporte': None, 'error': 'sin_reporte',
+                              'stdout': '', 'stderr': str(e)}
+                self._guardar_en_cache(clave, salida)
+                yield salida
+
+    def mostrar_historial_git(self, lista, presencia, puntas):
+        """
+        Muestra los hallazgos de cada commit y el origen de cada hallazgo
+        """
+        print(f"\n📜 HALLAZGOS POR COMMIT")
+        print(f"{'─'*80}")
+        print(f"{'Commit':<10} {'Fecha':<11} {'Archivos':>8} {'Total':>6} "
+              f"{'Alta':>5} {'Media':>6} {'Baja':>5}  Asunto")
+        for c in lista:
+            conteo = c['conteo']
+            print(f"{c['commit'][:8]:<10} {c['fecha']:<11} {c['archivos']:>8} "
+                  f"{conteo['total']:>6} {conteo['HIGH']:>5} {conteo['MEDIUM']:>6} "
+                  f"{conteo['LOW']:>5}  {c['asunto'][:30]}")
+
+        if not presencia:
+            return
+        orden = {'HIGH': 0, 'MEDIUM': 1, 'LOW': 2}
+        iconos = {'HIGH': '🔴', 'MEDIUM': '🟡', 'LOW': '🟢'}
+        hallazgos = sorted(presencia.values(), key=lambda h: (
+            orden.get(h['issue'].get('issue_severity'), 3), -max(h['commits']), h['ruta']))
+
+        print(f"\n📍 ORIGEN DE LOS HALLAZGOS ({len(hallazgos)})")
+        print(f"{'─'*80}")
+        for h in hallazgos:
+            issue = h['issue']
+            primero = lista[max(h['commits'])]
+            # Veces que aparece en el commit más reciente que lo contiene
+            cantidad = h['commits'][min(h['commits'])]
+            veces = f" (×{cantidad})" if cantidad > 1 else ''
+            print(f"{iconos.get(issue.get('issue_severity'), '⚪')} {h['ruta']}:"
+                  f"{issue.get('line_number', 'N/A')} [{issue.get('test_id', 'N/A')}] "
+                  f"{issue.get('issue_text', '')}{veces}")
+            if max(h['commits']) == len(lista) - 1:
+                print(f"   ya presente en el commit más antiguo analizado "
+                      f"({primero['commit'][:8]}, {primero['fecha']})")
+            else:
+                print(f"   introducido en {primero['commit'][:8]} ({primero['fecha']}): "
+                      f"{primero['asunto']}")
+            estados = []
+            for referencia, indice in puntas.items():
+                if indice is None:
+                    continue
+                marca = '✅ presente' if indice in h['commits'] else '❌ ausente'
+                estados.append(f"{referencia}: {marca}")
+            if estados:
+                print(f"   {' | '.join(estados)}")
+
+    def mostrar_totales(self):
+        """
+        Muestra los totales por severidad acumulados en el último análisis
+        """
+        print(f"\n📊 TOTAL DEL ANÁLISIS")
+        print(f"{'─'*80}")
+        print(f"Total de problemas encontrados: {self.totales['total']}")
+        print(f"  🔴 Alta:    {self.totales['HIGH']}")
+        print(f"  🟡 Media:   {self.totales['MEDIUM']}")
+        print(f"  🟢 Baja:    {self.totales['LOW']}")
+
     def ejecutar_analisis_completo(self):
         """
         Ejecuta el análisis completo de ambas aplicaciones
@@ -476,31 +3765,376 @@ class AnalizadorSeguridad:
         print("🔍 ANÁLISIS DE SEGURIDAD - ESCENARIO 4")
         print("="*80)
 
-        # Analizar aplicación vulnerable
-        self.resultados['app_vulnerable'] = self.analizar_archivo(
-            'app_vulnerable.py')
-
-        # Analizar aplicación segura
-        self.resultados['app_segura'] = self.analizar_archivo('app_segura.py')
+        # Analizar ambas aplicaciones (en paralelo si hay varios workers)
+        reportes = self.analizar_archivos(['app_vulnerable.py', 'app_segura.py'])
+        try:
+            self.resultados['app_vulnerable'] = reportes['app_vulnerable.py']
+            self.resultados['app_segura'] = reportes['app_segura.py']
 
-        # Comparar resultados
-        if self.resultados['app_vulnerable'] and self.resultados['app_segura']:
-            self.comparar_resultados()
-            self.generar_reporte_html()
+            # Comparar resultados
+            if self.resultados['app_vulnerable'] and self.resultados['app_segura']:
+                self._generar_paginas(reportes)
+                self.comparar_resultados()
+                with self._fase('reporte_html'):
+                    self.generar_reporte_html()
+        finally:
+            _cerrar_reportes(reportes)
 
         print("\n" + "="*80)
         print("✅ ANÁLISIS COMPLETADO")
         print("="*80)
         print("\nArchivos generados:")
-        print("  📄 app_vulnerable.py_bandit_report.json")
-        print("  📄 app_segura.py_bandit_report.json")
+        if self.guardar_json:
+            print(f"  📄 {ruta_reporte_json('app_vulnerable.py')}")
+            print(f"  📄 {ruta_reporte_json('app_segura.py')}")
+        if self.guardar_binario:
+            print(f"  📦 {ruta_reporte_binario('app_vulnerable.py')}")
+            print(f"  📦 {ruta_reporte_binario('app_segura.py')}")
         print("  🌐 reporte_seguridad.html")
+        if self.paginas_html:
+            print(f"  🌐 {os.path.join(self.directorio_html, 'index.html')}")
         print("\nAbre reporte_seguridad.html en tu navegador para ver el reporte completo.")
 
 
-def main():
-    analizador = AnalizadorSeguridad()
-    analizador.ejecutar_analisis_completo()
+def resumir_reportes(rutas):
+    """
+    Muestra los hallazgos por severidad de reportes guardados. Con el formato
+    binario los conteos salen del índice, sin descomprimir los hallazgos.
+    """
+    for ruta in rutas:
+        if ruta.endswith('.rsb'):
+            with ReporteBinario(ruta) as binario:
+                conteos = binario.conteos()
+        else:
+            conteos = {}
+            tabla = TablaHallazgos(cargar_reporte_json(ruta).get('results', []))
+            for i in range(len(tabla)):
+                por_archivo = conteos.setdefault(tabla.archivo[i],
+                                                 dict.fromkeys(SEVERIDADES, 0))
+                severidad = tabla.severidad[i]
+                por_archivo[severidad] = por_archivo.get(severidad, 0) + 1
+
+        total = {sev: sum(c.get(sev, 0) for c in conteos.values()) for sev in SEVERIDADES}
+        print(f"\n📊 {ruta}: {sum(sum(c.values()) for c in conteos.values())} hallazgos "
+              f"en {len(conteos)} archivo(s) "
+              f"(🔴 {total['HIGH']} 🟡 {total['MEDIUM']} 🟢 {total['LOW']})")
+        for archivo, c in sorted(conteos.items()):
+            print(f"   {archivo}: 🔴 {c['HIGH']} 🟡 {c['MEDIUM']} 🟢 {c['LOW']}")
+
+
+def consultar_historial(historial, args):
+    """
+    Muestra en consola las consultas sobre el historial de ejecuciones
+    """
+    if args.nuevos_desde is not None:
+        filas = historial.nuevos_desde(args.nuevos_desde, args.severidad)
+        print(f"\n❗ Hallazgos {args.severidad} nuevos desde la ejecución "
+              f"#{args.nuevos_desde}: {len(filas)}")
+        for ruta, linea, test_id, descripcion in filas:
+            print(f"   {ruta}:{linea} [{test_id}] {descripcion}")
+
+    if args.por_semana:
+        print(f"\n📈 Hallazgos por semana (última ejecución de cada semana)")
+        print(f"{'─'*80}")
+        print(f"{'Semana':<10} {'Ejec.':>6} {'Alta':>6} {'Media':>6} {'Baja':>6}")
+        for semana, ejecuciones, alta, media, baja in historial.conteos_por_semana():
+            print(f"{semana:<10} {ejecuciones:>6} {alta:>6} {media:>6} {baja:>6}")
+
+    if args.ejecuciones:
+        print(f"\n🗃️  Últimas ejecuciones")
+        print(f"{'─'*80}")
+        for id_, fecha, archivos, hallazgos, alta, media, baja in historial.ejecuciones():
+            print(f"#{id_:<5} {fecha}  {archivos} archivo(s)  {hallazgos} hallazgos "
+                  f"(🔴 {alta} 🟡 {media} 🟢 {baja})")
+
+
+SUBCOMANDOS = ('scan', 'compare', 'report', 'summary')
+
+
+def _argumentos_scan(parser):
+    parser.add_argument('objetivos', nargs='*',
+                        help='archivos, directorios o patrones glob a analizar '
+                             '(por defecto app_vulnerable.py y app_segura.py)')
+    parser.add_argument('--desde', metavar='REF',
+                        help='analizar solo los archivos que cambiaron desde esta referencia de git')
+    parser.add_argument('--excluir', action='append', default=[], metavar='PATRON',
+                        help='patrón adicional de rutas a excluir (se puede repetir)')
+    parser.add_argument('--omitir-generados', action='store_true',
+                        help='saltar también los archivos con marcas de código generado '
+                             '(@generated, DO NOT EDIT, Generated by) en la cabecera')
+    parser.add_argument('-j', '--workers', type=int, default=1,
+                        help='procesos para analizar en paralelo (0 = uno por CPU)')
+    parser.add_argument('--motor', choices=MOTORES,
+                        help='cómo ejecutar Bandit: un intérprete por archivo '
+                             '(subproceso, por defecto) o su API dentro de este '
+                             'proceso (inproceso); con el daemon, por defecto el '
+                             'que precarga el daemon')
+    parser.add_argument('--reglas', action='store_true',
+                        help='ejecutar también las reglas propias para Flask (FLK001-FLK003)')
+    parser.add_argument('--bandit-config', metavar='RUTA',
+                        help='archivo de configuración de Bandit (tests, skips, perfiles)')
+    parser.add_argument('--bandit-perfil', metavar='NOMBRE',
+                        help='perfil de la configuración de Bandit a usar')
+    parser.add_argument('--nivel-severidad', choices=SEVERIDADES[::-1],
+                        default='LOW', help='severidad mínima de los hallazgos reportados')
+    parser.add_argument('--nivel-confianza', choices=CONFIANZAS[::-1],
+                        default='LOW', help='confianza mínima de los hallazgos reportados')
+    parser.add_argument('--formato', choices=('json', 'binario', 'ambos'), default='json',
+                        help='formato de los reportes por archivo: JSON de Bandit, '
+                             'binario comprimido (.rsb) o ambos')
+    parser.add_argument('--sin-json', action='store_true',
+                        help='no escribir los <archivo>_bandit_report.json intermedios')
+    parser.add_argument('--sin-cache', action='store_true',
+                        help='reanalizar todos los archivos aunque no hayan cambiado')
+    parser.add_argument('--cache-dir', default='.cache_seguridad',
+                        help='directorio de la cache de reportes')
+    parser.add_argument('--cache-max-mb', type=float, default=50,
+                        help='tamaño máximo de la cache antes de desalojar (MB)')
+    parser.add_argument('--memoria-max', type=float, metavar='MB',
+                        help='presupuesto de memoria residente: al superarlo los '
+                             'reportes por archivo se guardan en disco')
+    parser.add_argument('--ndjson', metavar='RUTA',
+                        help='escribir cada hallazgo como una línea JSON en RUTA '
+                             '(- para stdout) a medida que se producen')
+    parser.add_argument('--html-dir', default='reporte_seguridad', metavar='DIR',
+                        help='directorio del reporte HTML paginado al analizar '
+                             'objetivos ("" para no generarlo)')
+    parser.add_argument('--historial', metavar='RUTA',
+                        help='registrar cada ejecución en la base SQLite RUTA '
+                             '(desactivado por defecto)')
+    parser.add_argument('--nuevos-desde', type=int, metavar='EJECUCION',
+                        help='listar los hallazgos nuevos desde esa ejecución y salir')
+    parser.add_argument('--severidad', default='HIGH', choices=('HIGH', 'MEDIUM', 'LOW'),
+                        help='severidad para --nuevos-desde')
+    parser.add_argument('--por-semana', action='store_true',
+                        help='mostrar los hallazgos por severidad de cada semana y salir')
+    parser.add_argument('--ejecuciones', action='store_true',
+                        help='listar las últimas ejecuciones registradas y salir')
+    parser.add_argument('--perfil', action='store_true',
+                        help='medir cada fase, archivo y regla de Bandit y mostrar los más lentos')
+    parser.add_argument('--traza', metavar='RUTA',
+                        help='exportar los tiempos en formato Chrome Trace (implica --perfil)')
+    parser.add_argument('--daemon', action='store_true',
+                        help='iniciar el daemon de análisis con Bandit precargado')
+    parser.add_argument('--socket', default=DIRECCION_DAEMON, metavar='DIRECCION',
+                        help='socket Unix o host:puerto del daemon')
+    parser.add_argument('--sin-daemon', action='store_true',
+                        help='analizar en este proceso aunque haya un daemon corriendo')
+    parser.add_argument('--motor-daemon', choices=MOTORES, default='inproceso',
+                        help='motor de Bandit que el daemon precarga en sus workers '
+                             '(cada solicitud usa el --motor del cliente)')
+    parser.add_argument('--raiz-daemon', default='.', metavar='DIR',
+                        help='el daemon solo analiza archivos bajo DIR '
+                             '(por defecto el directorio actual)')
+    parser.add_argument('--max-clientes', type=int, default=8,
+                        help='solicitudes que el daemon atiende a la vez')
+    parser.add_argument('--cache-memoria', type=int, default=1000, metavar='REPORTES',
+                        help='reportes que el daemon mantiene en memoria')
+    parser.add_argument('--historia-git', type=int, metavar='COMMITS',
+                        help='analizar los últimos COMMITS commits analizando cada '
+                             'blob distinto una sola vez')
+    parser.add_argument('--ramas', nargs='+', default=['HEAD'], metavar='REF',
+                        help='referencias de git para --historia-git (por defecto HEAD)')
+    parser.add_argument('--watch', action='store_true',
+                        help='seguir ejecutándose y reanalizar solo los archivos modificados')
+    parser.add_argument('--debounce', type=float, default=0.3,
+                        help='segundos sin cambios antes de reanalizar (modo --watch)')
+
+
+def comando_scan(args):
+    """
+    Analiza los archivos con Bandit: el pipeline completo de análisis,
+    comparación y reporte HTML
+    """
+    opciones_bandit = {'config': args.bandit_config, 'perfil': args.bandit_perfil,
+                       'severidad': args.nivel_severidad,
+                       'confianza': args.nivel_confianza}
+    cache = None
+    if not args.sin_cache:
+        cache = CacheEscaneo(args.cache_dir,
+                             max_bytes=int(args.cache_max_mb * 1024 * 1024),
+                             configuracion=configuracion_cache(
+                                 args.motor or 'subproceso', args.reglas,
+                                 opciones_bandit),
+                             en_memoria=args.cache_memoria if args.daemon else 0)
+
+    if args.daemon:
+        ServidorAnalisis(args.socket, workers=args.workers, motor=args.motor_daemon,
+                         cache=cache, max_clientes=args.max_clientes,
+                         raiz=args.raiz_daemon).iniciar()
+        return
+
+    historial = None
+    consulta = args.nuevos_desde is not None or args.por_semana or args.ejecuciones
+    if consulta and not args.historial:
+        print("❌ Error: las consultas del historial necesitan --historial RUTA")
+        sys.exit(1)
+    if args.historial:
+        historial = HistorialEscaneos(args.historial)
+        if consulta:
+            consultar_historial(historial, args)
+            historial.cerrar()
+            return
+
+    # Con --ndjson - la salida estándar queda reservada para los hallazgos
+    consola = sys.stderr if args.ndjson == '-' else sys.stdout
+
+    daemon = None
+    motor = args.motor or 'subproceso'
+    if not args.sin_daemon:
+        cliente = ClienteAnalisis(args.socket)
+        if cliente.disponible():
+            # La cache la administra el daemon
+            daemon = cliente
+            cache = None
+            # Sin --motor explícito se deja elegir al daemon
+            motor = args.motor
+            print(f"⚡ Usando el daemon de análisis en {args.socket}", file=consola)
+
+    con_objetivos = bool(args.objetivos) or args.desde is not None
+    instrumentacion = Instrumentacion() if args.perfil or args.traza else None
+    ndjson = EscritorNDJSON(args.ndjson) if args.ndjson else None
+    analizador = AnalizadorSeguridad(workers=args.workers, motor=motor,
+                                     guardar_json=not args.sin_json
+                                     and args.formato != 'binario', cache=cache,
+                                     ndjson=ndjson,
+                                     conservar_resultados=not (ndjson and con_objetivos),
+                                     directorio_html=args.html_dir or None,
+                                     historial=historial,
+                                     instrumentacion=instrumentacion,
+                                     daemon=daemon,
+                                     reglas=args.reglas,
+                                     memoria_max=int(args.memoria_max * 1024 * 1024)
+                                     if args.memoria_max else None,
+                                     guardar_binario=args.formato != 'json',
+                                     opciones_bandit=opciones_bandit)
+
+    try:
+        with contextlib.redirect_stdout(consola):
+            if args.historia_git:
+                analizador.analizar_historial_git(args.ramas, args.historia_git,
+                                                  excluir=args.excluir,
+                                                  omitir_generados=args.omitir_generados)
+            elif args.watch:
+                archivos = ['app_vulnerable.py', 'app_segura.py']
+                if con_objetivos:
+                    omitidos = []
+                    archivos = list(descubrir_archivos(args.objetivos,
+                                                       excluir=args.excluir,
+                                                       desde_ref=args.desde,
+                                                       omitir_generados=args.omitir_generados,
+                                                       omitidos=omitidos))
+                    mostrar_omitidos(omitidos)
+                analizador.vigilar(archivos, debounce=args.debounce)
+            elif con_objetivos:
+                analizador.analizar_objetivos(args.objetivos, desde_ref=args.desde,
+                                              excluir=args.excluir,
+                                              omitir_generados=args.omitir_generados)
+            else:
+                analizador.ejecutar_analisis_completo()
+    finally:
+        if ndjson is not None:
+            ndjson.cerrar()
+        if instrumentacion is not None:
+            with contextlib.redirect_stdout(consola):
+                instrumentacion.mostrar_tabla()
+                if args.traza:
+                    instrumentacion.exportar_traza(args.traza)
+        if historial is not None:
+            historial.cerrar()
+
+
+def comando_compare(args):
+    """
+    Compara dos reportes guardados (.json o .rsb) sin volver a ejecutar Bandit
+    """
+    severidades = set(args.severidad) if args.severidad else None
+    AnalizadorSeguridad().comparar_reportes(cargar_reporte(args.antes, severidades),
+                                            cargar_reporte(args.despues, severidades),
+                                            args.antes, args.despues)
+
+
+def _reportes_por_archivo(reporte):
+    """
+    Separa un reporte guardado (que puede combinar varios archivos) en un
+    reporte por archivo
+    """
+    metricas = reporte.get('metrics', {})
+    por_archivo = {nombre: [] for nombre in metricas if nombre != '_totals'}
+    for issue in reporte.get('results', []):
+        por_archivo.setdefault(issue.get('filename', ''), []).append(issue)
+    return {archivo: {'errors': [], 'metrics': {'_totals': metricas.get(archivo, {})},
+                      'results': resultados}
+            for archivo, resultados in por_archivo.items()}
+
+
+def comando_report(args):
+    """
+    Genera el reporte HTML paginado a partir de reportes guardados y, si
+    están las dos aplicaciones, también el reporte comparativo
+    """
+    reportes = {}
+    for ruta in args.reportes:
+        reportes.update(_reportes_por_archivo(cargar_reporte(ruta)))
+
+    analizador = AnalizadorSeguridad(workers=args.workers)
+    analizador.generar_reporte_html_multi(reportes, args.html_dir)
+    for archivo, reporte in reportes.items():
+        nombre = os.path.splitext(os.path.basename(archivo))[0]
+        if nombre in ('app_vulnerable', 'app_segura'):
+            analizador.resultados[nombre] = reporte
+    if analizador.resultados['app_vulnerable'] and analizador.resultados['app_segura']:
+        analizador.generar_reporte_html()
+
+
+def comando_summary(args):
+    """
+    Muestra los conteos por severidad de reportes guardados
+    """
+    resumir_reportes(args.reportes)
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else list(argv)
+    # Sin subcomando se asume scan, para que los usos anteriores sigan igual
+    if not argv or argv[0] not in SUBCOMANDOS + ('-h', '--help'):
+        argv.insert(0, 'scan')
+
+    parser = argparse.ArgumentParser(
+        description='Análisis de seguridad con Bandit - Escenario 4')
+    subcomandos = parser.add_subparsers(dest='comando', metavar='COMANDO')
+
+    _argumentos_scan(subcomandos.add_parser(
+        'scan', help='analizar archivos con Bandit (comando por defecto)',
+        description='Analiza archivos con Bandit, compara y genera los reportes'))
+
+    compare = subcomandos.add_parser(
+        'compare', help='comparar dos reportes guardados',
+        description='Compara dos reportes guardados (.json o .rsb) hallazgo por hallazgo')
+    compare.add_argument('antes', help='reporte de referencia')
+    compare.add_argument('despues', help='reporte a comparar')
+    compare.add_argument('--severidad', nargs='+', choices=SEVERIDADES,
+                         help='comparar solo estas severidades (en un .rsb solo se '
+                              'descomprimen esas secciones)')
+
+    report = subcomandos.add_parser(
+        'report', help='generar el reporte HTML desde reportes guardados',
+        description='Genera los reportes HTML a partir de reportes guardados (.json o .rsb)')
+    report.add_argument('reportes', nargs='+', metavar='REPORTE')
+    report.add_argument('--html-dir', default='reporte_seguridad', metavar='DIR',
+                        help='directorio del reporte HTML paginado')
+    report.add_argument('-j', '--workers', type=int, default=1,
+                        help='procesos para escribir las páginas en paralelo (0 = uno por CPU)')
+
+    summary = subcomandos.add_parser(
+        'summary', help='mostrar los conteos de reportes guardados',
+        description='Muestra los hallazgos por severidad de reportes guardados (.json o .rsb)')
+    summary.add_argument('reportes', nargs='+', metavar='REPORTE')
+
+    args = parser.parse_args(argv)
+    comandos = {'scan': comando_scan, 'compare': comando_compare,
+                'report': comando_report, 'summary': comando_summary}
+    comandos[args.comando](args)
 
 
 if __name__ == '__main__':
@@ -2,11 +2,19 @@
 Aplicación Web Segura - Escenario 4
 Esta es la versión corregida con las vulnerabilidades remediadas
 """
+import base64
+import collections
+import contextlib
 import os
+import queue
+import re
 import subprocess
 import sqlite3
 import secrets
-from flask import Flask, request, render_template_string, redirect, session
+import threading
+import time
+from urllib.parse import urlencode
+from flask import Flask, request, redirect, session, stream_with_context
 from markupsafe import escape
 import yaml
 import json
@@ -20,36 +28,674 @@ app.secret_key = os.environ.get('SECRET_KEY', secrets.token_hex(32))
 DATABASE_PASSWORD = os.environ.get('DB_PASSWORD', '')
 API_KEY = os.environ.get('API_KEY', '')
 
-# Base de datos en memoria
+# Base de datos: en memoria con cache compartida entre las conexiones del
+# pool, o un archivo si se define DATABASE_PATH
+DATABASE_PATH = os.environ.get('DATABASE_PATH', '')
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', '8'))
+DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', '5'))
+
+
+class PoolConexiones:
+    """
+    Pool de conexiones SQLite para el servidor con varios hilos.
+
+    Cada petición toma una conexión con obtener() y la devuelve al salir del
+    bloque, así nunca dos hilos usan la misma conexión a la vez. Las
+    conexiones se crean a demanda hasta `tamano_max`; si están todas en uso
+    la petición espera hasta `timeout` segundos.
+    """
+
+    def __init__(self, ruta='', tamano_max=8, timeout=5.0):
+        if ruta:
+            self.dsn = ruta
+            self.uri = False
+        else:
+            # Nombre único para que cada pool tenga su propia base en memoria
+            self.dsn = f'file:app_segura_{secrets.token_hex(8)}?mode=memory&cache=shared'
+            self.uri = True
+        self.tamano_max = tamano_max
+        self.timeout = timeout
+        self._libres = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._creadas = 0
+        self._checkouts = 0
+        self._esperas = 0
+        self._timeouts = 0
+        self._espera_total = 0.0
+        self._espera_max = 0.0
+        # Funciones que se llaman cuando una conexión confirma cambios
+        self.al_escribir = []
+        # La base en memoria existe mientras quede alguna conexión abierta
+        self._ancla = self._conectar()
+
+    def _conectar(self):
+        conexion = sqlite3.connect(self.dsn, uri=self.uri, timeout=self.timeout,
+                                   check_same_thread=False)
+        if not self.uri:
+            # WAL: las lecturas no se bloquean con las escrituras ni entre sí
+            conexion.execute('PRAGMA journal_mode=WAL')
+        return conexion
+
+    def _tomar(self):
+        try:
+            return self._libres.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            crear = self._creadas < self.tamano_max
+            if crear:
+                self._creadas += 1
+        if crear:
+            try:
+                return self._conectar()
+            except Exception:
+                with self._lock:
+                    self._creadas -= 1
+                raise
+
+        with self._lock:
+            self._esperas += 1
+        try:
+            return self._libres.get(timeout=self.timeout)
+        except queue.Empty:
+            with self._lock:
+                self._timeouts += 1
+            raise TimeoutError('No hay conexiones libres en el pool')
+
+    @contextlib.contextmanager
+    def obtener(self):
+        """
+        Presta una conexión durante el bloque. Al salir se confirma la
+        transacción abierta, o se deshace si hubo una excepción.
+        """
+        inicio = time.perf_counter()
+        conexion = self._tomar()
+        espera = time.perf_counter() - inicio
+        with self._lock:
+            self._checkouts += 1
+            self._espera_total += espera
+            self._espera_max = max(self._espera_max, espera)
+        cambios = conexion.total_changes
+        try:
+            yield conexion
+            if conexion.in_transaction:
+                conexion.commit()
+        except Exception:
+            conexion.rollback()
+            raise
+        finally:
+            self._libres.put(conexion)
+            if conexion.total_changes != cambios:
+                for funcion in self.al_escribir:
+                    funcion()
+
+    def metricas(self):
+        with self._lock:
+            libres = self._libres.qsize()
+            return {
+                'tamano_max': self.tamano_max,
+                'creadas': self._creadas,
+                'en_uso': self._creadas - libres,
+                'libres': libres,
+                'checkouts': self._checkouts,
+                'esperas': self._esperas,
+                'timeouts': self._timeouts,
+                'espera_media_ms': round(self._espera_total / self._checkouts * 1000, 3)
+                if self._checkouts else 0.0,
+                'espera_max_ms': round(self._espera_max * 1000, 3),
+            }
+
+
+pool = PoolConexiones(DATABASE_PATH, DB_POOL_SIZE, DB_POOL_TIMEOUT)
+
+
+class _Calculo:
+    """
+    Cálculo en curso de una clave de CacheResultados, compartido por todas
+    las peticiones que la piden mientras tanto
+    """
+    __slots__ = ('generacion', 'listo', 'valor', 'error')
+
+    def __init__(self, generacion):
+        self.generacion = generacion
+        self.listo = threading.Event()
+        self.valor = None
+        self.error = None
+
+
+class CacheResultados:
+    """
+    Cache LRU con expiración (TTL) para resultados de consultas.
+
+    Si varias peticiones piden a la vez una clave que no está, solo la
+    primera la calcula y las demás esperan su resultado. invalidar() vacía
+    la cache y descarta lo que se esté calculando con datos anteriores.
+    Con ttl=0 no se guarda nada y solo se agrupan los cálculos simultáneos.
+    """
+
+    def __init__(self, max_entradas=256, ttl=30.0):
+        self.max_entradas = max_entradas
+        self.ttl = ttl
+        self._entradas = collections.OrderedDict()
+        self._en_curso = {}
+        self._generacion = 0
+        self._lock = threading.Lock()
+        self.aciertos = 0
+        self.fallos = 0
+        self.coalescidas = 0
+        self.expiradas = 0
+        self.desalojos = 0
+        self.invalidaciones = 0
+
+    def obtener(self, clave, calcular):
+        """
+        Devuelve el valor guardado para `clave` o lo calcula con `calcular()`
+        """
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada is not None:
+                expira, valor = entrada
+                if expira > time.monotonic():
+                    self._entradas.move_to_end(clave)
+                    self.aciertos += 1
+                    return valor
+                del self._entradas[clave]
+                self.expiradas += 1
+
+            calculo = self._en_curso.get(clave)
+            propio = calculo is None
+            if propio:
+                calculo = self._en_curso[clave] = _Calculo(self._generacion)
+                self.fallos += 1
+            else:
+                self.coalescidas += 1
+
+        if not propio:
+            calculo.listo.wait()
+            if calculo.error is not None:
+                raise calculo.error
+            return calculo.valor
+
+        try:
+            calculo.valor = calcular()
+        except Exception as e:
+            calculo.error = e
+            raise
+        finally:
+            with self._lock:
+                if self._en_curso.get(clave) is calculo:
+                    del self._en_curso[clave]
+                if (calculo.error is None and calculo.generacion == self._generacion
+                        and self.ttl > 0):
+                    self._entradas[clave] = (time.monotonic() + self.ttl, calculo.valor)
+                    while len(self._entradas) > self.max_entradas:
+                        self._entradas.popitem(last=False)
+                        self.desalojos += 1
+            calculo.listo.set()
+        return calculo.valor
+
+    def invalidar(self):
+        with self._lock:
+            self._generacion += 1
+            self._entradas.clear()
+            self._en_curso.clear()
+            self.invalidaciones += 1
+
+    def metricas(self):
+        with self._lock:
+            consultas = self.aciertos + self.fallos + self.coalescidas
+            return {
+                'entradas': len(self._entradas),
+                'max_entradas': self.max_entradas,
+                'ttl': self.ttl,
+                'aciertos': self.aciertos,
+                'fallos': self.fallos,
+                'coalescidas': self.coalescidas,
+                'ratio_aciertos': round(self.aciertos / consultas, 4) if consultas else 0.0,
+                'expiradas': self.expiradas,
+                'desalojos': self.desalojos,
+                'invalidaciones': self.invalidaciones,
+            }
+
+
+# Cache de las páginas de /search; cualquier escritura confirmada en la base
+# (la única tabla que se modifica es users) la invalida
+cache_busqueda = CacheResultados(int(os.environ.get('SEARCH_CACHE_SIZE', '256')),
+                                 float(os.environ.get('SEARCH_CACHE_TTL', '30')))
+pool.al_escribir.append(cache_busqueda.invalidar)
 
 
 def get_db():
-    conn = sqlite3.connect(':memory:')
-    return conn
+    return pool.obtener()
 
 # Inicializar BD
 
 
 def init_db():
-    conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY,
-            username TEXT,
-            password TEXT,
-            email TEXT
-        )
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS users (
+                id INTEGER PRIMARY KEY,
+                username TEXT,
+                password TEXT,
+                email TEXT
+            )
+        ''')
+        crear_indice_busqueda(cursor)
+        cursor.execute(
+            "INSERT OR IGNORE INTO users VALUES (1, 'admin', 'password123', 'admin@example.com')")
+        cursor.execute(
+            "INSERT OR IGNORE INTO users VALUES (2, 'user', 'user123', 'user@example.com')")
+
+# Búsqueda por subcadena: con el índice de trigramas FTS5 el LIKE usa el
+# índice en lugar de recorrer toda la tabla. El índice ignora mayúsculas
+# también fuera de ASCII, así que se vuelve a aplicar el LIKE sobre users
+# para conservar exactamente el resultado de la consulta sin índice
+
+
+SQL_BUSQUEDA_INDICE = """
+    SELECT users.* FROM users_fts JOIN users ON users.id = users_fts.rowid
+    WHERE users_fts.username LIKE ? AND users.username LIKE ? AND users.id > ?
+    ORDER BY users.id LIMIT ?
+"""
+SQL_BUSQUEDA_TABLA = """
+    SELECT * FROM users WHERE username LIKE ? AND id > ? ORDER BY id LIMIT ?
+"""
+indice_trigramas = False
+
+# Paginación de /search
+BUSQUEDA_POR_PAGINA = 50
+BUSQUEDA_MAX_POR_PAGINA = 500
+# Filas que /search?stream=1 lee con cada conexión prestada del pool
+BUSQUEDA_BLOQUE_STREAM = 100
+
+
+def consulta_busqueda(query, despues=0, limite=-1):
+    """
+    Devuelve (sql, parámetros) para buscar `query` dentro de los nombres de
+    usuario, a partir del id `despues` y con hasta `limite` filas (-1 = sin
+    límite). El índice solo sirve si el texto tiene al menos 3 caracteres
+    seguidos sin comodines; con menos se recorre la tabla.
+    """
+    patron = f'%{query}%'
+    if indice_trigramas and re.search(r'[^%_]{3}', query):
+        return SQL_BUSQUEDA_INDICE, (patron, patron, despues, limite)
+    return SQL_BUSQUEDA_TABLA, (patron, despues, limite)
+
+
+def codificar_cursor(ultimo_id):
+    return base64.urlsafe_b64encode(str(ultimo_id).encode()).decode().rstrip('=')
+
+
+def decodificar_cursor(token):
+    """
+    Id desde el que continúa la búsqueda (ValueError si el token no es válido)
+    """
+    if not token:
+        return 0
+    relleno = '=' * (-len(token) % 4)
+    return int(base64.urlsafe_b64decode(token + relleno).decode())
+
+
+def transmitir_busqueda(query, despues, limite):
+    """
+    Genera la respuesta de /search?stream=1 con hasta `limite` filas. Se leen
+    en bloques paginados por clave y la conexión vuelve al pool entre un
+    bloque y otro, así un cliente lento no retiene una conexión durante toda
+    la respuesta.
+    """
+    yield "<h2>Resultados:</h2><pre>"
+    restantes = limite
+    siguiente = ''
+    try:
+        while True:
+            # Con una fila de más que las que faltan se sabe si hay página siguiente
+            pedir = min(BUSQUEDA_BLOQUE_STREAM, restantes + 1)
+            sql, parametros = consulta_busqueda(query, despues, pedir)
+            with get_db() as conn:
+                filas = conn.execute(sql, parametros).fetchall()
+            enviar = filas[:restantes]
+            if enviar:
+                restantes -= len(enviar)
+                despues = enviar[-1][0]
+                yield ''.join(f"{escape(str(fila))}\n" for fila in enviar)
+            if len(filas) < pedir:
+                break
+            if len(filas) > len(enviar):
+                enlace = '/search?' + urlencode({'q': query, 'limite': limite, 'stream': 1,
+                                                 'despues': codificar_cursor(despues)})
+                siguiente = f"<a href='{escape(enlace)}'>Página siguiente</a><br>"
+                break
+    except Exception as e:
+        yield f"</pre><h2>Error:</h2><pre>{escape(str(e))}"
+    yield f"</pre>{siguiente}<br><a href='/'>Volver</a>"
+
+
+def pagina_busqueda(query, despues, limite):
+    """
+    HTML de una página de resultados de /search
+    """
+    # Uso de consultas parametrizadas (prepared statements), sobre el
+    # índice de trigramas cuando el texto buscado lo permite. Se pide una
+    # fila de más para saber si hay página siguiente
+    sql, parametros = consulta_busqueda(query, despues, limite + 1)
+    # Cada petición usa su propia conexión del pool
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute(sql, parametros)
+        results = cursor.fetchall()
+
+    pagina = results[:limite]
+    filas = '\n'.join(escape(str(fila)) for fila in pagina)
+    siguiente = ''
+    if len(results) > limite:
+        enlace = '/search?' + urlencode({'q': query, 'limite': limite,
+                                         'despues': codificar_cursor(pagina[-1][0])})
+        siguiente = f"<a href='{escape(enlace)}'>Página siguiente</a><br>"
+    return f"<h2>Resultados:</h2><pre>{filas}</pre>{siguiente}<br><a href='/'>Volver</a>"
+
+
+def crear_indice_busqueda(cursor):
+    """
+    Crea el índice de trigramas de users.username y los triggers que lo
+    mantienen al insertar, actualizar o borrar usuarios
+    """
+    global indice_trigramas
+    existia = cursor.execute(
+        "SELECT 1 FROM sqlite_master WHERE name = 'users_fts'").fetchone()
+    try:
+        cursor.execute('''
+            CREATE VIRTUAL TABLE IF NOT EXISTS users_fts USING fts5(
+                username, content='users', content_rowid='id', tokenize='trigram'
+            )
+        ''')
+    except sqlite3.OperationalError as e:
+        # SQLite sin FTS5 o anterior a 3.34 (sin tokenizador trigram)
+        app.logger.warning(f"Búsqueda sin índice de trigramas: {e}")
+        return
+
+    cursor.executescript('''
+        CREATE TRIGGER IF NOT EXISTS users_fts_insert AFTER INSERT ON users BEGIN
+            INSERT INTO users_fts (rowid, username) VALUES (new.id, new.username);
+        END;
+        CREATE TRIGGER IF NOT EXISTS users_fts_delete AFTER DELETE ON users BEGIN
+            INSERT INTO users_fts (users_fts, rowid, username)
+            VALUES ('delete', old.id, old.username);
+        END;
+        CREATE TRIGGER IF NOT EXISTS users_fts_update AFTER UPDATE OF username ON users BEGIN
+            INSERT INTO users_fts (users_fts, rowid, username)
+            VALUES ('delete', old.id, old.username);
+            INSERT INTO users_fts (rowid, username) VALUES (new.id, new.username);
+        END;
     ''')
-    cursor.execute(
-        "INSERT INTO users VALUES (1, 'admin', 'password123', 'admin@example.com')")
-    cursor.execute(
-        "INSERT INTO users VALUES (2, 'user', 'user123', 'user@example.com')")
-    conn.commit()
-    return conn
+    if not existia:
+        # Indexar los usuarios que ya estaban en una base de datos en archivo
+        cursor.execute("INSERT INTO users_fts (users_fts) VALUES ('rebuild')")
+    indice_trigramas = True
+
+
+EXECUTE_MAX_PROCESOS = int(os.environ.get('EXECUTE_MAX_PROCESOS', '2'))
+EXECUTE_TIMEOUT = 5
+
 
+def salida_date():
+    # Mismo formato que `date` con la configuración regional C; el día se
+    # rellena con un espacio a mano porque %e no existe en todas las plataformas
+    ahora = time.localtime()
+    return time.strftime(f'%a %b {ahora.tm_mday:2d} %H:%M:%S %Z %Y\n', ahora)
 
-conn = init_db()
+
+def salida_whoami():
+    import pwd as usuarios
+    # Usuario efectivo, como whoami (getpass mira antes $USER y $LOGNAME)
+    return usuarios.getpwuid(os.geteuid()).pw_name + '\n'
+
+
+def salida_pwd():
+    return os.getcwd() + '\n'
+
+
+class Comando:
+    """
+    Entrada del registro de /execute.
+
+    Si hay `implementacion` la salida se calcula dentro del proceso; si no
+    existe o lanza uno de los `errores` previstos (por ejemplo ImportError
+    sin el módulo pwd) se ejecuta `argv` como subproceso. Las salidas se guardan `ttl` segundos y las
+    peticiones simultáneas del mismo comando comparten una sola ejecución.
+    """
+
+    def __init__(self, argv, implementacion=None, ttl=0.0, errores=()):
+        self.argv = argv
+        self.implementacion = implementacion
+        self.errores = errores
+        self.cache = CacheResultados(1, ttl)
+
+    def salida(self):
+        return self.cache.obtener(self.argv[0], self._calcular)
+
+    def _calcular(self):
+        if self.implementacion is not None:
+            try:
+                return self.implementacion()
+            except self.errores:
+                pass
+        return procesos_comandos.ejecutar(self.argv)
+
+
+class SemaforoComandos:
+    """
+    Limita cuántos comandos externos se ejecutan a la vez. Las peticiones
+    que no consiguen turno en `timeout` segundos se rechazan en lugar de
+    acumular procesos.
+    """
+
+    def __init__(self, max_procesos=2, timeout=5.0):
+        self.max_procesos = max_procesos
+        self.timeout = timeout
+        self._turnos = threading.BoundedSemaphore(max_procesos)
+        self._lock = threading.Lock()
+        self.ejecutados = 0
+        self.rechazados = 0
+
+    def ejecutar(self, argv):
+        if not self._turnos.acquire(timeout=self.timeout):
+            with self._lock:
+                self.rechazados += 1
+            raise TimeoutError('Demasiados comandos en ejecución')
+        try:
+            with self._lock:
+                self.ejecutados += 1
+            # Uso de lista en lugar de shell=True
+            return subprocess.check_output(argv, shell=False,
+                                           stderr=subprocess.STDOUT,
+                                           timeout=EXECUTE_TIMEOUT).decode()
+        finally:
+            self._turnos.release()
+
+    def metricas(self):
+        with self._lock:
+            return {
+                'max_procesos': self.max_procesos,
+                'ejecutados': self.ejecutados,
+                'rechazados': self.rechazados,
+            }
+
+
+procesos_comandos = SemaforoComandos(EXECUTE_MAX_PROCESOS, EXECUTE_TIMEOUT)
+
+# Whitelist de comandos permitidos: el usuario no cambia mientras el
+# servidor está en marcha; la fecha y el directorio se calculan cada vez
+COMANDOS_PERMITIDOS = {
+    'date': Comando(['date'], salida_date),
+    'whoami': Comando(['whoami'], salida_whoami, ttl=3600,
+                      errores=(ImportError, KeyError)),
+    'pwd': Comando(['pwd'], salida_pwd, errores=(FileNotFoundError,)),
+}
+
+
+class CachePlantillas:
+    """
+    Plantillas Jinja compiladas una sola vez y reutilizadas entre peticiones.
+
+    render_template_string vuelve a parsear y compilar la plantilla en cada
+    llamada; aquí se compila la primera vez que se usa cada fuente y se
+    guarda en una LRU de como mucho `max_entradas` plantillas. Los valores
+    del usuario van siempre en el contexto, nunca en la fuente.
+    """
+
+    def __init__(self, max_entradas=64):
+        self.max_entradas = max_entradas
+        self._plantillas = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self.compilaciones = 0
+        self.desalojos = 0
+
+    def obtener(self, fuente):
+        with self._lock:
+            plantilla = self._plantillas.get(fuente)
+            if plantilla is not None:
+                self._plantillas.move_to_end(fuente)
+                return plantilla
+        # Compilar fuera del lock; si dos hilos compilan la misma fuente a la
+        # vez se queda la primera y la otra se descarta
+        plantilla = app.jinja_env.from_string(fuente)
+        with self._lock:
+            self.compilaciones += 1
+            plantilla = self._plantillas.setdefault(fuente, plantilla)
+            while len(self._plantillas) > self.max_entradas:
+                self._plantillas.popitem(last=False)
+                self.desalojos += 1
+        return plantilla
+
+    def renderizar(self, fuente, **contexto):
+        # Mismo contexto que render_template_string (request, session, g...)
+        app.update_template_context(contexto)
+        return self.obtener(fuente).render(contexto)
+
+    def metricas(self):
+        with self._lock:
+            return {
+                'plantillas': len(self._plantillas),
+                'max_entradas': self.max_entradas,
+                'compilaciones': self.compilaciones,
+                'desalojos': self.desalojos,
+            }
+
+
+plantillas = CachePlantillas(int(os.environ.get('TEMPLATE_CACHE_SIZE', '64')))
+
+PLANTILLA_SALUDO = "<html><body><h2>Hola {{ name }}!</h2><br><a href='/'>Volver</a></body></html>"
+
+
+# Límites de /yaml: tamaño de la entrada, anidamiento, referencias a anclas,
+# nodos totales contando cada alias con el tamaño de lo que referencia, y
+# documentos por petición
+YAML_MAX_BYTES = int(os.environ.get('YAML_MAX_BYTES', str(256 * 1024)))
+YAML_MAX_PROFUNDIDAD = int(os.environ.get('YAML_MAX_PROFUNDIDAD', '64'))
+YAML_MAX_ALIAS = int(os.environ.get('YAML_MAX_ALIAS', '100'))
+YAML_MAX_NODOS = int(os.environ.get('YAML_MAX_NODOS', '100000'))
+YAML_MAX_DOCUMENTOS = int(os.environ.get('YAML_MAX_DOCUMENTOS', '100'))
+
+
+class _ComposerLimitado(yaml.composer.Composer):
+    """
+    Composer de PyYAML que corta el documento en cuanto supera los límites
+    YAML_MAX_*, antes de construir ningún objeto Python
+    """
+    nodos = 0
+    alias = 0
+    profundidad = 0
+    profundidad_max = 0
+
+    def compose_document(self):
+        # Tamaño expandido de cada ancla del documento actual
+        self._tamanos = {}
+        return super().compose_document()
+
+    def compose_node(self, parent, index):
+        evento = self.peek_event()
+        if isinstance(evento, yaml.AliasEvent):
+            self.alias += 1
+            if self.alias > YAML_MAX_ALIAS:
+                raise ValueError(f'El YAML usa más de {YAML_MAX_ALIAS} alias')
+            if evento.anchor in self.anchors and evento.anchor not in self._tamanos:
+                raise ValueError('Alias recursivo no permitido')
+            self._contar(self._tamanos.get(evento.anchor, 0))
+            return super().compose_node(parent, index)
+
+        self.profundidad += 1
+        if self.profundidad > YAML_MAX_PROFUNDIDAD:
+            raise ValueError(f'El YAML supera {YAML_MAX_PROFUNDIDAD} niveles de anidamiento')
+        self.profundidad_max = max(self.profundidad_max, self.profundidad)
+        inicio = self.nodos
+        self._contar(1)
+        nodo = super().compose_node(parent, index)
+        self.profundidad -= 1
+        if evento.anchor is not None:
+            self._tamanos[evento.anchor] = self.nodos - inicio
+        return nodo
+
+    def _contar(self, nodos):
+        self.nodos += nodos
+        if self.nodos > YAML_MAX_NODOS:
+            raise ValueError(f'El YAML tiene más de {YAML_MAX_NODOS} nodos')
+
+
+if yaml.__with_libyaml__:
+    class CargadorYAML(_ComposerLimitado, yaml.cyaml.CParser,
+                       yaml.constructor.SafeConstructor, yaml.resolver.Resolver):
+        """
+        Equivalente a CSafeLoader: parser de libyaml y constructor seguro. El
+        composer es el de Python para poder aplicar los límites; el de C es
+        recursivo y revienta la pila con unos 100.000 niveles de anidamiento.
+        """
+
+        def __init__(self, stream):
+            yaml.cyaml.CParser.__init__(self, stream)
+            _ComposerLimitado.__init__(self)
+            yaml.constructor.SafeConstructor.__init__(self)
+            yaml.resolver.Resolver.__init__(self)
+else:
+    class CargadorYAML(_ComposerLimitado, yaml.SafeLoader):
+        """
+        SafeLoader en Python puro (PyYAML instalado sin libyaml) con límites
+        """
+
+
+def cargar_documentos_yaml(texto, metricas):
+    """
+    Como yaml.safe_load_all: devuelve los documentos de uno en uno a medida
+    que se parsean, aplicando los límites YAML_MAX_*. Deja en `metricas` el
+    tiempo de parseo y los contadores del cargador.
+    """
+    if len(texto.encode('utf-8')) > YAML_MAX_BYTES:
+        raise ValueError(f'El YAML supera el máximo de {YAML_MAX_BYTES} bytes')
+    metricas.update(parser='libyaml' if yaml.__with_libyaml__ else 'python',
+                    documentos=0, segundos=0.0)
+    cargador = CargadorYAML(texto)
+    try:
+        while True:
+            inicio = time.perf_counter()
+            try:
+                if not cargador.check_data():
+                    break
+                if metricas['documentos'] >= YAML_MAX_DOCUMENTOS:
+                    raise ValueError(f'El YAML tiene más de {YAML_MAX_DOCUMENTOS} documentos')
+                documento = cargador.get_data()
+            finally:
+                metricas['segundos'] += time.perf_counter() - inicio
+                metricas.update(nodos=cargador.nodos, alias=cargador.alias,
+                                profundidad=cargador.profundidad_max)
+            metricas['documentos'] += 1
+            yield documento
+    finally:
+        cargador.dispose()
+
+
+init_db()
 
 
 @app.route('/')
@@ -78,13 +724,24 @@ def index():
 def search():
     query = request.args.get('q', '')
     if query:
-        cursor = conn.cursor()
-        # Uso de consultas parametrizadas (prepared statements)
-        sql = "SELECT * FROM users WHERE username LIKE ?"
+        # Paginación por clave: el cursor es el último id de la página anterior
+        try:
+            despues = decodificar_cursor(request.args.get('despues', ''))
+        except ValueError:
+            return f"<h2>Error:</h2><pre>Cursor de paginación inválido</pre><br><a href='/'>Volver</a>"
+        limite = request.args.get('limite', BUSQUEDA_POR_PAGINA, type=int)
+        limite = max(1, min(limite, BUSQUEDA_MAX_POR_PAGINA))
+
+        if request.args.get('stream'):
+            # La página se envía a medida que se leen los bloques
+            return app.response_class(
+                stream_with_context(transmitir_busqueda(query, despues, limite)),
+                mimetype='text/html')
+
         try:
-            cursor.execute(sql, (f'%{query}%',))
-            results = cursor.fetchall()
-            return f"<h2>Resultados:</h2><pre>{escape(str(results))}</pre><br><a href='/'>Volver</a>"
+            # Las búsquedas repetidas se sirven desde la cache sin consultar la base
+            return cache_busqueda.obtener(
+                (query, despues, limite), lambda: pagina_busqueda(query, despues, limite))
         except Exception as e:
             return f"<h2>Error:</h2><pre>{escape(str(e))}</pre><br><a href='/'>Volver</a>"
 
@@ -108,23 +765,10 @@ def search():
 def execute():
     cmd = request.args.get('cmd', '')
     if cmd:
-        # Whitelist de comandos permitidos
-        allowed_commands = {
-            'date': ['date'],
-            'whoami': ['whoami'],
-            'pwd': ['pwd']
-        }
-
-        if cmd in allowed_commands:
+        if cmd in COMANDOS_PERMITIDOS:
             try:
-                # Uso de lista en lugar de shell=True
-                output = subprocess.check_output(
-                    allowed_commands[cmd],
-                    shell=False,
-                    stderr=subprocess.STDOUT,
-                    timeout=5
-                )
-                return f"<h2>Resultado:</h2><pre>{escape(output.decode())}</pre><br><a href='/'>Volver</a>"
+                output = COMANDOS_PERMITIDOS[cmd].salida()
+                return f"<h2>Resultado:</h2><pre>{escape(output)}</pre><br><a href='/'>Volver</a>"
             except Exception as e:
                 return f"<h2>Error:</h2><pre>{escape(str(e))}</pre><br><a href='/'>Volver</a>"
         else:
@@ -181,10 +825,9 @@ def upload():
 @app.route('/template')
 def template():
     name = request.args.get('name', 'Visitante')
-    # Uso de escape para prevenir SSTI
-    safe_name = escape(name)
-    template = f"<html><body><h2>Hola {safe_name}!</h2><br><a href='/'>Volver</a></body></html>"
-    return render_template_string(template)
+    # El nombre se pasa como contexto, nunca forma parte de la plantilla, y
+    # el autoescape de Jinja lo escapa al renderizar
+    return plantillas.renderizar(PLANTILLA_SALUDO, name=name)
 
 # CORRECCIÓN 7: YAML con SafeLoader
 
@@ -194,12 +837,20 @@ def yaml_parser():
     if request.method == 'POST':
         yaml_data = request.form.get('yaml', '')
         if yaml_data:
+            medidas = {}
             try:
-                # Uso de SafeLoader en lugar de Loader
-                data = yaml.safe_load(yaml_data)
-                return f"<h2>Datos parseados:</h2><pre>{escape(str(data))}</pre><br><a href='/'>Volver</a>"
+                # Cargador seguro (sin Loader) y con límites; cada documento se
+                # convierte a texto en cuanto se parsea
+                bloques = [f"<pre>{escape(str(data))}</pre>"
+                           for data in cargar_documentos_yaml(yaml_data, medidas)]
             except Exception as e:
                 return f"<h2>Error:</h2><pre>{escape(str(e))}</pre><br><a href='/'>Volver</a>"
+            milisegundos = medidas['segundos'] * 1000
+            resumen = (f"<p>{medidas['documentos']} documento(s), {medidas['nodos']} nodos, "
+                       f"{medidas['alias']} alias, profundidad {medidas['profundidad']}, "
+                       f"{milisegundos:.2f} ms con {medidas['parser']}</p>")
+            html = f"<h2>Datos parseados:</h2>{''.join(bloques)}{resumen}<br><a href='/'>Volver</a>"
+            return html, 200, {'Server-Timing': f'yaml;dur={milisegundos:.3f}'}
 
     return '''
     <html>
@@ -214,6 +865,19 @@ def yaml_parser():
     </html>
     '''
 
+
+@app.route('/metricas')
+def metricas():
+    # Estado del pool de conexiones para monitoreo
+    return {
+        'pool_db': pool.metricas(),
+        'cache_busqueda': cache_busqueda.metricas(),
+        'comandos': {nombre: comando.cache.metricas()
+                     for nombre, comando in COMANDOS_PERMITIDOS.items()},
+        'procesos_comandos': procesos_comandos.metricas(),
+        'plantillas': plantillas.metricas(),
+    }
+
 # CORRECCIÓN 8: Uso de validación apropiada en lugar de assert
 
 
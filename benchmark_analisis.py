@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+"""
+Benchmark del Análisis de Seguridad - Escenario 4
+Genera corpus sintéticos de código Python con los patrones de
+app_vulnerable.py y mide cuánto tarda cada fase de AnalizadorSeguridad
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+from analisis_seguridad import (AnalizadorSeguridad, Instrumentacion,
+                                combinar_reportes, descubrir_archivos,
+                                version_bandit)
+
+# Fragmentos vulnerables basados en app_vulnerable.py; {n} evita que todos
+# los fragmentos de un archivo sean idénticos
+PATRONES_VULNERABLES = [
+    [
+        "def buscar_{n}(cursor, query):",
+        "    sql = f\"SELECT * FROM users WHERE username LIKE '%{{query}}%'\"",
+        "    cursor.execute(sql)",
+        "    return cursor.fetchall()",
+    ],
+    [
+        "def ejecutar_{n}(cmd):",
+        "    return subprocess.check_output(cmd, shell=True, stderr=subprocess.STDOUT)",
+    ],
+    [
+        "def deserializar_{n}(data):",
+        "    return pickle.loads(bytes.fromhex(data))",
+    ],
+    [
+        "def parsear_{n}(yaml_data):",
+        "    return yaml.load(yaml_data, Loader=yaml.Loader)",
+    ],
+    [
+        "DATABASE_PASSWORD_{n} = 'admin123'",
+    ],
+    [
+        "def validar_{n}(username):",
+        "    assert username != '', 'Username cannot be empty'",
+        "    return True",
+    ],
+    [
+        "def depurar_{n}():",
+        "    try:",
+        "        return 1 / 0",
+        "    except:",
+        "        pass",
+    ],
+    [
+        "def plantilla_{n}(name):",
+        "    template = f\"<html><body><h2>Hola {{name}}!</h2></body></html>\"",
+        "    return render_template_string(template)",
+    ],
+]
+
+PATRON_BENIGNO = [
+    "def calcular_{n}(valores):",
+    "    total = 0",
+    "    for valor in valores:",
+    "        total += valor * {n}",
+    "    return total",
+]
+
+CABECERA = [
+    "import pickle",
+    "import subprocess",
+    "import yaml",
+    "from flask import render_template_string",
+    "",
+]
+
+
+def generar_archivo(loc, densidad, aleatorio):
+    """
+    Devuelve el código de un archivo con unas `loc` líneas, donde
+    aproximadamente `densidad` de cada 100 líneas pertenecen a un
+    fragmento vulnerable
+    """
+    lineas = list(CABECERA)
+    n = 0
+    # Un fragmento benigno ocupa 6 líneas, así que en 100 líneas caben unos
+    # 16 fragmentos: la probabilidad de elegir uno vulnerable es densidad * 6 %
+    while len(lineas) < loc:
+        n += 1
+        if aleatorio.random() * 100 < densidad * 6:
+            patron = aleatorio.choice(PATRONES_VULNERABLES)
+        else:
+            patron = PATRON_BENIGNO
+        lineas.extend(linea.format(n=n) for linea in patron)
+        lineas.append('')
+    return '\n'.join(lineas) + '\n'
+
+
+def generar_corpus(directorio, archivos, loc, densidad, semilla):
+    """
+    Escribe el corpus en `directorio` repartido en subpaquetes y devuelve
+    sus estadísticas
+    """
+    aleatorio = random.Random(semilla)
+    total_bytes = 0
+    total_loc = 0
+    for i in range(archivos):
+        paquete = os.path.join(directorio, f'paquete_{i // 50:03d}')
+        os.makedirs(paquete, exist_ok=True)
+        # Tamaños variados para que el orden por tamaño tenga efecto
+        lineas = max(10, int(loc * aleatorio.uniform(0.25, 1.75)))
+        codigo = generar_archivo(lineas, densidad, aleatorio)
+        with open(os.path.join(paquete, f'modulo_{i:05d}.py'), 'w',
+                  encoding='utf-8') as f:
+            f.write(codigo)
+        total_bytes += len(codigo.encode('utf-8'))
+        total_loc += codigo.count('\n')
+    return {'archivos': archivos, 'loc': total_loc, 'bytes': total_bytes}
+
+
+@contextlib.contextmanager
+def medir(fases, nombre):
+    """
+    Registra el tiempo de pared y de CPU de una fase
+    """
+    inicio = time.perf_counter()
+    inicio_cpu = time.process_time()
+    yield
+    fases[nombre] = {
+        'segundos': round(time.perf_counter() - inicio, 6),
+        'cpu_segundos': round(time.process_time() - inicio_cpu, 6),
+    }
+
+
+def ejecutar_benchmark(args):
+    directorio = tempfile.mkdtemp(prefix='benchmark_seguridad_')
+    fases = {}
+    try:
+        corpus = generar_corpus(directorio, args.archivos, args.loc,
+                                args.densidad, args.semilla)
+        instrumentacion = Instrumentacion()
+        analizador = AnalizadorSeguridad(workers=args.workers, motor=args.motor,
+                                         instrumentacion=instrumentacion)
+        silencio = io.StringIO()
+
+        with medir(fases, 'descubrimiento'):
+            archivos = list(descubrir_archivos([directorio]))
+
+        # Se mide el mismo punto de entrada que usa la CLI: reparto en el
+        # pool, ejecución de Bandit, carga de reportes y resumen por archivo
+        with medir(fases, 'analisis'), contextlib.redirect_stdout(silencio):
+            reportes = analizador.analizar_archivos(archivos)
+        # Y cada una de sus fases por separado (subproceso o ast_y_tests,
+        # carga_json, resumen...), sumadas sobre todos los archivos
+        for nombre, (duracion, cpu, veces) in instrumentacion.totales().items():
+            fases[f'analisis.{nombre}'] = {'segundos': round(duracion, 6),
+                                           'cpu_segundos': round(cpu, 6),
+                                           'veces': veces}
+
+        fallidos = [archivo for archivo, reporte in reportes.items() if reporte is None]
+        if fallidos:
+            print(f"❌ Error: Bandit falló en {len(fallidos)} archivo(s)",
+                  file=sys.stderr)
+            print(silencio.getvalue(), file=sys.stderr)
+            sys.exit(1)
+
+        # Se compara el corpus completo contra una versión "corregida" que
+        # pierde la mitad de los hallazgos
+        combinado = combinar_reportes(reportes.values())
+        corregido = dict(combinado, results=combinado['results'][::2])
+        with medir(fases, 'comparar_resultados'), contextlib.redirect_stdout(silencio):
+            analizador.comparar_reportes(combinado, corregido, 'corpus', 'corregido')
+
+        with medir(fases, 'reporte_html'), contextlib.redirect_stdout(silencio):
+            analizador.generar_reporte_html_multi(
+                reportes, os.path.join(directorio, 'reporte_html'))
+
+        hallazgos = len(combinado['results'])
+    finally:
+        shutil.rmtree(directorio, ignore_errors=True)
+
+    for medida in fases.values():
+        segundos = max(medida['segundos'], 1e-9)
+        medida['archivos_por_segundo'] = round(corpus['archivos'] / segundos, 2)
+        medida['loc_por_segundo'] = round(corpus['loc'] / segundos, 1)
+
+    return {
+        'fecha': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'plataforma': platform.platform(),
+        'bandit': version_bandit(),
+        'parametros': {
+            'archivos': args.archivos,
+            'loc': args.loc,
+            'densidad': args.densidad,
+            'workers': analizador.workers,
+            'motor': args.motor,
+            'semilla': args.semilla,
+        },
+        'corpus': corpus,
+        'hallazgos': hallazgos,
+        'fases': fases,
+        # Las fases 'analisis.*' ya están dentro de 'analisis'
+        'total_segundos': round(sum(m['segundos'] for nombre, m in fases.items()
+                                    if '.' not in nombre), 6),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Benchmark del análisis de seguridad con corpus sintéticos')
+    parser.add_argument('--archivos', type=int, default=50,
+                        help='número de archivos del corpus')
+    parser.add_argument('--loc', type=int, default=200,
+                        help='líneas de código promedio por archivo')
+    parser.add_argument('--densidad', type=float, default=5,
+                        help='hallazgos aproximados por cada 100 líneas')
+    parser.add_argument('-j', '--workers', type=int, default=1,
+                        help='procesos para ejecutar Bandit (0 = uno por CPU)')
+    parser.add_argument('--motor', choices=('subproceso', 'inproceso'),
+                        default='subproceso', help='motor de Bandit a medir')
+    parser.add_argument('--semilla', type=int, default=4,
+                        help='semilla para generar el mismo corpus entre versiones')
+    parser.add_argument('-o', '--salida', metavar='RUTA',
+                        help='escribir el resultado JSON en RUTA en lugar de stdout')
+    args = parser.parse_args()
+
+    resultado = ejecutar_benchmark(args)
+    texto = json.dumps(resultado, indent=2, ensure_ascii=False)
+    if args.salida:
+        with open(args.salida, 'w', encoding='utf-8') as f:
+            f.write(texto + '\n')
+        print(f"✅ Resultado del benchmark escrito en {args.salida}")
+    else:
+        print(texto)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+"""
+Pruebas del script de análisis de seguridad (pytest)
+"""
+import io
+import json
+import os
+
+import pytest
+
+import analisis_seguridad
+from analisis_seguridad import (AnalizadorSeguridad, HistorialEscaneos,
+                                _campos_reporte_json, _LectorJSON,
+                                descubrir_archivos)
+
+VULNERABLE = (
+    "import subprocess\n"
+    "\n"
+    "\n"
+    "def ejecutar(cmd):\n"
+    "    return subprocess.call(cmd, shell=True)\n"
+)
+
+
+def crear(ruta, contenido=''):
+    os.makedirs(os.path.dirname(ruta) or '.', exist_ok=True)
+    with open(ruta, 'w', encoding='utf-8') as f:
+        f.write(contenido)
+
+
+def test_excluir_relativo_al_objetivo(tmp_path, monkeypatch):
+    # Ejemplo del README: scan src/ --excluir "tests/*"
+    monkeypatch.chdir(tmp_path)
+    crear('src/app.py')
+    crear('src/tests/test_a.py')
+    crear('src/tests/unidad/test_b.py')
+    crear('src/paquete/tests/test_c.py')
+
+    archivos = list(descubrir_archivos(['src/'], excluir=['tests/*']))
+
+    assert sorted(archivos) == [os.path.join('src', 'app.py'),
+                                os.path.join('src', 'paquete', 'tests', 'test_c.py')]
+
+
+def test_excluir_por_componente_y_ruta(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    crear('src/app.py')
+    crear('src/tests/test_a.py')
+    crear('src/migraciones/0001.py')
+
+    assert list(descubrir_archivos(['src'], excluir=['tests'])) == [
+        os.path.join('src', 'app.py'), os.path.join('src', 'migraciones', '0001.py')]
+    assert list(descubrir_archivos(['src'], excluir=['src/migraciones/*'])) == [
+        os.path.join('src', 'app.py'), os.path.join('src', 'tests', 'test_a.py')]
+
+
+class VigilanteDosCambios:
+    """
+    Sustituto de VigilanteArchivos que informa un cambio en limpio.py, otro
+    en vulnerable.py y después detiene la vigilancia como Ctrl+C
+    """
+    mecanismo = 'prueba'
+
+    def __init__(self, archivos, debounce=0.3):
+        self.cambios = [['limpio.py'], ['vulnerable.py']]
+
+    def esperar_cambios(self):
+        if not self.cambios:
+            raise KeyboardInterrupt
+        return self.cambios.pop(0)
+
+    def cerrar(self):
+        pass
+
+
+def test_reanalisis_de_watch_es_una_foto_completa(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    crear('vulnerable.py', VULNERABLE)
+    crear('limpio.py', 'x = 1\n')
+    monkeypatch.setattr(analisis_seguridad, 'VigilanteArchivos', VigilanteDosCambios)
+    historial = HistorialEscaneos(str(tmp_path / 'historial.db'))
+    analizador = AnalizadorSeguridad(guardar_json=False, directorio_html=None,
+                                     historial=historial)
+
+    analizador.vigilar(['vulnerable.py', 'limpio.py'])
+
+    ejecuciones = historial.ejecuciones()
+    assert [fila[0] for fila in ejecuciones] == [3, 2, 1]
+    # Los reanálisis registran también los archivos que no cambiaron
+    for _, _, archivos, hallazgos, alta, _, _ in ejecuciones:
+        assert (archivos, alta) == (2, 1) and hallazgos == ejecuciones[-1][3]
+    # vulnerable.py estaba en la ejecución 2 aunque solo se reanalizó limpio.py
+    assert historial.nuevos_desde(2, 'HIGH') == []
+    assert historial.nuevos_desde(1, 'HIGH', 2) == []
+    assert historial.conteos_por_semana()[-1][2] == 1
+    historial.cerrar()
+
+
+# Los números sueltos (valores de campos de primer nivel) son los que el
+# lector decodifica de a uno y los que un relleno del buffer puede cortar
+REPORTE_CON_NUMEROS = """{
+  "errors": [], "duracion": 1e5, "escala": 1.5e10, "delta": -0.5,
+  "pequeno": 2.5E-7, "negativo": -12, "cero": 0, "exacto": 3.25,
+  "metrics": {"_totals": {"loc": 12, "SEVERITY.HIGH": 1.0, "densidad": 1e5}},
+  "results": [
+    {"test_id": "B602", "line_number": 5, "puntaje": -0.5, "peso": 1e5},
+    {"test_id": "B404", "line_number": 1, "activo": true, "extra": null}
+  ],
+  "total": 1.5e10
+}"""
+
+
+@pytest.mark.parametrize('bloque', [1, 2, 3, 7, 1 << 16])
+def test_lector_json_con_bloques_pequenos(bloque):
+    # Con bloques de pocos caracteres los números se cortan en todas sus
+    # posiciones: dentro de la fracción, del exponente y tras el signo
+    for texto in (REPORTE_CON_NUMEROS, json.dumps(json.loads(REPORTE_CON_NUMEROS))):
+        reporte = {'results': []}
+        for clave, valor in _campos_reporte_json(_LectorJSON(io.StringIO(texto), bloque)):
+            if clave == 'results':
+                reporte['results'].append(valor)
+            else:
+                reporte[clave] = valor
+        assert reporte == json.loads(texto)